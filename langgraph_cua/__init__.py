@@ -1,4 +1,37 @@
-from langgraph_cua.graph import create_cua, graph
-from langgraph_cua.types import CUAState
+from typing import TYPE_CHECKING
 
-__all__ = ["create_cua", "graph", "CUAState"]
+from langgraph_cua._lazy import lazy_attributes
+
+if TYPE_CHECKING:
+    from langgraph_cua.batch import BatchResult, BatchStats, astream_batch
+    from langgraph_cua.fanout import CUAFanOutState, create_cua_fan_out
+    from langgraph_cua.graph import create_cua, graph
+    from langgraph_cua.types import CUAAppendState, CUAState
+
+__all__ = [
+    "create_cua",
+    "graph",
+    "CUAState",
+    "CUAAppendState",
+    "astream_batch",
+    "BatchResult",
+    "BatchStats",
+    "create_cua_fan_out",
+    "CUAFanOutState",
+]
+
+# The graph imports the OpenAI and Scrapybara SDKs, so only import it once it's used.
+lazy_attributes(
+    __name__,
+    {
+        "create_cua": "langgraph_cua.graph",
+        "graph": "langgraph_cua.graph",
+        "CUAState": "langgraph_cua.types",
+        "CUAAppendState": "langgraph_cua.types",
+        "astream_batch": "langgraph_cua.batch",
+        "BatchResult": "langgraph_cua.batch",
+        "BatchStats": "langgraph_cua.batch",
+        "create_cua_fan_out": "langgraph_cua.fanout",
+        "CUAFanOutState": "langgraph_cua.fanout",
+    },
+)
@@ -0,0 +1,43 @@
+import importlib
+import sys
+import types
+from typing import Any, Dict, List
+
+
+class _LazyModule(types.ModuleType):
+    """A package whose attributes are imported from its submodules on first access."""
+
+    _lazy_attributes: Dict[str, str]
+
+    def __getattr__(self, name: str) -> Any:
+        module_name = self._lazy_attributes.get(name)
+        if module_name is None:
+            raise AttributeError(f"module {self.__name__!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(module_name), name)
+        self.__dict__[name] = value
+        return value
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        # Importing a submodule sets it as an attribute of its package. Some attributes
+        # share a name with the submodule they're defined in, e.g. the compiled `graph`,
+        # so don't let the submodule hide them.
+        if isinstance(value, types.ModuleType) and name in self._lazy_attributes:
+            return
+        super().__setattr__(name, value)
+
+    def __dir__(self) -> List[str]:
+        return sorted(set(super().__dir__()) | set(self._lazy_attributes))
+
+
+def lazy_attributes(package_name: str, attributes: Dict[str, str]) -> None:
+    """
+    Makes a package import its attributes from its submodules on first access, rather than
+    when the package is imported, so heavy dependencies are only loaded once they're used.
+
+    Args:
+        package_name: The name of the package, i.e. its `__name__`.
+        attributes: Maps the name of each attribute to the module to import it from.
+    """
+    package = sys.modules[package_name]
+    package.__dict__["_lazy_attributes"] = attributes
+    package.__class__ = _LazyModule
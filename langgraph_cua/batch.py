@@ -0,0 +1,198 @@
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Union
+
+from langchain_core.rate_limiters import BaseRateLimiter, InMemoryRateLimiter
+from langchain_core.runnables import Runnable, RunnableConfig
+
+
+@dataclass
+class BatchResult:
+    """
+    The result of one task in a batch.
+
+    Attributes:
+        index: The position of the task's input in the batch.
+        input: The input the task was run with.
+        output: The final state of the task, or None if it failed.
+        error: The exception the task failed with, or None if it succeeded.
+        latency_seconds: How long the task took, from start to finish.
+    """
+
+    index: int
+    input: Any
+    output: Optional[Dict[str, Any]]
+    error: Optional[BaseException]
+    latency_seconds: float
+
+
+class BatchStats:
+    """Throughput and latency statistics for a batch, updated as tasks complete."""
+
+    def __init__(self) -> None:
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.completed = 0
+        self.failed = 0
+        self._latencies: List[float] = []
+
+    def record(self, result: BatchResult) -> None:
+        """
+        Records a completed task.
+
+        Args:
+            result: The result of the task.
+        """
+        self.finished_at = time.perf_counter()
+        self._latencies.append(result.latency_seconds)
+        if result.error is None:
+            self.completed += 1
+        else:
+            self.failed += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Gets a percentile of the task latencies, in seconds.
+
+        Args:
+            p: The percentile, between 0 and 100.
+
+        Returns:
+            The latency, or None if no tasks have finished.
+        """
+        if not self._latencies:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarizes the batch.
+
+        Returns:
+            The number of completed and failed tasks, the elapsed time in seconds, the
+            throughput in tasks per second, and the p50, p95, and p99 task latencies.
+        """
+        elapsed = (
+            self.finished_at - self.started_at
+            if self.started_at is not None and self.finished_at is not None
+            else 0.0
+        )
+        finished = self.completed + self.failed
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "elapsed_seconds": elapsed,
+            "throughput": finished / elapsed if elapsed > 0 else 0.0,
+            "p50_seconds": self.percentile(50),
+            "p95_seconds": self.percentile(95),
+            "p99_seconds": self.percentile(99),
+        }
+
+
+def _as_rate_limiter(
+    rate_limit: Union[float, BaseRateLimiter, None],
+) -> Optional[BaseRateLimiter]:
+    if rate_limit is None or isinstance(rate_limit, BaseRateLimiter):
+        return rate_limit
+    # Allow up to a second's worth of requests in a burst, so the limit holds on average
+    # without serializing requests which arrive together.
+    return InMemoryRateLimiter(
+        requests_per_second=rate_limit,
+        check_every_n_seconds=min(0.1, 1 / rate_limit),
+        max_bucket_size=max(1.0, rate_limit),
+    )
+
+
+async def astream_batch(
+    graph: Runnable,
+    inputs: Iterable[Any],
+    *,
+    max_concurrency: int = 8,
+    model_rate_limit: Union[float, BaseRateLimiter, None] = None,
+    scrapybara_rate_limit: Union[float, BaseRateLimiter, None] = None,
+    config: Optional[RunnableConfig] = None,
+    stats: Optional[BatchStats] = None,
+) -> AsyncIterator[BatchResult]:
+    """
+    Runs the computer use agent over many independent inputs, at most `max_concurrency` at a
+    time, and yields each result as soon as it completes. Inputs are read lazily, so the
+    iterable can be a generator over a large number of tasks.
+
+    Requests to the model and to Scrapybara are rate limited across every task in the batch,
+    so throughput levels off at the rate limits, instead of degrading through rate limit
+    errors. Each task runs in its own thread.
+
+    ```python
+    stats = BatchStats()
+    async for result in astream_batch(create_cua(), inputs, max_concurrency=32, stats=stats):
+        ...
+    print(stats.summary())
+    ```
+
+    Args:
+        graph: The graph to run, e.g. as returned by `create_cua`.
+        inputs: The input for each task.
+        max_concurrency: The maximum number of tasks to run at once.
+        model_rate_limit: The maximum number of model requests per second, or a rate limiter to
+            share with other batches.
+        scrapybara_rate_limit: The maximum number of Scrapybara requests per second, or a rate
+            limiter to share with other batches.
+        config: The configuration to run every task with.
+        stats: Statistics to update as tasks complete.
+
+    Yields:
+        The result of each task, in the order they complete.
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+
+    config = config or {}
+    configurable = {**config.get("configurable", {})}
+    model_rate_limiter = _as_rate_limiter(model_rate_limit)
+    scrapybara_rate_limiter = _as_rate_limiter(scrapybara_rate_limit)
+    if model_rate_limiter is not None:
+        configurable["model_rate_limiter"] = model_rate_limiter
+    if scrapybara_rate_limiter is not None:
+        configurable["scrapybara_rate_limiter"] = scrapybara_rate_limiter
+
+    stats = stats if stats is not None else BatchStats()
+    stats.started_at = time.perf_counter()
+
+    async def run(index: int, task_input: Any) -> BatchResult:
+        task_config = {
+            **config,
+            "configurable": {**configurable, "thread_id": str(uuid.uuid4())},
+        }
+        start = time.perf_counter()
+        try:
+            output = await graph.ainvoke(task_input, task_config)
+            error = None
+        except Exception as e:
+            output, error = None, e
+        return BatchResult(index, task_input, output, error, time.perf_counter() - start)
+
+    iterator = enumerate(inputs)
+    pending: Set[asyncio.Task] = set()
+    try:
+        while True:
+            # Keep the number of running tasks at the limit, until the inputs run out.
+            for index, task_input in iterator:
+                pending.add(asyncio.create_task(run(index, task_input)))
+                if len(pending) >= max_concurrency:
+                    break
+            if not pending:
+                return
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                stats.record(result)
+                yield result
+    finally:
+        # If the consumer stops early, don't leave tasks running in the background.
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,225 @@
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+
+# Maps each budget in the configuration to the usage it limits, as returned by `get_usage`.
+BUDGETS = {
+    "max_input_tokens": "input_tokens",
+    "max_screenshot_bytes": "screenshot_bytes",
+    "max_run_seconds": "run_seconds",
+    "max_vm_seconds": "vm_seconds",
+}
+
+# How each budget is described in the summary written when a run is stopped.
+BUDGET_DESCRIPTIONS = {
+    "max_input_tokens": "input token",
+    "max_screenshot_bytes": "screenshot byte",
+    "max_run_seconds": "run time",
+    "max_vm_seconds": "VM time",
+}
+
+
+def count_image_bytes(messages: Sequence[Any]) -> int:
+    """
+    Counts the decoded size of the base64 encoded images in the messages, without decoding
+    them.
+
+    Args:
+        messages: The messages, as sent to the model.
+
+    Returns:
+        The total size of the images, in bytes.
+    """
+    total = 0
+    for message in messages:
+        content = getattr(message, "content", None)
+        if not isinstance(content, list):
+            continue
+        for block in content:
+            url = block.get("image_url") if isinstance(block, dict) else None
+            if isinstance(url, dict):
+                url = url.get("url")
+            if isinstance(url, str) and url.startswith("data:"):
+                total += len(url) - url.find(",") - 1
+    return total * 3 // 4
+
+
+def get_cached_tokens(usage_metadata: Dict[str, Any]) -> int:
+    """
+    Gets the number of input tokens which were read from the model provider's prompt cache.
+
+    Args:
+        usage_metadata: The usage metadata of the model's response.
+
+    Returns:
+        The number of cached input tokens.
+    """
+    details = usage_metadata.get("input_token_details") or {}
+    # Responses served with a service tier report their cached tokens under a prefixed key,
+    # e.g. "priority_cache_read".
+    return sum(value or 0 for key, value in details.items() if key.endswith("cache_read"))
+
+
+def _get_totals(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "input_tokens": state.get("input_tokens") or 0,
+        "output_tokens": state.get("output_tokens") or 0,
+        "cached_tokens": state.get("cached_tokens") or 0,
+        "screenshot_bytes": state.get("screenshot_bytes") or 0,
+        "run_seconds": state.get("run_seconds") or 0.0,
+        "vm_seconds": state.get("vm_seconds") or 0.0,
+    }
+
+
+def _round_seconds(usage: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        **usage,
+        "run_seconds": round(usage["run_seconds"], 3),
+        "vm_seconds": round(usage["vm_seconds"], 3),
+    }
+
+
+def get_thread_usage(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Gets the usage counted so far in the thread, across all of its runs.
+
+    Args:
+        state: The current state of the thread.
+
+    Returns:
+        The input, output, and cached input tokens used, the screenshot bytes sent to the
+        model, and the time spent in the agent's steps, and in steps while the thread had
+        an instance, in seconds.
+    """
+    return _round_seconds(_get_totals(state))
+
+
+def get_usage(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Gets the usage counted against each budget so far in the current run. The run time is
+    the time since the run started, rather than the time spent in the agent's steps.
+
+    Args:
+        state: The current state of the thread.
+
+    Returns:
+        The input, output, and cached input tokens used, the screenshot bytes sent to the
+        model, and the run time and VM time, in seconds.
+    """
+    totals = _get_totals(state)
+    run_start = state.get("run_start")
+    if not run_start:
+        return _round_seconds(totals)
+    usage = {key: value - (run_start.get(key) or 0) for key, value in totals.items()}
+    usage["run_seconds"] = time.time() - run_start["started_at"]
+    return _round_seconds(usage)
+
+
+def start_run(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Starts counting usage against the budgets afresh, if the thread is at the start of a
+    run, i.e. its last message is a human message the current run didn't start with. The
+    usage counted in the thread so far is recorded, to be subtracted from later totals,
+    along with the number of action retries, since the retry budget is also per run.
+
+    Args:
+        state: The current state of the thread.
+
+    Returns:
+        The update which starts the run, or an empty update if the run has already started.
+    """
+    messages = state.get("messages") or []
+    if not messages or getattr(messages[-1], "type", None) != "human":
+        return {}
+    message_id = messages[-1].id
+    run_start = state.get("run_start") or {}
+    if message_id is not None and run_start.get("message_id") == message_id:
+        return {}
+    return {
+        "run_start": {
+            **_get_totals(state),
+            "action_retries": state.get("action_retries") or 0,
+            "message_id": message_id,
+            "started_at": time.time(),
+        },
+        "budget_exceeded": None,
+    }
+
+
+def exceeded_budget(state: Dict[str, Any], configuration: Dict[str, Any]) -> Optional[str]:
+    """
+    Checks if any budget has been used up in the current run.
+
+    Args:
+        state: The current state of the thread.
+        configuration: The configuration, with defaults applied.
+
+    Returns:
+        The configuration key of the first budget which has been used up, e.g.
+        "max_input_tokens", or None if there is budget left.
+    """
+    usage: Optional[Dict[str, Any]] = None
+    for budget, counter in BUDGETS.items():
+        limit = configuration.get(budget)
+        if limit is None:
+            continue
+        if usage is None:
+            usage = get_usage(state)
+        if usage[counter] >= limit:
+            return budget
+    return None
+
+
+def track_time(
+    node: Callable[[Any, RunnableConfig], Awaitable[Dict[str, Any]]],
+) -> Callable[[Any, RunnableConfig], Awaitable[Dict[str, Any]]]:
+    """
+    Wraps a node, to add the time it takes to the run time in state. The time is also
+    added to the VM time if the thread has an instance running, including one the node
+    started. If the node is the first step of a run, the run is started, so the budgets
+    are counted from this step.
+
+    Args:
+        node: The node to wrap.
+
+    Returns:
+        The wrapped node.
+    """
+
+    async def timed(state: Any, config: RunnableConfig) -> Dict[str, Any]:
+        run_start = start_run(state)
+        if run_start:
+            # Let the node see the run's start, e.g. for its retry budget.
+            state = {**state, **run_start}
+        start = time.perf_counter()
+        update = await node(state, config)
+        elapsed = time.perf_counter() - start
+        update = {**run_start, **update, "run_seconds": elapsed}
+        if update.get("instance_id") or state.get("instance_id"):
+            update["vm_seconds"] = elapsed
+        return update
+
+    timed.__name__ = node.__name__
+    return timed
+
+
+def budget_summary(budget: str, configuration: Dict[str, Any], usage: Dict[str, Any]) -> str:
+    """
+    Describes why a run was stopped, and what it used.
+
+    Args:
+        budget: The configuration key of the budget which was used up.
+        configuration: The configuration, with defaults applied.
+        usage: The usage, as returned by `get_usage`.
+
+    Returns:
+        The summary.
+    """
+    return (
+        f"Stopped before finishing the task, because the {BUDGET_DESCRIPTIONS[budget]} budget "
+        f"of {configuration.get(budget)} was used up. The run used {usage['input_tokens']} "
+        f"input tokens, {usage['output_tokens']} output tokens, {usage['screenshot_bytes']} bytes "
+        f"of screenshots, {usage['run_seconds']:.1f}s of run time, and "
+        f"{usage['vm_seconds']:.1f}s of VM time."
+    )
@@ -0,0 +1,210 @@
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import ormsgpack
+from langchain_core.messages import BaseMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from .screenshot_store import ScreenshotStore
+
+# Images taken out of a checkpoint are replaced with a reference like
+# "checkpoint-image:image/png;<sha256 hex digest>". This is distinct from screenshot
+# references, which are part of the state, and are left as they are.
+CHECKPOINT_IMAGE_PREFIX = "checkpoint-image:"
+
+# Payloads with images are wrapped in an envelope, whose serialization type is this prefix
+# followed by the type of the wrapped payload.
+ENVELOPE_TYPE_PREFIX = "cua-"
+
+# If messages are kept in a screenshot store, lists of messages are replaced with a dict
+# holding this key, mapped to the key of each message in the store.
+MESSAGE_KEYS = "__cua_message_keys__"
+
+
+def _is_image_url(url: Any) -> bool:
+    return isinstance(url, str) and url.startswith("data:") and ";base64," in url
+
+
+def _is_image_ref(url: Any) -> bool:
+    return isinstance(url, str) and url.startswith(CHECKPOINT_IMAGE_PREFIX)
+
+
+class CheckpointSerializer(JsonPlusSerializer):
+    """
+    A checkpoint serializer for computer use agent state, which keeps screenshots out of
+    the serialized messages. Use it with any checkpointer, e.g.
+    `InMemorySaver(serde=CheckpointSerializer())` or `SqliteSaver(conn, serde=...)`.
+
+    Screenshots are stored once per checkpoint write as raw bytes, rather than as base64
+    text inside each message, which makes writes about 25% smaller. Values without
+    screenshots are serialized exactly as `JsonPlusSerializer` would, so existing
+    checkpoints can still be read.
+
+    If a screenshot store is given, screenshots are written to the store, and each
+    message is also stored there once, keyed by its content hash. A checkpoint of the
+    message history then only holds the key of each message, so the part of the history
+    which is unchanged since the last checkpoint isn't written again. The store must be
+    kept as long as the checkpoints which refer to it.
+
+    Args:
+        screenshot_store: The store to write screenshots and messages to.
+        cache_size: The number of messages to remember having serialized, so they aren't
+            processed again on the next checkpoint. Should be larger than the longest
+            message history.
+        **kwargs: Passed to `JsonPlusSerializer`.
+    """
+
+    def __init__(
+        self,
+        screenshot_store: Optional[ScreenshotStore] = None,
+        cache_size: int = 1024,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.screenshot_store = screenshot_store
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        # Maps the id of recently serialized messages to the message, the message with its
+        # images taken out, the images, and its key in the screenshot store, so each message
+        # is only processed once, rather than on every checkpoint. The message itself is
+        # kept, so its id can't be reused while it's cached.
+        self._messages: "OrderedDict[int, List[Any]]" = OrderedDict()
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        images: Dict[str, Optional[bytes]] = {}
+        value = self._externalize(obj, images)
+        if value is obj:
+            return super().dumps_typed(obj)
+        type_, data = super().dumps_typed(value)
+        return ENVELOPE_TYPE_PREFIX + type_, ormsgpack.packb([data, images])
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, data_ = data
+        if type_.startswith(ENVELOPE_TYPE_PREFIX):
+            payload, images = ormsgpack.unpackb(data_)
+            value = super().loads_typed((type_[len(ENVELOPE_TYPE_PREFIX) :], payload))
+            return self._internalize(value, images)
+        return super().loads_typed(data)
+
+    @staticmethod
+    def _is_message_list(obj: Any) -> bool:
+        return isinstance(obj, list) and bool(obj) and all(isinstance(m, BaseMessage) for m in obj)
+
+    def _get_cached(self, message: BaseMessage) -> List[Any]:
+        with self._lock:
+            cached = self._messages.get(id(message))
+            if cached is not None and cached[0] is message:
+                self._messages.move_to_end(id(message))
+                return cached
+
+        images: Dict[str, Optional[bytes]] = {}
+        content = self._externalize(message.content, images)
+        externalized = (
+            message
+            if content is message.content
+            else message.model_copy(update={"content": content})
+        )
+        cached = [message, externalized, images, None]
+        with self._lock:
+            self._messages[id(message)] = cached
+            while len(self._messages) > self.cache_size:
+                self._messages.popitem(last=False)
+        return cached
+
+    def _put_message(self, message: BaseMessage) -> str:
+        cached = self._get_cached(message)
+        if cached[3] is None:
+            _, externalized, images, _ = cached
+            type_, data = super().dumps_typed(externalized)
+            cached[3] = self.screenshot_store.put(ormsgpack.packb([type_, data, images]))
+        return cached[3]
+
+    def _get_message(self, key: str) -> BaseMessage:
+        data = self.screenshot_store.get(key)
+        if data is None:
+            raise ValueError(f"Message not found in screenshot store: {key}")
+        type_, payload, images = ormsgpack.unpackb(data)
+        return self._internalize(super().loads_typed((type_, payload)), images)
+
+    def _put_image(self, url: str, images: Dict[str, Optional[bytes]]) -> str:
+        header, _, encoded = url.partition(";base64,")
+        data = base64.b64decode(encoded)
+        if self.screenshot_store is not None:
+            key = self.screenshot_store.put(data)
+            images[key] = None
+        else:
+            key = hashlib.sha256(data).hexdigest()
+            images[key] = data
+        return f"{CHECKPOINT_IMAGE_PREFIX}{header[len('data:') :]};{key}"
+
+    def _get_image(self, ref: str, images: Dict[str, Optional[bytes]]) -> str:
+        media_type, _, key = ref[len(CHECKPOINT_IMAGE_PREFIX) :].partition(";")
+        data = images.get(key)
+        if data is None and self.screenshot_store is not None:
+            data = self.screenshot_store.get(key)
+        if data is None:
+            raise ValueError(f"Screenshot not found: {key}")
+        return f"data:{media_type};base64,{base64.b64encode(data).decode()}"
+
+    def _externalize(self, value: Any, images: Dict[str, Optional[bytes]]) -> Any:
+        """
+        Replaces every base64 image URL in the value with a reference, adding the image to
+        `images`. Only the containers which hold an image are copied.
+        """
+        if isinstance(value, BaseMessage):
+            _, externalized, message_images, _ = self._get_cached(value)
+            images.update(message_images)
+            return externalized
+        if isinstance(value, dict):
+            updated: Optional[Dict[Any, Any]] = None
+            for k, v in value.items():
+                if k == "image_url" and _is_image_url(v):
+                    new = self._put_image(v, images)
+                elif k == "image_url" and isinstance(v, dict) and _is_image_url(v.get("url")):
+                    new = {**v, "url": self._put_image(v["url"], images)}
+                else:
+                    new = self._externalize(v, images)
+                if new is not v:
+                    updated = updated if updated is not None else dict(value)
+                    updated[k] = new
+            return updated if updated is not None else value
+        if self.screenshot_store is not None and self._is_message_list(value):
+            return {MESSAGE_KEYS: [self._put_message(m) for m in value]}
+        if isinstance(value, (list, tuple)):
+            items: Optional[List[Any]] = None
+            for i, item in enumerate(value):
+                new = self._externalize(item, images)
+                if new is not item:
+                    items = items if items is not None else list(value)
+                    items[i] = new
+            if items is None:
+                return value
+            return tuple(items) if isinstance(value, tuple) else items
+        return value
+
+    def _internalize(self, value: Any, images: Dict[str, Optional[bytes]]) -> Any:
+        """
+        Reverses `_externalize`, replacing each reference with the image URL, and each list
+        of message keys with the messages. Containers are updated in place.
+        """
+        if isinstance(value, BaseMessage):
+            value.content = self._internalize(value.content, images)
+        elif isinstance(value, dict):
+            if len(value) == 1 and MESSAGE_KEYS in value:
+                return [self._get_message(key) for key in value[MESSAGE_KEYS]]
+            for k, v in value.items():
+                if k == "image_url" and _is_image_ref(v):
+                    value[k] = self._get_image(v, images)
+                elif k == "image_url" and isinstance(v, dict) and _is_image_ref(v.get("url")):
+                    v["url"] = self._get_image(v["url"], images)
+                else:
+                    value[k] = self._internalize(v, images)
+        elif isinstance(value, list):
+            for i, item in enumerate(value):
+                value[i] = self._internalize(item, images)
+        elif isinstance(value, tuple):
+            return tuple(self._internalize(item, images) for item in value)
+        return value
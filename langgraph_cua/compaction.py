@@ -0,0 +1,362 @@
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AnyMessage, HumanMessage
+
+from langgraph_cua.history import (
+    OMITTED_SCREENSHOT_URL,
+    apply_screenshot_retention,
+    get_trailing_tool_messages,
+    omit_duplicate_screenshots,
+)
+from langgraph_cua.replay import is_replayed
+
+# Rough token costs, for deciding when to compact. A 1024x768 screenshot is 765 tokens at
+# high detail, and the placeholder for a dropped screenshot is billed as a minimal image.
+SCREENSHOT_TOKENS = 765
+OMITTED_SCREENSHOT_TOKENS = 85
+CHARS_PER_TOKEN = 4
+
+# The longest text kept from each message in the log.
+MAX_LOG_TEXT_CHARS = 500
+
+# The share of 'compaction_threshold' the history log may take up in a request. Older log
+# lines are left out of the request beyond that, so requests stay bounded however long
+# the run goes on.
+LOG_SHARE = 4
+
+OMITTED_NOTE_TOKENS = 12
+
+HISTORY_LOG_HEADER = (
+    "Earlier steps, which are no longer shown, are summarized below. Screenshots from "
+    "these steps are not available."
+)
+
+
+def estimate_tokens(message: Any) -> int:
+    """
+    Estimates the input tokens a message uses, from the length of its text and the number
+    of screenshots in it.
+
+    Args:
+        message: The message, as sent to the model.
+
+    Returns:
+        The estimated number of tokens.
+    """
+    content = message.get("content") if isinstance(message, dict) else message.content
+    if isinstance(content, str):
+        return len(content) // CHARS_PER_TOKEN + 1
+    tokens = 1
+    for block in content or []:
+        if not isinstance(block, dict):
+            tokens += len(str(block)) // CHARS_PER_TOKEN
+        elif block.get("type") in ("input_image", "image_url"):
+            omitted = block.get("image_url") == OMITTED_SCREENSHOT_URL
+            tokens += OMITTED_SCREENSHOT_TOKENS if omitted else SCREENSHOT_TOKENS
+        else:
+            tokens += len(block.get("text") or "") // CHARS_PER_TOKEN
+    additional_kwargs = getattr(message, "additional_kwargs", None) or {}
+    for output in additional_kwargs.get("tool_outputs") or []:
+        tokens += len(json.dumps(output.get("action") or {})) // CHARS_PER_TOKEN
+    return tokens
+
+
+def _truncate(text: str) -> str:
+    text = " ".join(text.split())
+    if len(text) > MAX_LOG_TEXT_CHARS:
+        return text[: MAX_LOG_TEXT_CHARS - 3] + "..."
+    return text
+
+
+def describe_action(action: Dict[str, Any]) -> str:
+    """
+    Describes a computer call's action in a few words, for the history log.
+
+    Args:
+        action: The action, as returned by the model.
+
+    Returns:
+        The description, e.g. 'click left at (120, 45)'.
+    """
+    action_type = action.get("type")
+    at = f"({action.get('x')}, {action.get('y')})"
+    if action_type == "click":
+        return f"click {action.get('button', 'left')} at {at}"
+    if action_type == "double_click":
+        return f"double-click at {at}"
+    if action_type == "move":
+        return f"move to {at}"
+    if action_type == "scroll":
+        return f"scroll by ({action.get('scroll_x')}, {action.get('scroll_y')}) at {at}"
+    if action_type == "drag":
+        path = action.get("path") or [{}]
+        start, end = path[0], path[-1]
+        return f"drag from ({start.get('x')}, {start.get('y')}) to ({end.get('x')}, {end.get('y')})"
+    if action_type == "keypress":
+        return f"press {'+'.join(action.get('keys') or [])}"
+    if action_type == "type":
+        return f"type {json.dumps(_truncate(action.get('text') or ''))}"
+    if action_type == "screenshot":
+        return "take a screenshot"
+    if action_type == "wait":
+        return "wait"
+    return json.dumps(action)
+
+
+def _reasoning_summary(message: AnyMessage) -> str:
+    reasoning = message.additional_kwargs.get("reasoning") or {}
+    return " ".join(
+        summary.get("text", "")
+        for summary in reasoning.get("summary") or []
+        if isinstance(summary, dict)
+    )
+
+
+def describe_step(messages: Sequence[AnyMessage], step: int) -> str:
+    """
+    Describes one step of the history, for the history log: the model's observations,
+    the actions it took, the URL the browser ended up on, and any action which failed.
+
+    Args:
+        messages: The messages of the step. An AI message, and the tool messages paired
+            with its computer calls, or a message from the user.
+        step: The number of the step in the thread, counting from 1. Only used if the
+            step has an AI message.
+
+    Returns:
+        The log line for the step.
+    """
+    parts: List[str] = []
+    for message in messages:
+        message_type = getattr(message, "type", None)
+        if message_type == "human":
+            parts.append(f"User: {_truncate(message.text)}")
+        elif message_type == "ai":
+            observation = _truncate(
+                " ".join(filter(None, [_reasoning_summary(message), message.text]))
+            )
+            if observation:
+                parts.append(f"Observed: {observation}")
+            actions = [
+                describe_action(output.get("action") or {})
+                for output in message.additional_kwargs.get("tool_outputs") or []
+                if output.get("type") == "computer_call"
+            ]
+            if actions:
+                parts.append(f"Actions: {'; '.join(actions)}.")
+        elif message_type == "tool":
+            if message.additional_kwargs.get("current_url"):
+                parts.append(f"URL: {message.additional_kwargs['current_url']}")
+            if getattr(message, "status", None) == "error":
+                error = message.additional_kwargs.get("error") or "unknown error"
+                parts.append(f"Failed: {_truncate(error)}")
+    if any(getattr(message, "type", None) == "ai" for message in messages):
+        parts.insert(0, f"Step {step}.")
+    return " ".join(parts)
+
+
+def _task_length(messages: Sequence[AnyMessage]) -> int:
+    # The task, and anything else before the model's first response, is never compacted.
+    for i, message in enumerate(messages):
+        if getattr(message, "type", None) == "ai":
+            return i
+    return len(messages)
+
+
+def _compacted_length(messages: Sequence[AnyMessage], compacted_through: Optional[str]) -> int:
+    # The number of messages at the start of the history folded into the log.
+    if compacted_through is None:
+        return 0
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].id == compacted_through:
+            return i + 1
+    return 0
+
+
+def _split_steps(messages: Sequence[AnyMessage]) -> List[Tuple[int, int]]:
+    # Splits the messages into steps, as (start, end) index ranges. Tool messages always
+    # stay with the AI message they answer.
+    steps: List[Tuple[int, int]] = []
+    for i, message in enumerate(messages):
+        if steps and getattr(message, "type", None) == "tool":
+            steps[-1] = (steps[-1][0], i + 1)
+        else:
+            steps.append((i, i + 1))
+    return steps
+
+
+def history_log_message(
+    history_log: Sequence[str], max_tokens: Optional[int] = None
+) -> HumanMessage:
+    """
+    Builds the message which stands in for the compacted steps of the history.
+
+    Args:
+        history_log: The log lines of the compacted steps.
+        max_tokens: The most tokens the log may use. If given, only the most recent lines
+            which fit are kept, after a note of how many were left out.
+
+    Returns:
+        The message.
+    """
+    lines = list(history_log)
+    if max_tokens is not None:
+        # Leave room for the header, and the note of how many lines were left out.
+        tokens = len(HISTORY_LOG_HEADER) // CHARS_PER_TOKEN + OMITTED_NOTE_TOKENS
+        kept = 0
+        for line in reversed(lines):
+            tokens += len(line) // CHARS_PER_TOKEN + 1
+            if tokens > max_tokens:
+                break
+            kept += 1
+        if kept < len(lines):
+            lines = [
+                f"({len(lines) - kept} earlier steps are not shown.)",
+                *lines[len(lines) - kept :],
+            ]
+    return HumanMessage(content="\n".join([HISTORY_LOG_HEADER, *lines]))
+
+
+def apply_compaction(
+    messages: Sequence[AnyMessage],
+    state: Dict[str, Any],
+    compaction_threshold: Optional[int] = None,
+) -> List[AnyMessage]:
+    """
+    Replaces the compacted steps of the history with the history log, keeping the task
+    at the start.
+
+    Args:
+        messages: The messages in state.
+        state: The current state of the thread.
+        compaction_threshold: The 'compaction_threshold' the log was built with. If given,
+            the log is limited to a quarter of it.
+
+    Returns:
+        The task, the history log, and the steps which haven't been compacted.
+    """
+    history_log = state.get("history_log")
+    if not history_log:
+        return list(messages)
+    task = messages[: _task_length(messages)]
+    compacted = _compacted_length(messages, state.get("compacted_through"))
+    max_log_tokens = compaction_threshold // LOG_SHARE if compaction_threshold else None
+    log = history_log_message(history_log, max_log_tokens)
+    return [*task, log, *messages[compacted:]]
+
+
+def _prepare(messages: Sequence[AnyMessage], configuration: Dict[str, Any]) -> List[AnyMessage]:
+    # Drop screenshots the same way call_model does, so the estimate matches the request.
+    stable_prefix = configuration.get("stable_prefix")
+    messages = omit_duplicate_screenshots(messages, stable_prefix)
+    return apply_screenshot_retention(
+        messages, configuration.get("screenshot_retention"), stable_prefix
+    )
+
+
+def sends_full_history(messages: Sequence[AnyMessage], configuration: Dict[str, Any]) -> bool:
+    """
+    Checks if the next request sends the full message history, rather than only the tool
+    messages since the last response, chained from it by its ID. The full history is sent
+    in ZDR mode, at the start of a run, and after a step replayed from a recorded
+    trajectory, which has no response to chain from. Only then is compaction needed.
+
+    Args:
+        messages: The messages in state.
+        configuration: The configuration, with defaults applied.
+
+    Returns:
+        True if the full history is sent, false otherwise.
+    """
+    trailing_tool_messages = get_trailing_tool_messages(messages)
+    if configuration.get("zdr_enabled") is not False or not trailing_tool_messages:
+        return True
+    ai_message_index = len(messages) - len(trailing_tool_messages) - 1
+    return ai_message_index >= 0 and is_replayed(messages[ai_message_index])
+
+
+def needs_compaction(state: Dict[str, Any], configuration: Dict[str, Any]) -> bool:
+    """
+    Checks if the history should be compacted before the next model call, i.e. if
+    compaction is enabled, the full history is sent, and the request would be larger than
+    'compaction_threshold' tokens.
+
+    Args:
+        state: The current state of the thread.
+        configuration: The configuration, with defaults applied.
+
+    Returns:
+        True if the history should be compacted, false otherwise.
+    """
+    compaction_threshold = configuration.get("compaction_threshold")
+    return (
+        compaction_threshold is not None
+        and sends_full_history(state.get("messages", []), configuration)
+        and estimate_request_tokens(state, configuration) > compaction_threshold
+    )
+
+
+def estimate_request_tokens(state: Dict[str, Any], configuration: Dict[str, Any]) -> int:
+    """
+    Estimates the input tokens of the next request, if the full history is sent.
+
+    Args:
+        state: The current state of the thread.
+        configuration: The configuration, with defaults applied.
+
+    Returns:
+        The estimated number of tokens.
+    """
+    messages = apply_compaction(
+        state.get("messages", []), state, configuration.get("compaction_threshold")
+    )
+    return sum(estimate_tokens(message) for message in _prepare(messages, configuration))
+
+
+def compact(state: Dict[str, Any], configuration: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Folds the oldest steps of the history into the history log, until the next request is
+    estimated to use at most half of 'compaction_threshold' tokens, so it is a while
+    before the history needs compacting again. The task and the latest step are always
+    kept as they are. The log itself is limited to a quarter of the threshold in requests,
+    with the oldest lines left out first.
+
+    Args:
+        state: The current state of the thread.
+        configuration: The configuration, with defaults applied.
+
+    Returns:
+        The lines to add to the history log, and the ID of the last message they cover.
+    """
+    messages = state.get("messages", [])
+    history_log = list(state.get("history_log") or [])
+    start = max(_compacted_length(messages, state.get("compacted_through")), _task_length(messages))
+    # Estimate each message with screenshots dropped as in the request. Dropping
+    # screenshots doesn't add or remove messages, so indices still match.
+    prepared = _prepare(messages, configuration)
+    estimates = [estimate_tokens(message) for message in prepared]
+    task_tokens = sum(estimates[: _task_length(messages)])
+    remaining_tokens = sum(estimates[start:])
+    compaction_threshold = configuration.get("compaction_threshold")
+    target = compaction_threshold // 2
+
+    step = sum(1 for message in messages[:start] if getattr(message, "type", None) == "ai")
+    new_lines: List[str] = []
+    compacted_through: Optional[str] = None
+    steps = _split_steps(messages[start:])
+    for step_start, step_end in steps[:-1]:
+        log = history_log_message([*history_log, *new_lines], compaction_threshold // LOG_SHARE)
+        log_tokens = estimate_tokens(log)
+        if task_tokens + log_tokens + remaining_tokens <= target:
+            break
+        step_messages = messages[start + step_start : start + step_end]
+        if getattr(step_messages[0], "type", None) == "ai":
+            step += 1
+        new_lines.append(describe_step(step_messages, step))
+        remaining_tokens -= sum(estimates[start + step_start : start + step_end])
+        compacted_through = step_messages[-1].id
+
+    if compacted_through is None:
+        return {}
+    return {"history_log": new_lines, "compacted_through": compacted_through}
@@ -0,0 +1,252 @@
+import inspect
+import logging
+import time
+from typing import (
+    Annotated,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    TypedDict,
+    Union,
+)
+
+from langchain_core.messages import AIMessage, AnyMessage, BaseMessage, HumanMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import merge_configs
+from langgraph.errors import GraphBubbleUp
+from langgraph.graph import END, START, StateGraph, add_messages
+from langgraph.types import Send
+
+from langgraph_cua.graph import create_cua
+from langgraph_cua.nodes.create_vm_instance import discard_instance
+from langgraph_cua.types import CUAState, get_configuration_with_defaults
+from langgraph_cua.utils import get_instance
+
+logger = logging.getLogger(__name__)
+
+
+class SubtaskResult(TypedDict):
+    """
+    The result of one subtask in a fan-out run.
+
+    Attributes:
+        index: The position of the subtask in the list of subtasks.
+        subtask: The subtask, as sent to the agent.
+        answer: The text of the agent's final message, or None if the subtask failed.
+        error: The error the subtask failed with, or None if it succeeded.
+        state: The final state of the subtask's branch, or None if it failed.
+        latency_seconds: How long the subtask took, from start to finish.
+    """
+
+    index: int
+    subtask: str
+    answer: Optional[str]
+    error: Optional[str]
+    state: Optional[CUAState]
+    latency_seconds: float
+
+
+def merge_subtask_results(
+    left: Optional[List[SubtaskResult]], right: Optional[List[SubtaskResult]]
+) -> List[SubtaskResult]:
+    """
+    Merges the results of subtasks which finished in the same step, ordered by the
+    position of each subtask. A later result for the same subtask replaces the earlier one.
+    An update of None clears the results, so a new task doesn't keep the last one's.
+
+    Args:
+        left: The existing results.
+        right: The results to merge in, or None to clear them.
+
+    Returns:
+        The merged results.
+    """
+    if right is None:
+        return []
+    merged = {result["index"]: result for result in left or []}
+    merged.update((result["index"], result) for result in right)
+    return [merged[index] for index in sorted(merged)]
+
+
+class CUAFanOutState(TypedDict):
+    """State schema for running one task across several instances at once.
+
+    Attributes:
+        messages: The task, followed by the merged answer once every subtask has finished.
+        subtasks: The subtasks to run, each on its own instance. If not given, they are
+            split from the task by the 'split_task' function. Cleared once the results are
+            merged, so each task on a thread is planned afresh.
+        results: The result of each subtask, in the order of the subtasks.
+    """
+
+    messages: Annotated[list[AnyMessage], add_messages] = []
+    subtasks: Annotated[List[str], None] = []
+    results: Annotated[List[SubtaskResult], merge_subtask_results] = []
+
+
+class _SubtaskInput(TypedDict):
+    index: int
+    subtask: str
+    messages: List[AnyMessage]
+
+
+def _final_answer(state: Dict[str, Any]) -> Optional[str]:
+    messages = state.get("messages") or []
+    return messages[-1].text if messages else None
+
+
+def format_results(results: Sequence[SubtaskResult]) -> str:
+    """
+    Formats the answer of every subtask as a numbered list, for the merged answer.
+
+    Args:
+        results: The results of the subtasks, in order.
+
+    Returns:
+        The merged answer.
+    """
+    lines = []
+    for result in results:
+        answer = result["answer"] if result["error"] is None else f"Failed: {result['error']}"
+        lines.append(f"{result['index'] + 1}. {result['subtask']}\n{answer}")
+    return "\n\n".join(lines)
+
+
+def create_cua_fan_out(
+    *,
+    split_task: Optional[
+        Callable[[List[AnyMessage]], Union[Sequence[str], Awaitable[Sequence[str]]]]
+    ] = None,
+    merge_results: Callable[[List[SubtaskResult]], Union[str, BaseMessage]] = format_results,
+    max_concurrency: Optional[int] = None,
+    **kwargs: Any,
+) -> Runnable:
+    """Creates a computer use agent which runs one task as several subtasks at once, each
+    on its own instance, e.g. comparing a product's price across several retailers. The
+    run takes as long as its slowest subtask, rather than the sum of all of them.
+
+    Each subtask is sent to a separate branch of the graph with LangGraph's `Send`, and is
+    run by the agent `create_cua` builds, with its own `CUAState`, starting from the task's
+    messages followed by the subtask. Each branch's instance is stopped, or released back to
+    the VM pool, once the branch ends. Results are merged into `results` as the branches
+    finish, then combined into a single answer.
+
+    ```python
+    fan_out_graph = create_cua_fan_out(environment="web")
+    result = await fan_out_graph.ainvoke(
+        {
+            "messages": [{"role": "user", "content": "Compare the price of this product."}],
+            "subtasks": [f"Find the price of this product on {site}." for site in sites],
+        }
+    )
+    ```
+
+    Attributes:
+        split_task: A function which splits the task into subtasks, given the messages in
+            state. May be async. Only called if 'subtasks' isn't given in the input.
+        merge_results: A function which combines the results of the subtasks into the final
+            answer. Defaults to a numbered list of each subtask's answer.
+        max_concurrency: The maximum number of subtasks to run at once. If None, every
+            subtask runs at once.
+        **kwargs: Passed to `create_cua`, to configure the agent run for each subtask.
+    """
+    if max_concurrency is not None and max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+
+    cua_graph = create_cua(**kwargs)
+
+    async def plan_subtasks(state: CUAFanOutState) -> Dict[str, Any]:
+        subtasks = state.get("subtasks")
+        if not subtasks and split_task is not None:
+            subtasks = split_task(state.get("messages", []))
+            if inspect.isawaitable(subtasks):
+                subtasks = await subtasks
+        if not subtasks:
+            raise ValueError("No subtasks to run. Pass 'subtasks' in the input, or 'split_task'.")
+        # Clear the results of any earlier task on the thread.
+        return {"subtasks": list(subtasks), "results": None}
+
+    def fan_out(state: CUAFanOutState) -> List[Send]:
+        return [
+            Send(
+                "run_subtask",
+                {"index": index, "subtask": subtask, "messages": state.get("messages", [])},
+            )
+            for index, subtask in enumerate(state["subtasks"])
+        ]
+
+    async def stop_branch_instance(branch_state: Dict[str, Any], config: RunnableConfig) -> None:
+        # Branches are never continued, so their instance is stopped, or released back to
+        # the VM pool, once they end. Branches which end normally with a VM pool have
+        # already released theirs.
+        instance_id = branch_state.get("instance_id")
+        if instance_id is None:
+            return
+        config = merge_configs(cua_graph.config, config)
+        try:
+            instance = await get_instance(instance_id, config)
+            await discard_instance(instance, get_configuration_with_defaults(config))
+        except Exception as e:
+            logger.warning("Failed to stop the instance %s of a subtask: %r", instance_id, e)
+
+    async def run_subtask(state: _SubtaskInput, config: RunnableConfig) -> Dict[str, Any]:
+        start = time.perf_counter()
+        # The latest state of the branch, so its instance can be stopped even if it fails.
+        branch_state: Dict[str, Any] = {}
+        try:
+            # The branch is a new run of the agent, so it starts its own instance. It sees
+            # the task, followed by its own subtask.
+            inputs = {"messages": [*state["messages"], HumanMessage(content=state["subtask"])]}
+            async for values in cua_graph.astream(inputs, config, stream_mode="values"):
+                branch_state = values
+            output, answer, error = branch_state, _final_answer(branch_state), None
+        except GraphBubbleUp:
+            # Interrupts must reach the parent graph, rather than be recorded as failures.
+            raise
+        except Exception as e:
+            output, answer, error = None, None, f"{type(e).__name__}: {e}"
+        finally:
+            await stop_branch_instance(branch_state, config)
+        result: SubtaskResult = {
+            "index": state["index"],
+            "subtask": state["subtask"],
+            "answer": answer,
+            "error": error,
+            "state": output,
+            "latency_seconds": time.perf_counter() - start,
+        }
+        return {"results": [result]}
+
+    def merge(state: CUAFanOutState) -> Dict[str, Any]:
+        merged = merge_results(state.get("results", []))
+        # Clear the subtasks, so the next task on a checkpointed thread is planned afresh,
+        # rather than running this task's subtasks again. The results are kept as the
+        # output of the run, and cleared once the next task is planned.
+        return {
+            "messages": merged if isinstance(merged, BaseMessage) else AIMessage(merged),
+            "subtasks": [],
+        }
+
+    workflow = StateGraph(CUAFanOutState)
+    workflow.add_node("plan_subtasks", plan_subtasks)
+    workflow.add_node("run_subtask", run_subtask, input_schema=_SubtaskInput)
+    workflow.add_node("merge_results", merge)
+
+    workflow.add_edge(START, "plan_subtasks")
+    workflow.add_conditional_edges("plan_subtasks", fan_out, ["run_subtask"])
+    workflow.add_edge("run_subtask", "merge_results")
+    workflow.add_edge("merge_results", END)
+
+    compiled = workflow.compile()
+    compiled.name = "Computer Use Agent (Fan-out)"
+    config: RunnableConfig = {"recursion_limit": cua_graph.config["recursion_limit"]}
+    if max_concurrency is not None:
+        config["max_concurrency"] = max_concurrency
+    return compiled.with_config(config=config)
+
+
+__all__ = ["create_cua_fan_out", "CUAFanOutState", "SubtaskResult", "merge_subtask_results"]
@@ -1,37 +1,73 @@
-from typing import Literal, Union
+import functools
+from typing import Callable, Literal, Optional, Type, Union
 
 from langchain_core.messages import SystemMessage
+from langchain_core.rate_limiters import BaseRateLimiter
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, START, StateGraph
+from langgraph.graph.state import CompiledStateGraph
 
-from langgraph_cua.nodes import call_model, create_vm_instance, take_computer_action
-from langgraph_cua.types import CUAConfiguration, CUAState
+from langgraph_cua.budget import exceeded_budget, track_time
+from langgraph_cua.compaction import needs_compaction
+from langgraph_cua.nodes import (
+    call_model,
+    compact_history,
+    create_vm_instance,
+    release_vm_instance,
+    stop_run,
+    take_computer_action,
+)
+from langgraph_cua.nodes.release_vm_instance import release_on_error
+from langgraph_cua.replay import TrajectoryCache
+from langgraph_cua.screenshot_store import ScreenshotStore
+from langgraph_cua.transport import HTTPTransport
+from langgraph_cua.types import (
+    CUAAppendState,
+    CUAConfiguration,
+    CUAState,
+    get_configuration_with_defaults,
+)
 from langgraph_cua.utils import is_computer_tool_call
+from langgraph_cua.vm_pool import VMPool
 
 
-def take_action_or_end(state: CUAState):
+def _end(state: CUAState, config: RunnableConfig):
+    # Instances leased from a VM pool are returned to it before the run ends.
+    if state.get("instance_id") and get_configuration_with_defaults(config).get("vm_pool"):
+        return "release_vm_instance"
+    return END
+
+
+def take_action_or_end(state: CUAState, config: RunnableConfig):
     """
     Routes to the take_computer_action node if a computer call is present
-    in the last message, otherwise routes to END.
+    in the last message, otherwise routes to END. If the instance was leased
+    from a VM pool, routes to release_vm_instance instead of END. If a budget
+    has been used up, routes to stop_run instead of taking the action.
 
     Args:
         state: The current state of the thread.
+        config: The configuration for the runnable.
 
     Returns:
         "take_computer_action" or END depending on if a computer call is present.
     """
     if not state.get("messages", []):
-        return END
+        return _end(state, config)
 
     last_message = state.get("messages", [])[-1]
     additional_kwargs = getattr(last_message, "additional_kwargs", None)
 
     if not additional_kwargs:
-        return END
+        return _end(state, config)
 
     tool_outputs = additional_kwargs.get("tool_outputs")
 
     if not is_computer_tool_call(tool_outputs):
-        return END
+        return _end(state, config)
+
+    if exceeded_budget(state, get_configuration_with_defaults(config)):
+        return "stop_run"
 
     if not state.get("instance_id"):
         # If the instance_id is not defined, create a new instance.
@@ -40,37 +76,105 @@ def take_action_or_end(state: CUAState):
     return "take_computer_action"
 
 
-def reinvoke_model_or_end(state: CUAState):
+def reinvoke_model_or_end(state: CUAState, config: RunnableConfig):
     """
     Routes to the call_model node if the last message is a tool message,
-    otherwise routes to END.
+    otherwise routes to END, or to release_vm_instance if the instance was
+    leased from a VM pool. If a budget has been used up, routes to stop_run
+    instead of calling the model again. If compaction is enabled, the full history
+    is sent, and the next request would be larger than the threshold, routes to
+    compact_history first.
 
     Args:
         state: The current state of the thread.
+        config: The configuration for the runnable.
 
     Returns:
         "call_model" or END depending on if the last message is a tool message.
     """
     messages = state.get("messages", [])
     if messages and getattr(messages[-1], "type", None) == "tool":
+        configuration = get_configuration_with_defaults(config)
+        if exceeded_budget(state, configuration):
+            return "stop_run"
+        if needs_compaction(state, configuration):
+            return "compact_history"
         return "call_model"
 
-    return END
+    return _end(state, config)
+
+
+def compact_or_call_model(state: CUAState, config: RunnableConfig):
+    """
+    Routes the start of a run to the call_model node, or to compact_history first if
+    compaction is enabled, and the full history the model would be sent, e.g. a thread
+    continued with a new human message, is larger than the threshold.
+
+    Args:
+        state: The current state of the thread.
+        config: The configuration for the runnable.
+
+    Returns:
+        "compact_history" or "call_model".
+    """
+    if needs_compaction(state, get_configuration_with_defaults(config)):
+        return "compact_history"
+    return "call_model"
+
+
+def _route(path: Callable[[CUAState, RunnableConfig], str]) -> Callable[..., str]:
+    # LangGraph reads the state schema of a conditional edge from the annotations of its
+    # routing function, so hide them, and let the edge use the graph's schema instead.
+    def route(state, config: RunnableConfig):
+        return path(state, config)
+
+    route.__name__ = path.__name__
+    return route
+
 
+def _build_workflow(state_schema: Type[CUAState]) -> StateGraph:
+    workflow = StateGraph(state_schema, CUAConfiguration)
 
-workflow = StateGraph(CUAState, CUAConfiguration)
+    # The nodes are annotated with CUAState, so the schema is given explicitly, otherwise
+    # LangGraph would read CUAState's reducers from the annotations. The time each step
+    # takes is counted against the run time and VM time budgets, and an instance leased
+    # from a VM pool is released if a step fails, since the run won't reach
+    # release_vm_instance.
+    def add_node(name: str, node: Callable, timed: bool = True) -> None:
+        node = release_on_error(track_time(node) if timed else node)
+        workflow.add_node(name, node, input_schema=state_schema)
 
-workflow.add_node("call_model", call_model)
-workflow.add_node("create_vm_instance", create_vm_instance)
-workflow.add_node("take_computer_action", take_computer_action)
+    add_node("call_model", call_model)
+    add_node("create_vm_instance", create_vm_instance)
+    add_node("take_computer_action", take_computer_action)
+    workflow.add_node("release_vm_instance", release_vm_instance, input_schema=state_schema)
+    add_node("stop_run", stop_run, timed=False)
+    add_node("compact_history", compact_history)
 
-workflow.add_edge(START, "call_model")
-workflow.add_conditional_edges("call_model", take_action_or_end)
-workflow.add_edge("create_vm_instance", "take_computer_action")
-workflow.add_conditional_edges("take_computer_action", reinvoke_model_or_end)
+    workflow.add_conditional_edges(START, _route(compact_or_call_model))
+    workflow.add_conditional_edges("call_model", _route(take_action_or_end))
+    workflow.add_edge("create_vm_instance", "take_computer_action")
+    workflow.add_conditional_edges("take_computer_action", _route(reinvoke_model_or_end))
+    workflow.add_conditional_edges("stop_run", _route(_end))
+    workflow.add_edge("compact_history", "call_model")
+    workflow.add_edge("release_vm_instance", END)
+    return workflow
 
-graph = workflow.compile()
-graph.name = "Computer Use Agent"
+
+def _compile(workflow: StateGraph) -> CompiledStateGraph:
+    compiled = workflow.compile()
+    compiled.name = "Computer Use Agent"
+    return compiled
+
+
+workflow = _build_workflow(CUAState)
+graph = _compile(workflow)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_append_only_graph() -> CompiledStateGraph:
+    # Only compiled if requested, so importing the package doesn't pay for it.
+    return _compile(_build_workflow(CUAAppendState))
 
 
 def create_cua(
@@ -82,6 +186,36 @@ def create_cua(
     auth_state_id: str = None,
     environment: Literal["web", "ubuntu", "windows"] = "web",
     prompt: Union[str, SystemMessage] = None,
+    screenshot_store: Optional[ScreenshotStore] = None,
+    screenshot_retention: Optional[int] = None,
+    screenshot_format: Literal["png", "jpeg", "webp"] = "png",
+    screenshot_quality: int = 80,
+    screenshot_scale: float = 1.0,
+    screenshot_dedup: Literal["off", "exact", "perceptual"] = "off",
+    screenshot_dedup_threshold: int = 0,
+    vm_pool: Optional[VMPool] = None,
+    speculative_provisioning: bool = False,
+    wait_strategy: Literal["fixed", "adaptive"] = "fixed",
+    wait_min_seconds: float = 0.25,
+    wait_max_seconds: float = 5.0,
+    wait_stable_seconds: float = 0.5,
+    emit_timings: bool = False,
+    trajectory_cache: Optional[TrajectoryCache] = None,
+    task_key: Optional[str] = None,
+    trajectory_mode: Literal["record", "replay"] = "replay",
+    model_rate_limiter: Optional[BaseRateLimiter] = None,
+    scrapybara_rate_limiter: Optional[BaseRateLimiter] = None,
+    action_max_retries: int = 3,
+    action_retry_budget: int = 10,
+    append_only_messages: bool = False,
+    http_transport: Optional[HTTPTransport] = None,
+    model_streaming: Literal["off", "stream", "dispatch"] = "off",
+    max_input_tokens: Optional[int] = None,
+    max_screenshot_bytes: Optional[int] = None,
+    max_run_seconds: Optional[float] = None,
+    max_vm_seconds: Optional[float] = None,
+    stable_prefix: bool = False,
+    compaction_threshold: Optional[int] = None,
 ):
     """Configuration for the Computer Use Agent.
 
@@ -98,13 +232,154 @@ def create_cua(
         auth_state_id: The ID of the authentication state. If defined, it will be used to authenticate
             with Scrapybara. Only applies if 'environment' is set to 'web'.
         environment: The environment to use. Default is "web".
+        prompt: The initial prompt to use for the conversation. Will
+            be passed as a system message
+        screenshot_store: A store to keep screenshots in. If defined, messages in state will
+            hold references to screenshots in the store instead of the base64 encoded images,
+            which are only loaded when sending the messages to the model. Default None.
+        screenshot_retention: The number of most recent screenshots to send to the model when
+            the full message history is sent (e.g. when 'zdr_enabled' is True). Older screenshots
+            are replaced with a tiny placeholder image. If None, all screenshots are sent.
+            Default None.
+        screenshot_format: The format to send screenshots to the model in. One of "png",
+            "jpeg", or "webp". Formats other than "png" require Pillow. Default "png".
+        screenshot_quality: The encoding quality for "jpeg" and "webp" screenshots, from 1 to 100.
+            Default 80.
+        screenshot_scale: The factor to resize screenshots by before sending them to the model,
+            between 0 and 1. Coordinates in the model's actions are scaled back to the full size
+            display. Values other than 1 require Pillow. Default 1.
+        screenshot_dedup: How to detect repeated screenshots. "exact" matches screenshots with
+            identical bytes, while "perceptual" matches screenshots which look the same, and
+            requires Pillow. Exact repeats reuse the earlier image, while perceptual
+            matches keep their own, and only the newest is sent to the model. Default "off".
+        screenshot_dedup_threshold: The number of bits two perceptual hashes may differ by and
+            still be considered the same screen. Default 0.
+        vm_pool: A pool of warm instances to lease from, instead of starting a new instance for
+            each thread. The instance is released back to the pool when the run ends, or
+            stopped and replaced if the run fails. The pool starts the instances, so
+            'timeout_hours' must match the pool's. Default None.
+        speculative_provisioning: Whether to start the instance at the same time as the first model
+            call, instead of after it. If the model finishes without using the computer, the
+            instance is stopped, or released back to the VM pool. Default False.
+        wait_strategy: How to handle the model's "wait" action. "fixed" sleeps for 2 seconds, while
+            "adaptive" polls screenshots until the screen has stopped changing. Default "fixed".
+        wait_min_seconds: The minimum time an adaptive wait takes. Default 0.25.
+        wait_max_seconds: The maximum time an adaptive wait takes, even if the screen is still
+            changing. Default 5.
+        wait_stable_seconds: How long the screen must stay the same for an adaptive wait to end.
+            Default 0.5.
+        emit_timings: Whether to write timing spans for model calls, instance start-up, and computer
+            actions to the custom stream. Spans are also recorded with OpenTelemetry if it is
+            installed, regardless of this setting. Default False.
+        trajectory_cache: A cache to record the model's computer calls in, keyed by 'task_key', the
+            step, and the perceptual hash of the screenshot the model saw. Default None.
+        task_key: The key identifying the task being run, for the trajectory cache. Runs of the
+            same task should use the same key. Default None.
+        trajectory_mode: "record" to only record computer calls in the trajectory cache, or
+            "replay" to also replay recorded computer calls when the screen matches the
+            recording, instead of calling the model. Default "replay".
+        model_rate_limiter: A rate limiter shared by every request to the model, e.g. an
+            'InMemoryRateLimiter' from 'langchain_core.rate_limiters'. Default None.
+        scrapybara_rate_limiter: A rate limiter shared by every request to Scrapybara. Default None.
+        action_max_retries: The maximum number of times to retry a computer action which failed
+            with a transient error, such as a timeout or a 503. Actions which change the screen
+            are only retried if the request was rejected before it was acted on. Default 3.
+        action_retry_budget: The maximum number of retries across every action in a run.
+            Default 10.
+        append_only_messages: Whether to use `CUAAppendState` as the state schema, which merges
+            messages with the append-optimized `append_messages` reducer instead of
+            `add_messages`, so each step only converts and checks the new messages, rather than
+            the whole history. The list of messages is still copied on each step, so the cost
+            per step still grows with the history, but much more slowly. Default False.
+        http_transport: Shared HTTP clients to send requests to OpenAI and Scrapybara through,
+            so connections are kept alive and reused across steps and threads, rather than
+            opened for each client. See `HTTPTransport`. Default None.
+        model_streaming: How to receive the model's response. "off" waits for the whole response,
+            "stream" streams it, writing each chunk to the custom stream as
+            `{"model_output": chunk}`, and "dispatch" also starts the first computer call as
+            soon as it has been received, so the action runs while the rest of the response
+            streams in. Default "off".
+        max_input_tokens: The most input tokens the model may use in a run. Once used up, the
+            run is stopped before the next action or model call, and ends with a summary of
+            what it used. Each run, i.e. each new human message, has its own budgets.
+            Default None.
+        max_screenshot_bytes: The most bytes of screenshots which may be sent to the model in a
+            run. Default None.
+        max_run_seconds: The most time a run may take from when it started, in seconds.
+            Default None.
+        max_vm_seconds: The most time the agent's steps may take in a run while the thread has
+            an instance, in seconds. Default None.
+        stable_prefix: Whether to keep the start of each request the same from turn to turn
+            when the full message history is sent (e.g. when 'zdr_enabled' is True), so the
+            model provider's prompt cache can be reused. Screenshots outside the
+            'screenshot_retention' window are then replaced 'screenshot_retention' at a time,
+            rather than one per turn, so between 'screenshot_retention' and twice as many
+            screenshots are sent. Default False.
+        compaction_threshold: The estimated input tokens a request may use when the full
+            message history is sent (e.g. when 'zdr_enabled' is True), before the oldest steps
+            are folded into a short text log. The log records each step's actions, the URL
+            the browser ended up on (in the "web" environment), the model's observations,
+            and any failed actions. Steps are folded until the request is estimated at half
+            the threshold, so the history is compacted in batches rather than every turn.
+            The messages in state are kept as they are. If None, the history is never
+            compacted. Default None.
     """
     # Validate timeout_hours is within acceptable range
     if timeout_hours < 0.01 or timeout_hours > 24:
         raise ValueError("timeout_hours must be between 0.01 and 24")
 
+    if vm_pool is not None and timeout_hours != vm_pool.timeout_hours:
+        raise ValueError(
+            f"timeout_hours must match the VM pool's timeout_hours ({vm_pool.timeout_hours}), "
+            "since the pool starts the instances"
+        )
+
+    if screenshot_retention is not None and screenshot_retention < 1:
+        raise ValueError("screenshot_retention must be at least 1")
+
+    if screenshot_format not in ("png", "jpeg", "webp"):
+        raise ValueError("screenshot_format must be one of 'png', 'jpeg', or 'webp'")
+
+    if screenshot_quality < 1 or screenshot_quality > 100:
+        raise ValueError("screenshot_quality must be between 1 and 100")
+
+    if screenshot_scale <= 0 or screenshot_scale > 1:
+        raise ValueError("screenshot_scale must be greater than 0, and at most 1")
+
+    if screenshot_dedup not in ("off", "exact", "perceptual"):
+        raise ValueError("screenshot_dedup must be one of 'off', 'exact', or 'perceptual'")
+
+    if wait_strategy not in ("fixed", "adaptive"):
+        raise ValueError("wait_strategy must be one of 'fixed' or 'adaptive'")
+
+    if wait_min_seconds < 0 or wait_stable_seconds <= 0 or wait_max_seconds < wait_min_seconds:
+        raise ValueError(
+            "wait_min_seconds must be at least 0, wait_stable_seconds must be greater than 0, "
+            "and wait_max_seconds must be at least wait_min_seconds"
+        )
+
+    if trajectory_mode not in ("record", "replay"):
+        raise ValueError("trajectory_mode must be one of 'record' or 'replay'")
+
+    if action_max_retries < 0 or action_retry_budget < 0:
+        raise ValueError("action_max_retries and action_retry_budget must be at least 0")
+
+    if model_streaming not in ("off", "stream", "dispatch"):
+        raise ValueError("model_streaming must be one of 'off', 'stream', or 'dispatch'")
+
+    budgets = (max_input_tokens, max_screenshot_bytes, max_run_seconds, max_vm_seconds)
+    if any(budget is not None and budget <= 0 for budget in budgets):
+        raise ValueError(
+            "max_input_tokens, max_screenshot_bytes, max_run_seconds, and max_vm_seconds "
+            "must be greater than 0"
+        )
+
+    if compaction_threshold is not None and compaction_threshold <= 0:
+        raise ValueError("compaction_threshold must be greater than 0")
+
     # Configure the graph with the provided parameters
-    configured_graph = graph.with_config(
+    base_graph = _get_append_only_graph() if append_only_messages else graph
+    configured_graph = base_graph.with_config(
         config={
             "configurable": {
                 "scrapybara_api_key": scrapybara_api_key,
@@ -113,6 +388,35 @@ def create_cua(
                 "auth_state_id": auth_state_id,
                 "environment": environment,
                 "prompt": prompt,
+                "screenshot_store": screenshot_store,
+                "screenshot_retention": screenshot_retention,
+                "screenshot_format": screenshot_format,
+                "screenshot_quality": screenshot_quality,
+                "screenshot_scale": screenshot_scale,
+                "screenshot_dedup": screenshot_dedup,
+                "screenshot_dedup_threshold": screenshot_dedup_threshold,
+                "vm_pool": vm_pool,
+                "speculative_provisioning": speculative_provisioning,
+                "wait_strategy": wait_strategy,
+                "wait_min_seconds": wait_min_seconds,
+                "wait_max_seconds": wait_max_seconds,
+                "wait_stable_seconds": wait_stable_seconds,
+                "emit_timings": emit_timings,
+                "trajectory_cache": trajectory_cache,
+                "task_key": task_key,
+                "trajectory_mode": trajectory_mode,
+                "model_rate_limiter": model_rate_limiter,
+                "scrapybara_rate_limiter": scrapybara_rate_limiter,
+                "action_max_retries": action_max_retries,
+                "action_retry_budget": action_retry_budget,
+                "http_transport": http_transport,
+                "model_streaming": model_streaming,
+                "max_input_tokens": max_input_tokens,
+                "max_screenshot_bytes": max_screenshot_bytes,
+                "max_run_seconds": max_run_seconds,
+                "max_vm_seconds": max_vm_seconds,
+                "stable_prefix": stable_prefix,
+                "compaction_threshold": compaction_threshold,
             },
             "recursion_limit": recursion_limit,
         }
@@ -0,0 +1,195 @@
+from typing import List, Optional, Sequence, Set
+
+from langchain_core.messages import AnyMessage, HumanMessage
+
+# A 1x1 grey PNG, sent in place of screenshots which have been dropped from the history.
+# The Responses API requires every computer call output to contain an image, so dropped
+# screenshots can't be replaced with text without breaking the call_id pairing.
+OMITTED_SCREENSHOT_URL = (
+    "data:image/png;base64,"
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGNoaGgAAAMEAYFL09IQAAAAAElFTkSuQmCC"
+)
+
+
+FAILURE_NOTE_HEADER = "These computer calls did not succeed:"
+
+
+def get_trailing_tool_messages(messages: Sequence[AnyMessage]) -> List[AnyMessage]:
+    """Gets the tool messages at the end of the message history, in order."""
+    start = len(messages)
+    while start > 0 and getattr(messages[start - 1], "type", None) == "tool":
+        start -= 1
+    return list(messages[start:])
+
+
+def _is_screenshot_message(message: AnyMessage) -> bool:
+    return (
+        getattr(message, "type", None) == "tool"
+        and isinstance(message.content, list)
+        and any(
+            isinstance(block, dict) and block.get("type") == "input_image"
+            for block in message.content
+        )
+    )
+
+
+def _has_real_screenshot(message: AnyMessage) -> bool:
+    # Placeholders for dropped screenshots don't count towards the retention window.
+    return any(
+        isinstance(block, dict)
+        and block.get("type") == "input_image"
+        and block.get("image_url") != OMITTED_SCREENSHOT_URL
+        for block in message.content
+    )
+
+
+def _omit_screenshots(message: AnyMessage) -> AnyMessage:
+    content = [
+        {**block, "image_url": OMITTED_SCREENSHOT_URL}
+        if isinstance(block, dict) and block.get("type") == "input_image"
+        else block
+        for block in message.content
+    ]
+    return message.model_copy(update={"content": content})
+
+
+def apply_screenshot_retention(
+    messages: Sequence[AnyMessage], keep_last: Optional[int], stable_prefix: bool = False
+) -> List[AnyMessage]:
+    """
+    Replaces the screenshots in all but the last `keep_last` computer call outputs with a
+    tiny placeholder image. Each tool message keeps its tool_call_id, so every computer
+    call is still paired with an output. Only outputs with a screenshot of their own are
+    counted, so outputs which already hold a placeholder, and the outputs of the earlier
+    calls in a response, which copy the screenshot taken after the last one, don't use up
+    the window.
+
+    Replacing the oldest screenshot on every turn changes the start of the request each
+    time, so the model provider can't reuse its prompt cache past that point. If
+    `stable_prefix` is True, screenshots are instead replaced `keep_last` at a time, once
+    `2 * keep_last` have built up. Between replacements, each request is the previous one
+    with the new messages added at the end, so all of it can be read from the cache.
+
+    Args:
+        messages: The messages to apply the retention policy to.
+        keep_last: The number of most recent screenshots to keep. If None, all
+            screenshots are kept.
+        stable_prefix: Whether to replace screenshots in blocks, keeping between
+            `keep_last` and `2 * keep_last - 1` screenshots.
+
+    Returns:
+        The messages, with older screenshots replaced.
+    """
+    if keep_last is None:
+        return list(messages)
+
+    screenshot_indices = [i for i, m in enumerate(messages) if _is_screenshot_message(m)]
+    latest = screenshot_indices[-1] if screenshot_indices else None
+    screenshot_indices = [
+        i
+        for i in screenshot_indices
+        if _has_real_screenshot(messages[i])
+        and (i == latest or messages[i].additional_kwargs.get("duplicate_of") is None)
+    ]
+    omit_count = max(len(screenshot_indices) - keep_last, 0)
+    if stable_prefix:
+        omit_count -= omit_count % keep_last
+    to_omit = set(screenshot_indices[:omit_count])
+
+    retained: List[AnyMessage] = []
+    for i, message in enumerate(messages):
+        retained.append(_omit_screenshots(message) if i in to_omit else message)
+    return retained
+
+
+def _similar_group(message: AnyMessage) -> str:
+    return message.additional_kwargs.get("similar_to") or message.tool_call_id
+
+
+def omit_duplicate_screenshots(
+    messages: Sequence[AnyMessage], stable_prefix: bool = False
+) -> List[AnyMessage]:
+    """
+    Replaces the screenshots in computer call outputs marked as duplicates of an earlier
+    screenshot with a tiny placeholder image, since the model has already seen them. The
+    most recent screenshot is always kept, so the model can see the current screen.
+
+    Screenshots which only look like one another (marked 'similar_to' the first of them)
+    can differ in a small region, e.g. typed text or a checkbox, so only the newest of each
+    group is kept, and the older ones are replaced.
+
+    Both rules replace screenshots in messages earlier in the history once newer ones
+    arrive, which changes the start of the request. If `stable_prefix` is True, each
+    screenshot is instead only replaced if it was replaced when it was first sent, so each
+    request is the previous one with the new messages added at the end. The last
+    screenshot of each group of computer call outputs was the most recent when it was
+    sent, so it is kept, and similar screenshots are kept until the retention window drops
+    them.
+
+    Args:
+        messages: The messages to remove duplicate screenshots from.
+        stable_prefix: Whether to only replace screenshots which were replaced when they
+            were first sent.
+
+    Returns:
+        The messages, with duplicate screenshots replaced.
+    """
+    screenshot_indices = [i for i, m in enumerate(messages) if _is_screenshot_message(m)]
+    latest = screenshot_indices[-1] if screenshot_indices else None
+    # The newest screenshot of each group of similar screenshots, keyed by the call_id of
+    # the first screenshot in the group.
+    newest_similar = {_similar_group(messages[i]): i for i in screenshot_indices}
+    screenshot_indices = set(screenshot_indices)
+    # The last screenshot in each group of computer call outputs, which was the most recent
+    # screenshot when the group was sent.
+    group_latest: Set[int] = set()
+    in_group = False
+    for i in range(len(messages) - 1, -1, -1):
+        if getattr(messages[i], "type", None) != "tool":
+            in_group = False
+        elif i in screenshot_indices and not in_group:
+            group_latest.add(i)
+            in_group = True
+
+    deduplicated: List[AnyMessage] = []
+    for i, message in enumerate(messages):
+        if i not in screenshot_indices:
+            pass
+        elif stable_prefix:
+            if i not in group_latest and message.additional_kwargs.get("duplicate_of") is not None:
+                message = _omit_screenshots(message)
+        elif i != latest and (
+            message.additional_kwargs.get("duplicate_of") is not None
+            or newest_similar[_similar_group(message)] != i
+        ):
+            message = _omit_screenshots(message)
+        deduplicated.append(message)
+    return deduplicated
+
+
+def add_failure_notes(messages: Sequence[AnyMessage]) -> List[AnyMessage]:
+    """
+    Adds a user message after each group of computer call outputs which includes a failed
+    computer call, listing the calls which failed and why. Computer call outputs only carry
+    a screenshot to the model, so without the note, it can't tell that an action failed.
+
+    Args:
+        messages: The messages to add failure notes to.
+
+    Returns:
+        The messages, with a note after each group of outputs which includes a failure.
+    """
+    noted: List[AnyMessage] = []
+    failures: List[str] = []
+    for i, message in enumerate(messages):
+        noted.append(message)
+        if getattr(message, "type", None) != "tool":
+            continue
+        if getattr(message, "status", None) == "error":
+            error = message.additional_kwargs.get("error") or "unknown error"
+            failures.append(f"- {message.tool_call_id}: {error}")
+        next_is_tool = i + 1 < len(messages) and getattr(messages[i + 1], "type", None) == "tool"
+        if failures and not next_is_tool:
+            noted.append(HumanMessage(content="\n".join([FAILURE_NOTE_HEADER, *failures])))
+            failures = []
+    return noted
@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Collection, Literal, Optional, Tuple
+
+ImageFormat = Literal["png", "jpeg", "webp"]
+DedupMode = Literal["off", "exact", "perceptual"]
+
+IMAGE_FORMAT_MEDIA_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+# Pillow releases the GIL while decoding and encoding, so a small thread pool is enough to
+# keep image work off the event loop without blocking other threads.
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="langgraph-cua-images"
+        )
+    return _executor
+
+
+def _import_pil_image():
+    try:
+        from PIL import Image
+    except ImportError as e:
+        raise ImportError(
+            "Transcoding or perceptually hashing screenshots requires Pillow. "
+            "Install it with `pip install pillow`."
+        ) from e
+    return Image
+
+
+def needs_transcoding(image_format: ImageFormat, scale: float) -> bool:
+    """
+    Checks if screenshots need to be transcoded, given the format and scale to send them in.
+    Scrapybara returns full size PNG screenshots, which are sent as is by default.
+
+    Args:
+        image_format: The format to send screenshots in.
+        scale: The factor to resize screenshots by.
+
+    Returns:
+        True if screenshots must be transcoded, false otherwise.
+    """
+    return image_format != "png" or scale != 1
+
+
+def transcode_screenshot(
+    data: bytes, image_format: ImageFormat = "png", quality: int = 80, scale: float = 1.0
+) -> Tuple[bytes, str]:
+    """
+    Re-encodes a screenshot in the given format, optionally resizing it. Requires Pillow.
+
+    Args:
+        data: The screenshot bytes.
+        image_format: The format to encode the screenshot in. One of "png", "jpeg", or "webp".
+        quality: The encoding quality, from 1 to 100. Ignored for PNG.
+        scale: The factor to resize the screenshot by. 1 keeps the original size.
+
+    Returns:
+        A tuple of the encoded screenshot bytes and their media type.
+    """
+    Image = _import_pil_image()
+
+    if image_format not in IMAGE_FORMAT_MEDIA_TYPES:
+        raise ValueError(
+            f"Invalid screenshot format. Must be one of 'png', 'jpeg', or 'webp'. Received: {image_format}"
+        )
+
+    with Image.open(io.BytesIO(data)) as image:
+        if scale != 1:
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, Image.Resampling.LANCZOS)
+        if image_format == "jpeg" and image.mode != "RGB":
+            image = image.convert("RGB")
+
+        output = io.BytesIO()
+        if image_format == "png":
+            image.save(output, format="PNG", optimize=False)
+        else:
+            image.save(output, format=image_format.upper(), quality=quality)
+
+    return output.getvalue(), IMAGE_FORMAT_MEDIA_TYPES[image_format]
+
+
+async def atranscode_screenshot(
+    data: bytes, image_format: ImageFormat = "png", quality: int = 80, scale: float = 1.0
+) -> Tuple[bytes, str]:
+    """Async version of `transcode_screenshot`, which runs in a worker thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_executor(), transcode_screenshot, data, image_format, quality, scale
+    )
+
+
+def perceptual_hash(data: bytes, hash_size: int = 16) -> str:
+    """
+    Computes a difference hash (dHash) of a screenshot. Screenshots which look the same
+    have the same, or nearly the same, hash, even if their bytes differ. Requires Pillow.
+
+    Args:
+        data: The screenshot bytes.
+        hash_size: The width and height of the hash grid. The hash has hash_size ** 2 bits.
+
+    Returns:
+        The hash, as a hex string.
+    """
+    Image = _import_pil_image()
+    with Image.open(io.BytesIO(data)) as image:
+        # Grayscale images are one byte per pixel, so the bytes index directly as pixel values.
+        pixels = (
+            image.convert("L")
+            .resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+            .tobytes()
+        )
+
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(a: str, b: str) -> int:
+    """
+    Counts the number of bits which differ between two hex encoded hashes.
+
+    Args:
+        a: The first hash.
+        b: The second hash.
+
+    Returns:
+        The number of differing bits.
+    """
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+async def ascreenshot_hash(data: bytes, mode: DedupMode) -> str:
+    """
+    Hashes a screenshot for deduplication. "exact" hashes the screenshot bytes, while
+    "perceptual" computes a perceptual hash in a worker thread pool.
+
+    Args:
+        data: The screenshot bytes.
+        mode: The deduplication mode. One of "exact" or "perceptual".
+
+    Returns:
+        The hash, prefixed with the mode it was computed with.
+    """
+    if mode == "perceptual":
+        loop = asyncio.get_running_loop()
+        return "perceptual:" + await loop.run_in_executor(_get_executor(), perceptual_hash, data)
+    return "exact:" + hashlib.sha256(data).hexdigest()
+
+
+def find_similar_hash(
+    screenshot_hash: str, known_hashes: Collection[str], max_distance: int = 0
+) -> Optional[str]:
+    """
+    Finds a known hash matching the given screenshot hash. Exact hashes must match exactly,
+    while perceptual hashes match if they differ by at most max_distance bits.
+
+    Args:
+        screenshot_hash: The hash to match, as returned by `ascreenshot_hash`.
+        known_hashes: The hashes to search.
+        max_distance: The maximum number of bits perceptual hashes may differ by.
+
+    Returns:
+        The matching hash, or None if there is no match.
+    """
+    if screenshot_hash in known_hashes:
+        return screenshot_hash
+    mode, _, value = screenshot_hash.partition(":")
+    if mode != "perceptual" or max_distance <= 0:
+        return None
+    # Prefer the most recent match, as that is the most likely to be the same screen.
+    for known in reversed(list(known_hashes)):
+        known_mode, _, known_value = known.partition(":")
+        if known_mode == mode and hamming_distance(value, known_value) <= max_distance:
+            return known
+    return None
@@ -0,0 +1,99 @@
+import uuid
+from typing import Dict, List, Optional, cast
+
+from langchain_core.messages import (
+    AnyMessage,
+    BaseMessageChunk,
+    RemoveMessage,
+    convert_to_messages,
+    message_chunk_to_message,
+)
+from langgraph.graph import add_messages
+from langgraph.graph.message import Messages
+
+
+class MessageList(List[AnyMessage]):
+    """
+    A list of messages which keeps an index from message ID to position, so the
+    `append_messages` reducer can find messages by ID without scanning the history.
+
+    Lists derived from one another by `append_messages` share a single index, which is
+    only ever added to, so it isn't copied on each step. An entry is only trusted if the
+    list holds the message at that position, since a list derived from an earlier state
+    may have put other messages there.
+
+    It behaves like a plain list everywhere else. Lists restored from a checkpoint are
+    plain lists, and are indexed again the first time they are reduced.
+    """
+
+    _index: Optional[Dict[str, int]] = None
+
+
+def _coerce(messages: Messages) -> List[AnyMessage]:
+    if not isinstance(messages, list):
+        messages = [messages]
+    coerced = [
+        message_chunk_to_message(cast(BaseMessageChunk, m)) for m in convert_to_messages(messages)
+    ]
+    for m in coerced:
+        if m.id is None:
+            m.id = str(uuid.uuid4())
+    return coerced
+
+
+def _find(messages: List[AnyMessage], index: Dict[str, int], message_id: str) -> Optional[int]:
+    position = index.get(message_id)
+    if position is None:
+        # New messages have new IDs, so they are never looked up any further.
+        return None
+    if position < len(messages) and messages[position].id == message_id:
+        return position
+    # The entry was written for a list derived from an earlier state, which put the
+    # message somewhere else, so look for it, and point the index back at this list.
+    for position, message in enumerate(messages):
+        if message.id == message_id:
+            index[message_id] = position
+            return position
+    return None
+
+
+def append_messages(left: Messages, right: Messages) -> MessageList:
+    """
+    A drop-in replacement for `add_messages`, for histories which only grow. Only the new
+    messages are coerced and given IDs, and updates to existing messages are found through
+    an index, so the reducer's own work for each update depends on the size of the update,
+    rather than on the length of the history.
+
+    The existing list is never modified in place, since LangGraph shares it with snapshots
+    of earlier states, so each update still copies the list of references, which grows
+    with the history. The index is shared rather than copied. Checkpointers also store the
+    whole list again after every step, so checkpoint size grows with the history too.
+
+    Updates containing a `RemoveMessage` are handed to `add_messages`.
+
+    Args:
+        left: The existing messages.
+        right: The messages to add, or to replace by ID.
+
+    Returns:
+        The merged messages.
+    """
+    right = _coerce(right)
+    if isinstance(left, MessageList) and left._index is not None:
+        index = left._index
+    else:
+        left = _coerce(left)
+        index = {m.id: i for i, m in enumerate(left)}
+
+    if any(isinstance(m, RemoveMessage) for m in right):
+        return MessageList(add_messages(left, right))
+
+    merged = MessageList(left)
+    for m in right:
+        if (existing_idx := _find(merged, index, m.id)) is not None:
+            merged[existing_idx] = m
+        else:
+            index[m.id] = len(merged)
+            merged.append(m)
+    merged._index = index
+    return merged
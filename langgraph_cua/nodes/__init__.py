@@ -1,5 +1,25 @@
-from langgraph_cua.nodes.call_model import call_model
-from langgraph_cua.nodes.create_vm_instance import create_vm_instance
-from langgraph_cua.nodes.take_computer_action import take_computer_action
+from typing import TYPE_CHECKING
 
-__all__ = ["call_model", "create_vm_instance", "take_computer_action"]
+from langgraph_cua._lazy import lazy_attributes
+
+if TYPE_CHECKING:
+    from langgraph_cua.nodes.call_model import call_model
+    from langgraph_cua.nodes.compact_history import compact_history
+    from langgraph_cua.nodes.create_vm_instance import create_vm_instance
+    from langgraph_cua.nodes.release_vm_instance import release_vm_instance
+    from langgraph_cua.nodes.stop_run import stop_run
+    from langgraph_cua.nodes.take_computer_action import take_computer_action
+
+__all__ = [
+    "call_model",
+    "compact_history",
+    "create_vm_instance",
+    "release_vm_instance",
+    "stop_run",
+    "take_computer_action",
+]
+
+lazy_attributes(
+    __name__,
+    {name: f"langgraph_cua.nodes.{name}" for name in __all__},
+)
@@ -1,10 +1,39 @@
-from typing import Any, Dict, Optional, Union
+import asyncio
+import logging
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence, Set, Tuple, Union, cast
 
-from langchain_core.messages import AIMessageChunk, SystemMessage
+import httpx
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    SystemMessage,
+    message_chunk_to_message,
+)
+from langchain_core.runnables import Runnable
 from langchain_core.runnables.config import RunnableConfig
 from langchain_openai import ChatOpenAI
+from langgraph.config import get_stream_writer
 
+from ..budget import count_image_bytes, get_cached_tokens
+from ..compaction import apply_compaction, sends_full_history
+from ..history import (
+    add_failure_notes,
+    apply_screenshot_retention,
+    get_trailing_tool_messages,
+    omit_duplicate_screenshots,
+)
+from ..replay import REPLAYED_KEY, get_step
+from ..screenshot_store import rehydrate_screenshots
+from ..telemetry import span
 from ..types import CUAState, get_configuration_with_defaults
+from ..utils import AsyncInstance, acquire_rate_limit, is_computer_tool_call
+from .create_vm_instance import discard_instance, provision_instance
+from .take_computer_action import discard_dispatched_call, dispatch_computer_call
+
+logger = logging.getLogger(__name__)
 
 
 def get_openai_env_from_state_env(env: str) -> str:
@@ -31,6 +60,48 @@ def get_openai_env_from_state_env(env: str) -> str:
 # Scrapybara does not allow for configuring this. Must use a hardcoded value.
 DEFAULT_DISPLAY_WIDTH = 1024
 DEFAULT_DISPLAY_HEIGHT = 768
+DEFAULT_TRUNCATION = "auto"
+
+# Strong references to instances being discarded in the background, so the tasks are not
+# garbage collected before they finish.
+_background_tasks: Set[asyncio.Task] = set()
+
+
+@lru_cache(maxsize=32)
+def get_model_with_tools(
+    environment: str,
+    display_width: int,
+    display_height: int,
+    truncation: str,
+    http_client: Optional[httpx.AsyncClient] = None,
+) -> Runnable[LanguageModelInput, BaseMessage]:
+    """
+    Gets the computer use model, bound to the computer use tool. Bound models are cached
+    and shared across turns and threads, so they (and the OpenAI HTTP client they wrap)
+    are only built once per combination of arguments. Anything which changes per turn,
+    such as the 'previous_response_id', must be passed when invoking the model.
+
+    Args:
+        environment: The environment to use. One of "web", "ubuntu", or "windows".
+        display_width: The width of the display, in pixels.
+        display_height: The height of the display, in pixels.
+        truncation: The truncation strategy to use.
+        http_client: The HTTP client to send requests through. If not provided, the model
+            uses its own.
+
+    Returns:
+        The model, bound to the computer use tool.
+    """
+    llm = ChatOpenAI(
+        model="computer-use-preview", truncation=truncation, http_async_client=http_client
+    )
+    tool = {
+        "type": "computer_use_preview",
+        "display_width": display_width,
+        "display_height": display_height,
+        "environment": get_openai_env_from_state_env(environment),
+    }
+    return llm.bind_tools([tool])
 
 
 def _prompt_to_sys_message(prompt: Union[str, SystemMessage, None]):
@@ -41,6 +112,84 @@ def _prompt_to_sys_message(prompt: Union[str, SystemMessage, None]):
     return prompt
 
 
+async def _provision_instance_with_stream_url(
+    configuration: Dict[str, Any],
+) -> Tuple[AsyncInstance, str]:
+    instance = await provision_instance(configuration)
+    await acquire_rate_limit(configuration.get("scrapybara_rate_limiter"))
+    with span("create_vm_instance.stream_url", emit=configuration.get("emit_timings")):
+        stream_url = (await instance.get_stream_url()).stream_url
+    return instance, stream_url
+
+
+def _discard_in_background(provisioning: asyncio.Task, configuration: Dict[str, Any]) -> None:
+    """
+    Discards a speculatively provisioned instance once it has finished booting, without
+    blocking the run on it. Cancelling the boot instead could leave an instance running on
+    Scrapybara which nothing holds a handle to.
+    """
+
+    async def discard() -> None:
+        try:
+            instance, _ = await provisioning
+            await discard_instance(instance, configuration)
+        except Exception:
+            # The boot failed, or the instance already stopped, so there is nothing to clean up.
+            pass
+
+    task = asyncio.create_task(discard())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _stream_response(
+    llm_with_tools: Runnable[LanguageModelInput, BaseMessage],
+    input_messages: Sequence[Any],
+    invoke_kwargs: Dict[str, Any],
+    state: CUAState,
+    config: RunnableConfig,
+    dispatch: bool,
+) -> AIMessage:
+    """
+    Streams the model's response, writing each chunk to the custom stream as
+    `{"model_output": chunk}`. If `dispatch` is True, the first computer call is started
+    as soon as it has been received, rather than once the whole response has.
+    """
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        # Not running inside the graph (e.g. a node called directly), so there is no stream.
+        writer = None
+
+    response: Optional[AIMessageChunk] = None
+    dispatched_call_id: Optional[str] = None
+    try:
+        async for chunk in llm_with_tools.astream(input_messages, **invoke_kwargs):
+            response = chunk if response is None else response + chunk
+            if writer is not None:
+                writer({"model_output": chunk})
+            if not dispatch:
+                continue
+            # Each computer call is only streamed once it is complete.
+            computer_calls = [
+                output
+                for output in chunk.additional_kwargs.get("tool_outputs") or []
+                if output.get("type") == "computer_call"
+            ]
+            if computer_calls:
+                dispatch = False
+                if dispatch_computer_call(computer_calls[0], state, config):
+                    dispatched_call_id = computer_calls[0].get("call_id")
+    except BaseException:
+        if dispatched_call_id is not None:
+            discard_dispatched_call(state.get("instance_id"), dispatched_call_id)
+        raise
+
+    if response is None:
+        raise ValueError("The model returned an empty response.")
+    return message_chunk_to_message(response)
+
+
 async def call_model(state: CUAState, config: RunnableConfig) -> Dict[str, Any]:
     """
     Invokes the computer preview model with the given messages.
@@ -53,51 +202,181 @@ async def call_model(state: CUAState, config: RunnableConfig) -> Dict[str, Any]:
     """
     configuration = get_configuration_with_defaults(config)
     environment = configuration.get("environment")
-    zdr_enabled = configuration.get("zdr_enabled")
     prompt = _prompt_to_sys_message(configuration.get("prompt"))
+    screenshot_store = configuration.get("screenshot_store")
+    screenshot_retention = configuration.get("screenshot_retention")
+    screenshot_scale = configuration.get("screenshot_scale")
     messages = state.get("messages", [])
     previous_response_id: Optional[str] = None
-    last_message = messages[-1] if messages else None
 
-    # Check if the last message is a tool message
-    if last_message and getattr(last_message, "type", None) == "tool" and zdr_enabled is False:
-        # If it's a tool message, check if the second-to-last message is an AI message
+    # Every computer call in the last AI message has its own tool message, which all need
+    # to be passed to the model
+    trailing_tool_messages = get_trailing_tool_messages(messages)
+
+    chain_previous_response = not sends_full_history(messages, configuration)
+
+    if chain_previous_response:
+        # If there are tool messages, check if the message before them is an AI message
+        ai_message_index = len(messages) - len(trailing_tool_messages) - 1
         if (
-            len(messages) >= 2
-            and getattr(messages[-2], "type", None) == "ai"
-            and hasattr(messages[-2], "response_metadata")
+            ai_message_index >= 0
+            and getattr(messages[ai_message_index], "type", None) == "ai"
+            and hasattr(messages[ai_message_index], "response_metadata")
         ):
-            previous_response_id = messages[-2].response_metadata["id"]
+            previous_response_id = messages[ai_message_index].response_metadata["id"]
 
-    llm = ChatOpenAI(
-        model="computer-use-preview",
-        model_kwargs={"truncation": "auto", "previous_response_id": previous_response_id},
+    trajectory_cache = configuration.get("trajectory_cache")
+    task_key = configuration.get("task_key")
+    record_trajectory = trajectory_cache is not None and task_key is not None
+    if record_trajectory:
+        step = get_step(messages, state.get("run_start"))
+        screenshot_hash = state.get("screen_hash")
+        recorded = (
+            trajectory_cache.get(task_key, step, screenshot_hash)
+            if configuration.get("trajectory_mode") == "replay"
+            else None
+        )
+        if recorded is not None:
+            # The screen matches the recording, so repeat the recorded computer calls
+            # instead of calling the model.
+            return {
+                "messages": AIMessage(
+                    content=recorded["content"],
+                    additional_kwargs={
+                        "tool_outputs": recorded["tool_outputs"],
+                        **(
+                            {"reasoning": recorded["reasoning"]}
+                            if recorded.get("reasoning")
+                            else {}
+                        ),
+                        REPLAYED_KEY: True,
+                    },
+                ),
+            }
+
+    # If screenshots are resized, the model must see a display of the same size. Coordinates
+    # are mapped back to the full size display before actions are taken.
+    http_transport = configuration.get("http_transport")
+    llm_with_tools = get_model_with_tools(
+        environment,
+        round(DEFAULT_DISPLAY_WIDTH * screenshot_scale),
+        round(DEFAULT_DISPLAY_HEIGHT * screenshot_scale),
+        DEFAULT_TRUNCATION,
+        http_transport.get_client() if http_transport is not None else None,
     )
 
-    tool = {
-        "type": "computer_use_preview",
-        "display_width": DEFAULT_DISPLAY_WIDTH,
-        "display_height": DEFAULT_DISPLAY_HEIGHT,
-        "environment": get_openai_env_from_state_env(environment),
+    # The computer use model always replies with an AI message, whether it is returned
+    # whole, or merged from the streamed chunks.
+    response: AIMessage
+
+    emit_timings = configuration.get("emit_timings")
+    with span("call_model.build_request", emit=emit_timings) as attributes:
+        # Check if the last message is a tool message
+        if chain_previous_response:
+            if previous_response_id is None:
+                raise ValueError("Cannot process tool message without a previous_response_id")
+
+            # Only pass the tool messages to the model, with a note of any which failed.
+            input_messages = add_failure_notes(omit_duplicate_screenshots(trailing_tool_messages))
+            invoke_kwargs = {"previous_response_id": previous_response_id}
+        else:
+            # Pass all messages to the model, dropping repeated screenshots and screenshots
+            # which fall outside the retention window. The prompt and task come first, and
+            # are never rewritten, so they can always be read from the prompt cache. Steps
+            # which have been compacted are replaced by the history log, and failed computer
+            # calls are followed by a note of why they failed.
+            messages = apply_compaction(messages, state, configuration.get("compaction_threshold"))
+            stable_prefix = configuration.get("stable_prefix")
+            messages = omit_duplicate_screenshots(messages, stable_prefix)
+            messages = apply_screenshot_retention(messages, screenshot_retention, stable_prefix)
+            messages = add_failure_notes(messages)
+            input_messages = messages if prompt is None else [prompt, *messages]
+            invoke_kwargs = {}
+
+        if screenshot_store is not None:
+            # Swap screenshot references for the images themselves, only for this request.
+            input_messages = await rehydrate_screenshots(input_messages, screenshot_store)
+        attributes["input_messages"] = len(input_messages)
+        screenshot_bytes = count_image_bytes(input_messages)
+
+    provisioning: Optional[asyncio.Task] = None
+    if configuration.get("speculative_provisioning") and not state.get("instance_id"):
+        # Start booting the instance while waiting on the model, so the first action only
+        # waits on whichever of the two takes longer.
+        provisioning = asyncio.create_task(_provision_instance_with_stream_url(configuration))
+
+    try:
+        await acquire_rate_limit(configuration.get("model_rate_limiter"))
+        with span(
+            "call_model.request",
+            {"previous_response_id": previous_response_id is not None},
+            emit=emit_timings,
+        ) as attributes:
+            model_streaming = configuration.get("model_streaming")
+            if model_streaming == "off":
+                response = cast(
+                    AIMessage, await llm_with_tools.ainvoke(input_messages, **invoke_kwargs)
+                )
+            else:
+                response = await _stream_response(
+                    llm_with_tools,
+                    input_messages,
+                    invoke_kwargs,
+                    state,
+                    config,
+                    dispatch=model_streaming == "dispatch",
+                )
+            usage = getattr(response, "usage_metadata", None) or {}
+            attributes["input_tokens"] = usage.get("input_tokens")
+            attributes["output_tokens"] = usage.get("output_tokens")
+            cached_tokens = get_cached_tokens(usage)
+            attributes["cached_tokens"] = cached_tokens
+            if usage.get("input_tokens"):
+                attributes["cache_hit_rate"] = round(cached_tokens / usage["input_tokens"], 3)
+    except BaseException:
+        if provisioning is not None:
+            _discard_in_background(provisioning, configuration)
+        raise
+
+    if record_trajectory:
+        trajectory_cache.put(task_key, step, screenshot_hash, response)
+
+    # Count the request against the thread's budgets.
+    usage_update = {
+        "input_tokens": usage.get("input_tokens") or 0,
+        "output_tokens": usage.get("output_tokens") or 0,
+        "cached_tokens": cached_tokens,
+        "screenshot_bytes": screenshot_bytes,
     }
-    llm_with_tools = llm.bind_tools([tool])
 
-    response: AIMessageChunk
+    if provisioning is None:
+        return {
+            "messages": response,
+            **usage_update,
+        }
 
-    # Check if the last message is a tool message
-    if last_message and getattr(last_message, "type", None) == "tool" and zdr_enabled is False:
-        if previous_response_id is None:
-            raise ValueError("Cannot process tool message without a previous_response_id")
+    if not is_computer_tool_call(response.additional_kwargs.get("tool_outputs")):
+        # The model finished without using the computer, so the instance is not needed.
+        _discard_in_background(provisioning, configuration)
+        return {
+            "messages": response,
+            **usage_update,
+        }
 
-        # Only pass the tool message to the model
-        response = await llm_with_tools.ainvoke([last_message])
-    else:
-        # Pass all messages to the model
-        if prompt is None:
-            response = await llm_with_tools.ainvoke(messages)
-        else:
-            response = await llm_with_tools.ainvoke([prompt, *messages])
+    try:
+        instance, stream_url = await provisioning
+    except Exception as e:
+        # The model's response has already been paid for, so keep it. Without an instance
+        # in state, create_vm_instance starts one before the action is taken.
+        logger.warning("Failed to provision an instance during the model call: %r", e)
+        return {
+            "messages": response,
+            **usage_update,
+        }
 
     return {
         "messages": response,
+        "instance_id": instance.id,
+        "stream_url": stream_url,
+        **usage_update,
     }
@@ -0,0 +1,27 @@
+from typing import Any, Dict
+
+from langchain_core.runnables.config import RunnableConfig
+
+from ..compaction import compact
+from ..telemetry import span
+from ..types import CUAState, get_configuration_with_defaults
+
+
+async def compact_history(state: CUAState, config: RunnableConfig) -> Dict[str, Any]:
+    """
+    Folds the oldest steps of the history into a short text log, once the next request
+    would be larger than 'compaction_threshold' tokens. The messages in state are kept
+    as they are, and call_model sends the log in place of the steps it covers.
+
+    Args:
+        state: The current state of the thread.
+        config: The configuration for the runnable.
+
+    Returns:
+        The lines added to the history log, and the ID of the last message they cover.
+    """
+    configuration = get_configuration_with_defaults(config)
+    with span("compact_history", emit=configuration.get("emit_timings")) as attributes:
+        update = compact(state, configuration)
+        attributes["compacted_steps"] = len(update.get("history_log", []))
+    return update
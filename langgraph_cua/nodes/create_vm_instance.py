@@ -1,59 +1,101 @@
+from typing import Any, Dict
+
 from langchain_core.runnables.config import RunnableConfig
-from scrapybara.client import BrowserInstance, UbuntuInstance, WindowsInstance
 
+from ..telemetry import span
 from ..types import CUAState
-from ..utils import get_configuration_with_defaults, get_scrapybara_client
+from ..utils import (
+    BLOCKED_DOMAINS,  # noqa: F401 - re-exported for backwards compatibility
+    AsyncInstance,
+    acquire_rate_limit,
+    cache_instance,
+    get_configuration_with_defaults,
+    get_scrapybara_client,
+    invalidate_instance,
+    start_instance,
+)
 
-# Copied from the OpenAI example repository
-# https://github.com/openai/openai-cua-sample-app/blob/eb2d58ba77ffd3206d3346d6357093647d29d99c/utils.py#L13
-BLOCKED_DOMAINS = [
-    "maliciousbook.com",
-    "evilvideos.com",
-    "darkwebforum.com",
-    "shadytok.com",
-    "suspiciouspins.com",
-    "ilanbigio.com",
-]
 
+async def provision_instance(configuration: Dict[str, Any]) -> AsyncInstance:
+    """
+    Gets a new instance for a thread, by leasing one from the VM pool if one is configured,
+    or by starting one otherwise.
 
-def create_vm_instance(state: CUAState, config: RunnableConfig):
-    instance_id = state.get("instance_id")
-    configuration = get_configuration_with_defaults(config)
+    Args:
+        configuration: The configuration, with defaults applied.
+
+    Returns:
+        The new instance, which is also added to the instance cache.
+    """
     scrapybara_api_key = configuration.get("scrapybara_api_key")
-    timeout_hours = configuration.get("timeout_hours")
+    vm_pool = configuration.get("vm_pool")
     environment = configuration.get("environment")
 
-    if instance_id is not None:
-        # If the instance_id already exists in state, do nothing.
-        return {}
-
-    if not scrapybara_api_key:
+    if not scrapybara_api_key and vm_pool is None:
         raise ValueError(
             "Scrapybara API key not provided. Please provide one in the configurable fields, "
             "or set it as an environment variable (SCRAPYBARA_API_KEY)"
         )
 
-    client = get_scrapybara_client(scrapybara_api_key)
-
-    instance: UbuntuInstance | BrowserInstance | WindowsInstance
-
-    if environment == "ubuntu":
-        instance = client.start_ubuntu(timeout_hours=timeout_hours)
-    elif environment == "windows":
-        instance = client.start_windows(timeout_hours=timeout_hours)
-    elif environment == "web":
-        blocked_domains = [
-            domain.replace("https://", "").replace("www.", "") for domain in BLOCKED_DOMAINS
-        ]
-        instance = client.start_browser(
-            timeout_hours=timeout_hours, blocked_domains=blocked_domains
-        )
-    else:
+    if vm_pool is not None and configuration.get("timeout_hours") != vm_pool.timeout_hours:
         raise ValueError(
-            f"Invalid environment. Must be one of 'web', 'ubuntu', or 'windows'. Received: {environment}"
+            f"timeout_hours must match the VM pool's timeout_hours ({vm_pool.timeout_hours}), "
+            "since the pool starts the instances"
         )
 
-    stream_url = instance.get_stream_url().stream_url
+    if vm_pool is None:
+        await acquire_rate_limit(configuration.get("scrapybara_rate_limiter"))
+    with span(
+        "create_vm_instance.boot",
+        {"environment": environment, "pooled": vm_pool is not None},
+        emit=configuration.get("emit_timings"),
+    ):
+        if vm_pool is not None:
+            # Lease a warm instance from the pool, instead of waiting for a new one to boot.
+            instance = await vm_pool.lease(environment)
+        else:
+            client = get_scrapybara_client(scrapybara_api_key, configuration.get("http_transport"))
+            instance = await start_instance(client, environment, configuration.get("timeout_hours"))
+
+    cache_instance(instance)
+    return instance
+
+
+async def discard_instance(instance: AsyncInstance, configuration: Dict[str, Any]) -> None:
+    """
+    Gives up an instance which was provisioned but is no longer needed, by releasing it
+    back to the VM pool if one is configured, or by stopping it otherwise.
+
+    Args:
+        instance: The instance to discard.
+        configuration: The configuration, with defaults applied.
+    """
+    vm_pool = configuration.get("vm_pool")
+    if vm_pool is not None:
+        await vm_pool.release(instance.id)
+        return
+
+    invalidate_instance(instance.id)
+    await instance.stop()
+
+
+async def create_vm_instance(state: CUAState, config: RunnableConfig):
+    instance_id = state.get("instance_id")
+    configuration = get_configuration_with_defaults(config)
+
+    if instance_id is not None:
+        # If the instance_id already exists in state, do nothing.
+        return {}
+
+    instance = await provision_instance(configuration)
+    try:
+        await acquire_rate_limit(configuration.get("scrapybara_rate_limiter"))
+        with span("create_vm_instance.stream_url", emit=configuration.get("emit_timings")):
+            stream_url = (await instance.get_stream_url()).stream_url
+    except BaseException:
+        # The instance isn't in state yet, so it would never be released or stopped.
+        await discard_instance(instance, configuration)
+        raise
 
     return {
         "instance_id": instance.id,
@@ -0,0 +1,71 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from langchain_core.runnables.config import RunnableConfig
+from langgraph.errors import GraphBubbleUp
+
+from ..types import CUAState, get_configuration_with_defaults
+
+# The fields of the state which refer to the thread's instance.
+_CLEARED_INSTANCE = {
+    "instance_id": None,
+    "stream_url": None,
+    "authenticated_id": None,
+}
+
+
+async def release_vm_instance(state: CUAState, config: RunnableConfig):
+    instance_id = state.get("instance_id")
+    vm_pool = get_configuration_with_defaults(config).get("vm_pool")
+
+    if instance_id is None or vm_pool is None:
+        return {}
+
+    await vm_pool.release(instance_id)
+
+    # Clear the instance from state, so the next run on this thread leases a fresh one.
+    return dict(_CLEARED_INSTANCE)
+
+
+def release_on_error(
+    node: Callable[[Any, RunnableConfig], Awaitable[Dict[str, Any]]],
+) -> Callable[[Any, RunnableConfig], Awaitable[Dict[str, Any]]]:
+    """
+    Wraps a node, so an instance leased from the VM pool is released if the node raises,
+    e.g. on a model error or cancellation, instead of being held until the pool is closed.
+    The run never reaches release_vm_instance in that case. The instance may have been left
+    part way through an action, so it is stopped and replaced rather than returned to the
+    pool. Interrupts aren't failures, since the run continues once it is resumed, so the
+    instance is kept for them.
+
+    The failed step's update is never written, so a checkpointed thread still refers to the
+    released instance. Once the pool no longer leases it, the node is run as if the thread
+    had no instance, and the instance is cleared from state, so a new one is leased.
+
+    Args:
+        node: The node to wrap.
+
+    Returns:
+        The wrapped node.
+    """
+
+    async def guarded(state: Any, config: RunnableConfig) -> Dict[str, Any]:
+        vm_pool = get_configuration_with_defaults(config).get("vm_pool")
+        if vm_pool is None:
+            return await node(state, config)
+
+        cleared: Dict[str, Any] = {}
+        instance_id = state.get("instance_id")
+        if instance_id is not None and not vm_pool.is_leased(instance_id):
+            cleared = dict(_CLEARED_INSTANCE)
+            state = {**state, **cleared}
+        try:
+            return {**cleared, **await node(state, config)}
+        except GraphBubbleUp:
+            raise
+        except BaseException:
+            if state.get("instance_id") is not None:
+                await vm_pool.release(state["instance_id"], discard=True)
+            raise
+
+    guarded.__name__ = node.__name__
+    return guarded
@@ -0,0 +1,84 @@
+from typing import Any, Dict, List
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables.config import RunnableConfig
+
+from ..budget import budget_summary, exceeded_budget, get_thread_usage, get_usage
+from ..history import OMITTED_SCREENSHOT_URL
+from ..types import CUAState, get_configuration_with_defaults
+from .take_computer_action import is_dispatched, take_computer_action
+
+
+async def stop_run(state: CUAState, config: RunnableConfig) -> Dict[str, Any]:
+    """
+    Stops the run once a budget has been used up, ending it with a summary of what the
+    run used. Computer calls which won't be executed are paired with an output reporting
+    that they weren't, so the thread's history stays valid if it's continued. If the first
+    computer call was already dispatched while the response was streaming, it has run on
+    the instance, so it is finished and paired with its real output instead.
+
+    Args:
+        state: The current state of the thread.
+        config: The configuration for the runnable.
+
+    Returns:
+        The summary, and the budget which was used up.
+    """
+    configuration = get_configuration_with_defaults(config)
+    budget = exceeded_budget(state, configuration)
+    messages = state.get("messages", [])
+
+    update: Dict[str, Any] = {}
+    tool_messages: List[Dict[str, Any]] = []
+    if messages and getattr(messages[-1], "type", None) == "ai":
+        message = messages[-1]
+        computer_calls = [
+            output
+            for output in message.additional_kwargs.get("tool_outputs") or []
+            if output.get("type") == "computer_call"
+        ]
+        if computer_calls and is_dispatched(
+            state.get("instance_id"), computer_calls[0].get("call_id")
+        ):
+            # Finish only the dispatched call, as if the response had ended with it.
+            dispatched_message = message.model_copy(
+                update={
+                    "additional_kwargs": {
+                        **message.additional_kwargs,
+                        "tool_outputs": computer_calls[:1],
+                    }
+                }
+            )
+            update = await take_computer_action(
+                {**state, "messages": [*messages[:-1], dispatched_message]}, config
+            )
+            tool_messages = update.pop("messages")
+            computer_calls = computer_calls[1:]
+        tool_messages += [
+            {
+                "role": "tool",
+                "content": [{"type": "input_image", "image_url": OMITTED_SCREENSHOT_URL}],
+                "tool_call_id": call.get("call_id"),
+                "status": "error",
+                "additional_kwargs": {
+                    "type": "computer_call_output",
+                    "error": f"Not executed, because the {budget} budget was used up.",
+                },
+            }
+            for call in computer_calls
+        ]
+
+    usage = get_usage(state)
+    summary = AIMessage(
+        content=budget_summary(budget, configuration, usage),
+        additional_kwargs={
+            "budget_exceeded": budget,
+            "usage": usage,
+            "thread_usage": get_thread_usage(state),
+        },
+    )
+    return {
+        **update,
+        "messages": [*tool_messages, summary],
+        "budget_exceeded": budget,
+    }
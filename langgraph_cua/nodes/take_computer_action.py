@@ -1,14 +1,36 @@
-import time
-from typing import Any, Dict, Optional
+import asyncio
+import base64
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
 
-from langchain_core.messages import AnyMessage, ToolMessage
+from langchain_core.messages import AnyMessage
+from langchain_core.rate_limiters import BaseRateLimiter
 from langchain_core.runnables import RunnableConfig
 from langgraph.config import get_stream_writer
 from openai.types.responses.response_computer_tool_call import ResponseComputerToolCall
 from scrapybara.types import ComputerResponse, InstanceGetStreamUrlResponse
 
+from ..history import OMITTED_SCREENSHOT_URL
+from ..images import (
+    ascreenshot_hash,
+    atranscode_screenshot,
+    find_similar_hash,
+    needs_transcoding,
+)
+from ..replay import ascreen_hash
+from ..retry import RetryBudget, is_rejected_error, is_transient_error
+from ..screenshot_store import make_screenshot_ref
+from ..telemetry import span
 from ..types import CUAState, get_configuration_with_defaults
-from ..utils import get_instance, is_computer_tool_call
+from ..utils import (
+    AsyncInstance,
+    acquire_rate_limit,
+    get_instance,
+    invalidate_instance,
+    is_computer_tool_call,
+)
+
+logger = logging.getLogger(__name__)
 
 # Copied from the OpenAI example repository
 # https://github.com/openai/openai-cua-sample-app/blob/eb2d58ba77ffd3206d3346d6357093647d29d99c/computers/scrapybara.py#L10
@@ -35,10 +57,531 @@ CUA_KEY_TO_SCRAPYBARA_KEY = {
     "win": "Meta_L",
 }
 
+# Actions which can safely be repeated, so they are retried on any transient error.
+IDEMPOTENT_ACTIONS = frozenset({"move", "screenshot", "wait"})
+
+# How long a "wait" action sleeps for before taking a screenshot, with the "fixed" wait strategy.
+FIXED_WAIT_SECONDS = 2.0
+
+# Computer calls which call_model started executing while the response was still being
+# streamed, keyed by instance ID and call ID, for take_computer_action to pick up. Each is
+# held with the retry budget it draws from.
+_dispatched_calls: Dict[Tuple[str, str], Tuple[asyncio.Task, RetryBudget]] = {}
+
+# Strong references to dispatched calls which will never be picked up, so the tasks are
+# not garbage collected before they finish.
+_abandoned_calls: Set[asyncio.Task] = set()
+
+
+def _scale_action_coordinates(action: Dict[str, Any], scale: float) -> Dict[str, Any]:
+    """
+    Maps the coordinates in an action from the resized screenshot the model saw, back to
+    the coordinates of the full size display.
+    """
+    if scale == 1:
+        return action
+
+    def unscale(value: Any) -> Any:
+        return round(value / scale) if isinstance(value, (int, float)) else value
+
+    scaled = dict(action)
+    for key in ("x", "y", "scroll_x", "scroll_y"):
+        if key in scaled:
+            scaled[key] = unscale(scaled[key])
+    if scaled.get("path"):
+        scaled["path"] = [
+            {**point, "x": unscale(point.get("x")), "y": unscale(point.get("y"))}
+            for point in scaled["path"]
+        ]
+    return scaled
+
+
+async def _screenshot_to_image_url(
+    base_64_image: str, configuration: Dict[str, Any], data: Optional[bytes] = None
+) -> str:
+    """
+    Converts a screenshot returned by Scrapybara into the image URL to send to the model,
+    transcoding it and moving it into the screenshot store if configured.
+    """
+    screenshot_store = configuration.get("screenshot_store")
+    image_format = configuration.get("screenshot_format")
+    scale = configuration.get("screenshot_scale")
+
+    if not needs_transcoding(image_format, scale) and screenshot_store is None:
+        return f"data:image/png;base64,{base_64_image}"
+
+    if data is None:
+        data = base64.b64decode(base_64_image)
+    media_type = "image/png"
+    if needs_transcoding(image_format, scale):
+        data, media_type = await atranscode_screenshot(
+            data, image_format, configuration.get("screenshot_quality"), scale
+        )
+
+    if screenshot_store is not None:
+        # Keep the image out of state, and only store a reference to it.
+        key = await screenshot_store.aput(data)
+        return make_screenshot_ref(key, media_type)
+    return f"data:{media_type};base64,{base64.b64encode(data).decode()}"
+
+
+def _find_image_url(messages: Sequence[AnyMessage], call_id: str) -> Optional[str]:
+    """Finds the image URL of the computer call output with the given call_id."""
+    for message in reversed(messages):
+        if getattr(message, "type", None) == "tool" and message.tool_call_id == call_id:
+            for block in message.content:
+                if isinstance(block, dict) and block.get("type") == "input_image":
+                    return block.get("image_url")
+            return None
+    return None
+
+
+async def _build_computer_call_output(
+    base_64_image: str, call_id: str, state: CUAState, configuration: Dict[str, Any]
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Builds the computer call output for a screenshot. If exact deduplication is enabled,
+    and the screenshot matches one seen earlier in the thread, the earlier image is reused,
+    and the output is marked as a duplicate. Perceptual matches can differ in a small region
+    of the screen (e.g. typed text), so they keep their own image, and are marked as similar
+    to the earlier screenshot instead.
+
+    Returns:
+        A tuple of the tool message, and any updates to the screenshot hash index.
+    """
+    dedup = configuration.get("screenshot_dedup")
+    additional_kwargs: Dict[str, Any] = {"type": "computer_call_output"}
+    state_update: Dict[str, Any] = {}
+    image_url: Optional[str] = None
+    data: Optional[bytes] = None
+
+    if dedup != "off":
+        data = base64.b64decode(base_64_image)
+        screenshot_hash = raw_hash = await ascreenshot_hash(data, dedup)
+        known_hashes = state.get("screenshot_hashes") or {}
+        match = find_similar_hash(
+            screenshot_hash, known_hashes, configuration.get("screenshot_dedup_threshold")
+        )
+        if match is not None and dedup == "exact":
+            image_url = _find_image_url(state.get("messages", []), known_hashes[match])
+
+        if image_url is not None:
+            screenshot_hash = match
+            additional_kwargs["duplicate_of"] = known_hashes[match]
+            additional_kwargs["screen_unchanged"] = match == state.get("last_screenshot_hash")
+        elif match is not None and dedup == "perceptual":
+            screenshot_hash = match
+            additional_kwargs["similar_to"] = known_hashes[match]
+            additional_kwargs["screen_unchanged"] = match == state.get("last_screenshot_hash")
+        else:
+            state_update["screenshot_hashes"] = {screenshot_hash: call_id}
+        state_update["last_screenshot_hash"] = screenshot_hash
+        if dedup == "perceptual":
+            state_update["screen_hash"] = raw_hash
+
+    if configuration.get("trajectory_cache") is not None and "screen_hash" not in state_update:
+        # Recorded trajectories are keyed by the screen each step was taken from.
+        data = data if data is not None else base64.b64decode(base_64_image)
+        state_update["screen_hash"] = await ascreen_hash(data)
+
+    if image_url is None:
+        image_url = await _screenshot_to_image_url(base_64_image, configuration, data)
+
+    tool_message = {
+        "role": "tool",
+        "content": [{"type": "input_image", "image_url": image_url}],
+        "tool_call_id": call_id,
+        "additional_kwargs": additional_kwargs,
+    }
+    return tool_message, state_update
+
+
+def _merge_action_groups(actions: Sequence[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], int]]:
+    # Merges actions as merge_actions does, pairing each merged action with the index of
+    # the first action merged into it.
+    merged: List[Tuple[Dict[str, Any], int]] = []
+    for i, action in enumerate(actions):
+        previous = merged[-1][0] if merged else None
+        action_type = action.get("type")
+        if previous is not None and previous.get("type") == action_type == "move":
+            merged[-1] = (action, merged[-1][1])
+        elif (
+            previous is not None
+            and previous.get("type") == action_type == "scroll"
+            and (previous.get("x"), previous.get("y")) == (action.get("x"), action.get("y"))
+        ):
+            scroll = {
+                **previous,
+                "scroll_x": (previous.get("scroll_x") or 0) + (action.get("scroll_x") or 0),
+                "scroll_y": (previous.get("scroll_y") or 0) + (action.get("scroll_y") or 0),
+            }
+            merged[-1] = (scroll, merged[-1][1])
+        else:
+            merged.append((action, i))
+    return merged
+
+
+def merge_actions(actions: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merges adjacent actions which can be combined without changing the end result, to
+    save round trips to the virtual machine. Consecutive mouse moves are replaced by the
+    final move, and consecutive scrolls at the same position are summed.
+
+    Args:
+        actions: The actions to merge, in the order they should be executed.
+
+    Returns:
+        The merged actions.
+    """
+    return [action for action, _ in _merge_action_groups(actions)]
+
+
+async def _wait_for_stable_screen(
+    instance: AsyncInstance, configuration: Dict[str, Any]
+) -> ComputerResponse:
+    """
+    Polls screenshots until the screen has stopped changing for 'wait_stable_seconds', after
+    waiting at least 'wait_min_seconds', and at most 'wait_max_seconds'. Screenshots are
+    compared by hash, perceptually if perceptual deduplication is enabled, so a blinking
+    cursor does not hold the wait open.
+
+    Returns:
+        The last screenshot taken.
+    """
+    min_seconds = configuration.get("wait_min_seconds")
+    max_seconds = configuration.get("wait_max_seconds")
+    stable_seconds = configuration.get("wait_stable_seconds")
+    hash_mode = "perceptual" if configuration.get("screenshot_dedup") == "perceptual" else "exact"
+    threshold = configuration.get("screenshot_dedup_threshold")
+    poll_interval = stable_seconds / 4
+    rate_limiter = configuration.get("scrapybara_rate_limiter")
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_seconds
+    await asyncio.sleep(min_seconds)
 
-def take_computer_action(state: CUAState, config: RunnableConfig) -> Dict[str, Any]:
+    await acquire_rate_limit(rate_limiter)
+    response = await instance.computer(action="take_screenshot")
+    stable_hash = await ascreenshot_hash(base64.b64decode(response.base_64_image), hash_mode)
+    stable_since = loop.time()
+    while loop.time() - stable_since < stable_seconds and loop.time() < deadline:
+        await asyncio.sleep(max(0.0, min(poll_interval, deadline - loop.time())))
+        await acquire_rate_limit(rate_limiter)
+        response = await instance.computer(action="take_screenshot")
+        screenshot_hash = await ascreenshot_hash(
+            base64.b64decode(response.base_64_image), hash_mode
+        )
+        if find_similar_hash(screenshot_hash, (stable_hash,), threshold) is None:
+            # The screen changed, so restart the stability window from this screenshot.
+            stable_hash = screenshot_hash
+            stable_since = loop.time()
+    return response
+
+
+async def _execute_action(
+    instance: AsyncInstance,
+    action: Dict[str, Any],
+    screenshot: bool,
+    configuration: Optional[Dict[str, Any]] = None,
+) -> Optional[ComputerResponse]:
     """
-    Executes computer actions based on the tool call in the last message.
+    Executes a single computer action on the instance.
+
+    Args:
+        instance: The instance to execute the action on.
+        action: The action to execute.
+        screenshot: Whether to capture a screenshot after the action.
+        configuration: The configuration, with defaults applied. Used to pick the wait strategy.
+
+    Returns:
+        The response from Scrapybara, or None if no request was needed.
+    """
+    action_type = action.get("type")
+
+    if action_type == "click":
+        return await instance.computer(
+            action="click_mouse",
+            button="middle" if action.get("button") == "wheel" else action.get("button"),
+            coordinates=[action.get("x"), action.get("y")],
+            screenshot=screenshot,
+        )
+    elif action_type == "double_click":
+        return await instance.computer(
+            action="click_mouse",
+            button="left",
+            coordinates=[action.get("x"), action.get("y")],
+            num_clicks=2,
+            screenshot=screenshot,
+        )
+    elif action_type == "drag":
+        return await instance.computer(
+            action="drag_mouse",
+            path=[[point.get("x"), point.get("y")] for point in action.get("path")],
+            screenshot=screenshot,
+        )
+    elif action_type == "keypress":
+        mapped_keys = [
+            CUA_KEY_TO_SCRAPYBARA_KEY.get(key.lower(), key.lower()) for key in action.get("keys")
+        ]
+        return await instance.computer(action="press_key", keys=mapped_keys, screenshot=screenshot)
+    elif action_type == "move":
+        return await instance.computer(
+            action="move_mouse",
+            coordinates=[action.get("x"), action.get("y")],
+            screenshot=screenshot,
+        )
+    elif action_type == "screenshot":
+        # A screenshot in the middle of a batch would never be seen, so skip it.
+        return await instance.computer(action="take_screenshot") if screenshot else None
+    elif action_type == "wait":
+        if configuration is not None and configuration.get("wait_strategy") == "adaptive":
+            # The stability check needs screenshots either way, so return the last one.
+            return await _wait_for_stable_screen(instance, configuration)
+        # Sleep for 2000ms (2 seconds) without blocking the event loop
+        await asyncio.sleep(FIXED_WAIT_SECONDS)
+        # Take a screenshot after waiting
+        return await instance.computer(action="take_screenshot") if screenshot else None
+    elif action_type == "scroll":
+        return await instance.computer(
+            action="scroll",
+            delta_x=action.get("scroll_x") // 20,
+            delta_y=action.get("scroll_y") // 20,
+            coordinates=[action.get("x"), action.get("y")],
+            screenshot=screenshot,
+        )
+    elif action_type == "type":
+        return await instance.computer(
+            action="type_text", text=action.get("text"), screenshot=screenshot
+        )
+    else:
+        raise ValueError(f"Unknown computer action received: {action}")
+
+
+async def _take_screenshot(
+    instance: AsyncInstance, rate_limiter: Optional[BaseRateLimiter]
+) -> ComputerResponse:
+    await acquire_rate_limit(rate_limiter)
+    return await instance.computer(action="take_screenshot")
+
+
+async def _get_current_url(
+    instance: AsyncInstance, rate_limiter: Optional[BaseRateLimiter]
+) -> Optional[str]:
+    """
+    Gets the URL of the page the browser is on, for the history log. The URL is only
+    informational, so None is returned if it can't be fetched, rather than failing the step.
+    """
+    try:
+        await acquire_rate_limit(rate_limiter)
+        return (await instance.get_current_url()).current_url
+    except Exception as e:
+        logger.debug("Failed to get the current URL of instance %s: %r", instance.id, e)
+        return None
+
+
+async def _build_failure_outputs(
+    instance: AsyncInstance,
+    computer_calls: Sequence[Dict[str, Any]],
+    failed_index: int,
+    error: BaseException,
+    transient: bool,
+    configuration: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """
+    Builds computer call outputs for a step in which a computer call failed. The calls
+    before it were executed, and the calls after it were not. Each output holds a
+    screenshot of the current screen, or a placeholder image if no screenshot can be
+    taken, since every computer call output must contain an image.
+    """
+    try:
+        response = await _take_screenshot(instance, configuration.get("scrapybara_rate_limiter"))
+        image_url = await _screenshot_to_image_url(response.base_64_image, configuration)
+    except Exception:
+        image_url = OMITTED_SCREENSHOT_URL
+
+    failed_call_id = computer_calls[failed_index].get("call_id")
+    tool_messages: List[Dict[str, Any]] = []
+    for i, call in enumerate(computer_calls):
+        tool_message = {
+            "role": "tool",
+            "content": [{"type": "input_image", "image_url": image_url}],
+            "tool_call_id": call.get("call_id"),
+            "additional_kwargs": {"type": "computer_call_output"},
+        }
+        if i == failed_index:
+            # Tool messages only accept a status of "success" or "error".
+            tool_message["status"] = "error"
+            tool_message["additional_kwargs"]["error"] = f"{type(error).__name__}: {error}"
+            tool_message["additional_kwargs"]["transient"] = transient
+        elif i > failed_index:
+            tool_message["status"] = "error"
+            tool_message["additional_kwargs"]["error"] = (
+                f"Not executed, because computer call {failed_call_id} failed."
+            )
+        tool_messages.append(tool_message)
+    return tool_messages
+
+
+async def _run_actions(
+    instance: AsyncInstance,
+    actions: Sequence[Dict[str, Any]],
+    retry_budget: RetryBudget,
+    configuration: Dict[str, Any],
+    completed: Optional[List[Dict[str, Any]]] = None,
+) -> Tuple[Optional[ComputerResponse], Optional[float]]:
+    """
+    Executes the actions in order, retrying transient errors, and only captures a
+    screenshot after the final action. If `completed` is given, each action is appended
+    to it once it has been executed, so a caller can tell which action failed.
+
+    Returns:
+        A tuple of the response to the final action, and the time spent on "wait" actions,
+        or None if there were none.
+    """
+    loop = asyncio.get_running_loop()
+    emit_timings = configuration.get("emit_timings")
+    wait_strategy = configuration.get("wait_strategy")
+    rate_limiter = configuration.get("scrapybara_rate_limiter")
+    computer_response: Optional[ComputerResponse] = None
+    wait_seconds: Optional[float] = None
+
+    for i, action in enumerate(actions):
+        started_at = loop.time()
+        # Only capture a screenshot after the final action.
+        screenshot = i == len(actions) - 1
+
+        async def attempt(action: Dict[str, Any] = action, screenshot: bool = screenshot):
+            if not (action.get("type") == "wait" and wait_strategy == "adaptive"):
+                # Adaptive waits acquire a request for every screenshot they poll.
+                await acquire_rate_limit(rate_limiter)
+            return await _execute_action(
+                instance, action, screenshot=screenshot, configuration=configuration
+            )
+
+        with span(
+            f"action.{action.get('type')}", {"screenshot": screenshot}, emit=emit_timings
+        ) as attributes:
+            retries = retry_budget.retries
+            # Actions which change the screen are only retried if they were rejected
+            # before being acted on, so they are never applied twice.
+            computer_response = await retry_budget.call(
+                attempt,
+                is_transient_error
+                if action.get("type") in IDEMPOTENT_ACTIONS
+                else is_rejected_error,
+            )
+            if retry_budget.retries > retries:
+                attributes["retries"] = retry_budget.retries - retries
+        if action.get("type") == "wait":
+            wait_seconds = (wait_seconds or 0.0) + loop.time() - started_at
+        if completed is not None:
+            completed.append(action)
+    return computer_response, wait_seconds
+
+
+def _needs_authentication(state: CUAState, configuration: Dict[str, Any]) -> bool:
+    auth_state_id = configuration.get("auth_state_id")
+    return (
+        configuration.get("environment") == "web"
+        and auth_state_id is not None
+        and state.get("authenticated_id") != auth_state_id
+    )
+
+
+def _get_retry_budget(state: CUAState, configuration: Dict[str, Any]) -> RetryBudget:
+    # The retry budget is per run, so only the retries since the run started count against it.
+    run_start = state.get("run_start") or {}
+    retries = (state.get("action_retries") or 0) - (run_start.get("action_retries") or 0)
+    return RetryBudget(
+        configuration.get("action_max_retries"),
+        configuration.get("action_retry_budget") - retries,
+    )
+
+
+def dispatch_computer_call(
+    computer_call: Dict[str, Any], state: CUAState, config: RunnableConfig
+) -> bool:
+    """
+    Starts executing a computer call before the model's response has finished streaming,
+    so the action doesn't wait on the rest of the response. take_computer_action picks up
+    the result, rather than executing the call again. The call is only dispatched if the
+    instance is ready to act on it, i.e. it is running, and authenticated if needed.
+
+    Args:
+        computer_call: The first computer call in the response.
+        state: The current state of the thread.
+        config: The configuration for the runnable.
+
+    Returns:
+        Whether the call was dispatched.
+    """
+    configuration = get_configuration_with_defaults(config)
+    instance_id = state.get("instance_id")
+    if (
+        not instance_id
+        or not state.get("stream_url")
+        or _needs_authentication(state, configuration)
+        or computer_call.get("pending_safety_checks")
+    ):
+        return False
+
+    retry_budget = _get_retry_budget(state, configuration)
+    action = _scale_action_coordinates(
+        computer_call.get("action"), configuration.get("screenshot_scale")
+    )
+
+    async def run() -> Tuple[Optional[ComputerResponse], Optional[float]]:
+        instance = await get_instance(instance_id, config)
+        return await _run_actions(instance, [action], retry_budget, configuration)
+
+    key = (instance_id, computer_call.get("call_id"))
+    _dispatched_calls[key] = (asyncio.create_task(run()), retry_budget)
+    return True
+
+
+def is_dispatched(instance_id: Optional[str], call_id: Optional[str]) -> bool:
+    """
+    Checks if a computer call was dispatched, and is waiting to be picked up.
+
+    Args:
+        instance_id: The ID of the instance the call would have been dispatched to.
+        call_id: The ID of the computer call.
+
+    Returns:
+        Whether the call was dispatched.
+    """
+    return (instance_id, call_id) in _dispatched_calls
+
+
+def discard_dispatched_call(instance_id: str, call_id: str) -> None:
+    """
+    Forgets a dispatched computer call which won't be picked up, e.g. because the model's
+    response failed part way through. The action is left to finish, since cancelling it
+    could leave it half applied.
+
+    Args:
+        instance_id: The ID of the instance the call was dispatched to.
+        call_id: The ID of the computer call.
+    """
+    dispatched = _dispatched_calls.pop((instance_id, call_id), None)
+    if dispatched is None:
+        return
+    task = dispatched[0]
+
+    def done(task: asyncio.Task) -> None:
+        _abandoned_calls.discard(task)
+        # Retrieve the error, so a failed action isn't reported as never retrieved.
+        if not task.cancelled():
+            task.exception()
+
+    _abandoned_calls.add(task)
+    task.add_done_callback(done)
+
+
+async def take_computer_action(state: CUAState, config: RunnableConfig) -> Dict[str, Any]:
+    """
+    Executes every computer call in the last message, in order, and captures a single
+    screenshot after the final action. Each computer call is paired with its own output.
 
     Args:
         state: The current state of the CUA agent.
@@ -61,107 +604,147 @@ def take_computer_action(state: CUAState, config: RunnableConfig) -> Dict[str, A
     instance_id = state.get("instance_id")
     if not instance_id:
         raise ValueError("Instance ID not found in state.")
-    instance = get_instance(instance_id, config)
+    instance = await get_instance(instance_id, config)
 
     configuration = get_configuration_with_defaults(config)
-    environment = configuration.get("environment")
     auth_state_id = configuration.get("auth_state_id")
     authenticated_id = state.get("authenticated_id")
 
-    if (
-        environment == "web"
-        and auth_state_id is not None
-        and (
-            (authenticated_id is None)
-            or (authenticated_id is not None and authenticated_id != auth_state_id)
-        )
-    ):
-        instance.authenticate(auth_state_id=auth_state_id)
+    if _needs_authentication(state, configuration):
+        await acquire_rate_limit(configuration.get("scrapybara_rate_limiter"))
+        await instance.authenticate(auth_state_id=auth_state_id)
         authenticated_id = auth_state_id
 
     stream_url: Optional[str] = state.get("stream_url")
     if not stream_url:
         # If the stream_url is not yet defined in state, fetch it, then write to the custom stream
         # so that it's made accessible to the client (or whatever is reading the stream) before any actions are taken.
-        stream_url_response: InstanceGetStreamUrlResponse = instance.get_stream_url()
+        await acquire_rate_limit(configuration.get("scrapybara_rate_limiter"))
+        stream_url_response: InstanceGetStreamUrlResponse = await instance.get_stream_url()
         stream_url = stream_url_response.stream_url
 
         writer = get_stream_writer()
         writer({"stream_url": stream_url})
 
-    output = tool_outputs[-1]
-    action = output.get("action")
-    tool_message: Optional[ToolMessage] = None
+    computer_calls = [output for output in tool_outputs if output.get("type") == "computer_call"]
+    # The first computer call may already have been started by call_model, while the
+    # response was streaming.
+    dispatched = _dispatched_calls.pop((instance.id, computer_calls[0].get("call_id")), None)
+    remaining_calls = computer_calls[1:] if dispatched is not None else computer_calls
+    scale = configuration.get("screenshot_scale")
+    action_groups = _merge_action_groups(
+        [_scale_action_coordinates(call.get("action"), scale) for call in remaining_calls]
+    )
+    actions = [action for action, _ in action_groups]
+    # The actions which have been executed, so a failure can be traced to its call.
+    completed: List[Dict[str, Any]] = []
+    dispatched_succeeded = False
+    tool_messages: List[Dict[str, Any]] = []
+    screenshot_update: Dict[str, Any] = {}
+    if dispatched is not None:
+        dispatched_task, retry_budget = dispatched
+    else:
+        retry_budget = _get_retry_budget(state, configuration)
+    emit_timings = configuration.get("emit_timings")
+    rate_limiter = configuration.get("scrapybara_rate_limiter")
 
     try:
         computer_response: Optional[ComputerResponse] = None
-        action_type = action.get("type")
-
-        if action_type == "click":
-            computer_response = instance.computer(
-                action="click_mouse",
-                button="middle" if action.get("button") == "wheel" else action.get("button"),
-                coordinates=[action.get("x"), action.get("y")],
+        wait_seconds: Optional[float] = None
+        if dispatched is not None:
+            computer_response, wait_seconds = await dispatched_task
+            dispatched_succeeded = True
+        if actions:
+            computer_response, remaining_wait_seconds = await _run_actions(
+                instance, actions, retry_budget, configuration, completed
             )
-        elif action_type == "double_click":
-            computer_response = instance.computer(
-                action="click_mouse",
-                button="left",
-                coordinates=[action.get("x"), action.get("y")],
-                num_clicks=2,
-            )
-        elif action_type == "drag":
-            computer_response = instance.computer(
-                action="drag_mouse",
-                path=[[point.get("x"), point.get("y")] for point in action.get("path")],
-            )
-        elif action_type == "keypress":
-            mapped_keys = [
-                CUA_KEY_TO_SCRAPYBARA_KEY.get(key.lower(), key.lower())
-                for key in action.get("keys")
-            ]
-            computer_response = instance.computer(action="press_key", keys=mapped_keys)
-        elif action_type == "move":
-            computer_response = instance.computer(
-                action="move_mouse", coordinates=[action.get("x"), action.get("y")]
-            )
-        elif action_type == "screenshot":
-            computer_response = instance.computer(action="take_screenshot")
-        elif action_type == "wait":
-            # Sleep for 2000ms (2 seconds)
-            time.sleep(2)
-            # Take a screenshot after waiting
-            computer_response = instance.computer(action="take_screenshot")
-        elif action_type == "scroll":
-            computer_response = instance.computer(
-                action="scroll",
-                delta_x=action.get("scroll_x") // 20,
-                delta_y=action.get("scroll_y") // 20,
-                coordinates=[action.get("x"), action.get("y")],
-            )
-        elif action_type == "type":
-            computer_response = instance.computer(action="type_text", text=action.get("text"))
-        else:
-            raise ValueError(f"Unknown computer action received: {action}")
+            if remaining_wait_seconds is not None:
+                wait_seconds = (wait_seconds or 0.0) + remaining_wait_seconds
 
-        if computer_response:
-            output_content = {
-                "type": "input_image",
-                "image_url": f"data:image/png;base64,{computer_response.base_64_image}",
-            }
-            tool_message = {
-                "role": "tool",
-                "content": [output_content],
-                "tool_call_id": output.get("call_id"),
-                "additional_kwargs": {"type": "computer_call_output"},
+        if computer_response is None or not computer_response.base_64_image:
+            with span("action.screenshot", {"screenshot": True}, emit=emit_timings):
+                computer_response = await retry_budget.call(
+                    lambda: _take_screenshot(instance, rate_limiter)
+                )
+
+        if not computer_response.base_64_image:
+            raise ValueError("Scrapybara did not return a screenshot.")
+
+        current_url_task: Optional[asyncio.Task] = None
+        if configuration.get("compaction_threshold") is not None and (
+            configuration.get("environment") == "web"
+        ):
+            # Fetched while the screenshot is processed, for the history log.
+            current_url_task = asyncio.create_task(_get_current_url(instance, rate_limiter))
+
+        last_call_id = computer_calls[-1].get("call_id")
+        with span(
+            "screenshot.process",
+            # The decoded size of the screenshot, without decoding it.
+            {"image_bytes": len(computer_response.base_64_image) * 3 // 4},
+            emit=emit_timings,
+        ):
+            last_tool_message, screenshot_update = await _build_computer_call_output(
+                computer_response.base_64_image, last_call_id, state, configuration
+            )
+        if wait_seconds is not None:
+            # Report how long the wait actually took, which varies with the wait strategy.
+            last_tool_message["additional_kwargs"]["wait_seconds"] = round(wait_seconds, 3)
+        current_url = await current_url_task if current_url_task is not None else None
+        if current_url:
+            last_tool_message["additional_kwargs"]["current_url"] = current_url
+        # Every computer call must be paired with an output, so the earlier calls share
+        # the screenshot taken after the final action.
+        tool_messages = [
+            {
+                **last_tool_message,
+                "tool_call_id": call.get("call_id"),
+                "additional_kwargs": {
+                    "type": "computer_call_output",
+                    "duplicate_of": last_call_id,
+                },
             }
+            for call in computer_calls[:-1]
+        ]
+        tool_messages.append(last_tool_message)
     except Exception as e:
-        print(f"\n\nFailed to execute computer call: {e}\n\n")
-        print(f"Computer call details: {output}\n\n")
+        screenshot_update = {}
+        transient = is_transient_error(e)
+        if not transient:
+            # The instance may have been stopped or be unhealthy, so don't reuse the cached
+            # handle.
+            invalidate_instance(instance.id)
+        offset = len(computer_calls) - len(remaining_calls)
+        if offset and not dispatched_succeeded:
+            # The dispatched first call failed.
+            failed_index = 0
+        elif len(completed) < len(actions):
+            failed_index = offset + action_groups[len(completed)][1]
+        else:
+            # Every action was executed, but the screenshot after the last one failed.
+            failed_index = len(computer_calls) - 1
+        logger.warning(
+            "Failed to execute computer call %s: %r", computer_calls[failed_index].get("call_id"), e
+        )
+        # Pair every computer call with an output, reporting which call failed, so the
+        # model can see the current screen and decide what to do, instead of the run ending.
+        tool_messages = await _build_failure_outputs(
+            instance, computer_calls, failed_index, e, transient, configuration
+        )
+
+    if retry_budget.retries:
+        # Report the time spent retrying, on the output and as a running total in state.
+        tool_messages[-1]["additional_kwargs"]["retry_seconds"] = round(retry_budget.seconds, 3)
+        screenshot_update = {
+            **screenshot_update,
+            "action_retries": retry_budget.retries,
+            "action_retry_seconds": retry_budget.seconds,
+        }
 
     return {
-        "messages": tool_message if tool_message else None,
+        "messages": tool_messages,
         "instance_id": instance.id,
         "stream_url": stream_url,
         "authenticated_id": authenticated_id,
+        **screenshot_update,
     }
@@ -0,0 +1,179 @@
+import copy
+import json
+import threading
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, AnyMessage
+
+from .images import ascreenshot_hash, find_similar_hash
+from .utils import is_computer_tool_call
+
+# Marks AI messages which were replayed from a recorded trajectory, rather than returned by
+# the model. Replayed messages have no response ID to chain the next request from.
+REPLAYED_KEY = "replayed"
+
+
+class TrajectoryCache:
+    """
+    Records the computer calls the model makes for a task, keyed by the task, the step,
+    and the perceptual hash of the screenshot the model saw, so repeat runs of the same
+    task can replay them without calling the model. A step is only replayed if the screen
+    looks the same as when it was recorded, so runs which diverge from the recording fall
+    back to the model.
+
+    Only responses containing computer calls are recorded. Final answers always come from
+    the model, since they usually depend on what is on the screen.
+
+    Args:
+        max_distance: The number of bits the perceptual hash of a screen may differ from the
+            recorded one by, and still be replayed, so small changes such as a clock or a
+            blinking cursor don't prevent replay. Default 8.
+    """
+
+    def __init__(self, max_distance: int = 8) -> None:
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        # Maps each task and step to the responses recorded for it, by screenshot hash.
+        self._entries: Dict[Tuple[str, int], Dict[str, Dict[str, Any]]] = {}
+
+    def get(
+        self, task_key: str, step: int, screenshot_hash: Optional[str]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Gets the recorded response for a step.
+
+        Args:
+            task_key: The key identifying the task.
+            step: The index of the model call in the run, starting at 0.
+            screenshot_hash: The hash of the latest screenshot, or None for the first step.
+
+        Returns:
+            The recorded response, with "content", "tool_outputs" and "reasoning" keys, or
+            None if the step was not recorded from a similar screen.
+        """
+        with self._lock:
+            entries = self._entries.get((task_key, step)) or {}
+            if screenshot_hash is None:
+                entry = entries.get("")
+            else:
+                match = find_similar_hash(screenshot_hash, entries, self.max_distance)
+                entry = entries.get(match) if match is not None else None
+        return copy.deepcopy(entry)
+
+    def put(
+        self, task_key: str, step: int, screenshot_hash: Optional[str], message: AIMessage
+    ) -> None:
+        """
+        Records the model's response for a step, if it contains computer calls.
+
+        Args:
+            task_key: The key identifying the task.
+            step: The index of the model call in the run, starting at 0.
+            screenshot_hash: The hash of the latest screenshot, or None for the first step.
+            message: The model's response.
+        """
+        tool_outputs = message.additional_kwargs.get("tool_outputs")
+        if not is_computer_tool_call(tool_outputs):
+            return
+        # Reasoning items are kept, as requests which send the full history must include
+        # the reasoning item each computer call was made with.
+        entry = {
+            "content": message.content,
+            "tool_outputs": copy.deepcopy(tool_outputs),
+            "reasoning": copy.deepcopy(message.additional_kwargs.get("reasoning")),
+        }
+        with self._lock:
+            self._entries.setdefault((task_key, step), {})[screenshot_hash or ""] = entry
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(entries) for entries in self._entries.values())
+
+    def save(self, path: str) -> None:
+        """
+        Writes the recorded trajectories to a JSON file.
+
+        Args:
+            path: The path of the file to write.
+        """
+        with self._lock:
+            entries = [
+                {"task_key": task_key, "step": step, "screenshot_hash": screenshot_hash, **entry}
+                for (task_key, step), entries in self._entries.items()
+                for screenshot_hash, entry in entries.items()
+            ]
+        with open(path, "w") as f:
+            json.dump(entries, f)
+
+    @classmethod
+    def load(cls, path: str) -> "TrajectoryCache":
+        """
+        Reads recorded trajectories from a JSON file written by `save`.
+
+        Args:
+            path: The path of the file to read.
+
+        Returns:
+            The trajectory cache.
+        """
+        cache = cls()
+        with open(path) as f:
+            for entry in json.load(f):
+                key = (entry.pop("task_key"), entry.pop("step"))
+                cache._entries.setdefault(key, {})[entry.pop("screenshot_hash")] = entry
+        return cache
+
+
+async def ascreen_hash(data: bytes) -> str:
+    """
+    Hashes a screenshot for the trajectory cache. Screens are compared perceptually, so
+    screenshots which differ slightly from the recording still match. Falls back to an
+    exact hash if Pillow is not installed.
+
+    Args:
+        data: The screenshot bytes.
+
+    Returns:
+        The hash, prefixed with the mode it was computed with.
+    """
+    try:
+        return await ascreenshot_hash(data, "perceptual")
+    except ImportError:
+        return await ascreenshot_hash(data, "exact")
+
+
+def get_step(messages: Sequence[AnyMessage], run_start: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Gets the index of the next model call in a run, which is the number of AI messages
+    after the human message the run started with. Each run on a thread is a new attempt at
+    a task, so its steps are counted from 0.
+
+    Args:
+        messages: The messages in the thread.
+        run_start: The start of the run, as recorded in state. If None, or the run's first
+            message isn't found, the AI messages in the whole thread are counted.
+
+    Returns:
+        The step index.
+    """
+    start = 0
+    message_id = (run_start or {}).get("message_id")
+    if message_id is not None:
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i].id == message_id:
+                start = i + 1
+                break
+    return sum(1 for i in range(start, len(messages)) if getattr(messages[i], "type", None) == "ai")
+
+
+def is_replayed(message: AnyMessage) -> bool:
+    """
+    Checks if an AI message was replayed from a recorded trajectory.
+
+    Args:
+        message: The message to check.
+
+    Returns:
+        True if the message was replayed, false otherwise.
+    """
+    return bool(getattr(message, "additional_kwargs", {}).get(REPLAYED_KEY))
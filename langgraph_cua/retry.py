@@ -0,0 +1,121 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+from scrapybara.core.api_error import ApiError
+
+T = TypeVar("T")
+
+# Status codes worth retrying, since they are caused by load or a temporary outage rather
+# than by the request itself.
+TRANSIENT_STATUS_CODES = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+
+# Status codes which mean the request was turned away before it was acted on, so it is safe
+# to retry even if it is not idempotent.
+REJECTED_STATUS_CODES = frozenset({425, 429, 503})
+
+# The delay before the first retry, doubling with each attempt up to the maximum.
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 8.0
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Checks if an error is transient, meaning the same request may succeed if retried.
+
+    Args:
+        error: The error to check.
+
+    Returns:
+        True if the error is transient, false if it is permanent.
+    """
+    if isinstance(error, ApiError):
+        return error.status_code in TRANSIENT_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError, ConnectionError))
+
+
+def is_rejected_error(error: BaseException) -> bool:
+    """
+    Checks if an error means the request was rejected before it was acted on, such as when
+    rate limited, or when the connection could not be opened.
+
+    Args:
+        error: The error to check.
+
+    Returns:
+        True if the request was not acted on, false if it may have been.
+    """
+    if isinstance(error, ApiError):
+        return error.status_code in REJECTED_STATUS_CODES
+    return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Gets how long to wait before a retry, using exponential backoff with full jitter, so
+    clients which failed together don't retry together.
+
+    Args:
+        attempt: The number of the retry, starting at 0.
+
+    Returns:
+        The delay, in seconds.
+    """
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2**attempt))
+
+
+class RetryBudget:
+    """
+    Limits how many times requests may be retried, per request and in total, and keeps
+    count of the retries made and the time spent on them.
+
+    Args:
+        max_retries: The maximum number of times to retry a single request.
+        remaining: The number of retries left in total.
+    """
+
+    def __init__(self, max_retries: int, remaining: int):
+        self.max_retries = max_retries
+        self.remaining = remaining
+        self.retries = 0
+        self.seconds = 0.0
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        should_retry: Callable[[BaseException], bool] = is_transient_error,
+    ) -> T:
+        """
+        Calls `fn`, retrying with backoff if it raises an error which `should_retry`
+        accepts, until it succeeds or the budget runs out.
+
+        Args:
+            fn: The function to call.
+            should_retry: Checks if an error should be retried.
+
+        Returns:
+            The result of `fn`.
+
+        Raises:
+            The last error raised by `fn`, if it can't be retried.
+        """
+        attempt = 0
+        started_at: Optional[float] = None
+        try:
+            while True:
+                try:
+                    return await fn()
+                except Exception as e:
+                    if attempt >= self.max_retries or self.remaining <= 0 or not should_retry(e):
+                        raise
+                if started_at is None:
+                    started_at = time.perf_counter()
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+                self.retries += 1
+                self.remaining -= 1
+        finally:
+            if started_at is not None:
+                self.seconds += time.perf_counter() - started_at
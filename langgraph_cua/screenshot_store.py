@@ -0,0 +1,307 @@
+import asyncio
+import base64
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AnyMessage
+
+# Screenshot references are formatted like data URLs, with a content hash in place of the
+# image data, e.g. "screenshot-ref:image/png;sha256,<hex digest>".
+SCREENSHOT_REF_PREFIX = "screenshot-ref:"
+
+
+def make_screenshot_ref(key: str, media_type: str = "image/png") -> str:
+    """
+    Builds a reference to a screenshot held in a screenshot store.
+
+    Args:
+        key: The content hash of the screenshot, as returned by `ScreenshotStore.put`.
+        media_type: The media type of the screenshot.
+
+    Returns:
+        The screenshot reference.
+    """
+    return f"{SCREENSHOT_REF_PREFIX}{media_type};sha256,{key}"
+
+
+def is_screenshot_ref(url: object) -> bool:
+    """
+    Checks if the given image URL is a screenshot reference.
+
+    Args:
+        url: The image URL to check.
+
+    Returns:
+        True if the URL is a screenshot reference, false otherwise.
+    """
+    return isinstance(url, str) and url.startswith(SCREENSHOT_REF_PREFIX)
+
+
+def parse_screenshot_ref(ref: str) -> Tuple[str, str]:
+    """
+    Parses a screenshot reference.
+
+    Args:
+        ref: The screenshot reference to parse.
+
+    Returns:
+        A tuple of the media type and the content hash of the screenshot.
+
+    Raises:
+        ValueError: If the reference is invalid.
+    """
+    if not is_screenshot_ref(ref):
+        raise ValueError(f"Invalid screenshot reference: {ref}")
+    media_type, _, key = ref[len(SCREENSHOT_REF_PREFIX) :].partition(";sha256,")
+    if not media_type or not key:
+        raise ValueError(f"Invalid screenshot reference: {ref}")
+    return media_type, key
+
+
+class ScreenshotStore(ABC):
+    """
+    A content-addressed store for screenshots. Screenshots are keyed by the SHA-256
+    hash of their bytes, so storing the same screenshot twice only keeps one copy.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Gets a screenshot by its key.
+
+        Args:
+            key: The content hash of the screenshot.
+
+        Returns:
+            The screenshot bytes, or None if the screenshot is not in the store.
+        """
+
+    @abstractmethod
+    def _set(self, key: str, data: bytes) -> None:
+        """Writes the screenshot bytes under the given key."""
+
+    @abstractmethod
+    def __contains__(self, key: object) -> bool: ...
+
+    def put(self, data: bytes) -> str:
+        """
+        Adds a screenshot to the store.
+
+        Args:
+            data: The screenshot bytes.
+
+        Returns:
+            The content hash of the screenshot, which can be used to get it back.
+        """
+        key = hashlib.sha256(data).hexdigest()
+        if key not in self:
+            self._set(key, data)
+        return key
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        """Async version of `get`."""
+        return self.get(key)
+
+    async def aput(self, data: bytes) -> str:
+        """Async version of `put`."""
+        return self.put(data)
+
+
+class InMemoryScreenshotStore(ScreenshotStore):
+    """A screenshot store which keeps screenshots in a dictionary, in memory."""
+
+    def __init__(self) -> None:
+        self._data: Dict[str, bytes] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._data.get(key)
+
+    def _set(self, key: str, data: bytes) -> None:
+        self._data[key] = data
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class LocalFileScreenshotStore(ScreenshotStore):
+    """
+    A screenshot store which writes each screenshot to its own file on the local filesystem.
+
+    Args:
+        root_path: The directory to write screenshots to. Created if it does not exist.
+    """
+
+    def __init__(self, root_path: str) -> None:
+        self.root_path = root_path
+        os.makedirs(root_path, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        # Shard files by the first two characters of their hash to keep directories small.
+        return os.path.join(self.root_path, key[:2], key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _set(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first, so readers never see a partially written screenshot.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and os.path.exists(self._path(key))
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, data: bytes) -> str:
+        return await asyncio.to_thread(self.put, data)
+
+
+class MmapScreenshotStore(ScreenshotStore):
+    """
+    A screenshot store which appends screenshots to a single file, and reads them back
+    through a memory map. The index is rebuilt from the file when it is reopened.
+
+    Each record is laid out as the 32 byte SHA-256 digest, the length of the data as an
+    8 byte big-endian integer, then the data itself.
+
+    Args:
+        path: The path to the file to store screenshots in. Created if it does not exist.
+    """
+
+    _HEADER = struct.Struct(">32sQ")
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._file = open(path, "a+b")
+        self._map: Optional[mmap.mmap] = None
+        self._load_index()
+
+    def _load_index(self) -> None:
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            return
+        self._remap()
+        offset = 0
+        while offset + self._HEADER.size <= size:
+            digest, length = self._HEADER.unpack_from(self._map, offset)
+            if offset + self._HEADER.size + length > size:
+                break
+            self._index[digest.hex()] = (offset + self._HEADER.size, length)
+            offset += self._HEADER.size + length
+
+        if offset < size:
+            # Drop a trailing record which was only partially written, so new records
+            # are appended right after the last complete one.
+            self._map.close()
+            self._map = None
+            self._file.truncate(offset)
+
+    def _remap(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            offset, length = entry
+            if self._map is None or offset + length > len(self._map):
+                self._remap()
+            return self._map[offset : offset + length]
+
+    def _set(self, key: str, data: bytes) -> None:
+        with self._lock:
+            if key in self._index:
+                return
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell() + self._HEADER.size
+            self._file.write(self._HEADER.pack(bytes.fromhex(key), len(data)))
+            self._file.write(data)
+            self._file.flush()
+            self._index[key] = (offset, len(data))
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, data: bytes) -> str:
+        return await asyncio.to_thread(self.put, data)
+
+    def close(self) -> None:
+        """Closes the memory map and the underlying file."""
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._file.close()
+
+
+async def rehydrate_screenshots(
+    messages: Sequence[AnyMessage], store: ScreenshotStore
+) -> List[AnyMessage]:
+    """
+    Replaces screenshot references in tool messages with the base64 encoded images they
+    point to, so the messages can be sent to the model. Messages without references are
+    returned as is.
+
+    Args:
+        messages: The messages to rehydrate.
+        store: The screenshot store the references point into.
+
+    Returns:
+        The rehydrated messages.
+
+    Raises:
+        ValueError: If a referenced screenshot is not in the store.
+    """
+    rehydrated: List[AnyMessage] = []
+    for message in messages:
+        content = getattr(message, "content", None)
+        if getattr(message, "type", None) != "tool" or not isinstance(content, list):
+            rehydrated.append(message)
+            continue
+
+        new_content = []
+        for block in content:
+            image_url = block.get("image_url") if isinstance(block, dict) else None
+            if is_screenshot_ref(image_url):
+                media_type, key = parse_screenshot_ref(image_url)
+                data = await store.aget(key)
+                if data is None:
+                    raise ValueError(f"Screenshot not found in the screenshot store: {key}")
+                encoded = base64.b64encode(data).decode()
+                block = {**block, "image_url": f"data:{media_type};base64,{encoded}"}
+            new_content.append(block)
+
+        if new_content == content:
+            rehydrated.append(message)
+        else:
+            rehydrated.append(message.model_copy(update={"content": new_content}))
+    return rehydrated
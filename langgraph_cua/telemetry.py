@@ -0,0 +1,140 @@
+import bisect
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional
+
+from langgraph.config import get_stream_writer
+
+# Upper bounds of the latency histogram buckets, in milliseconds. The last bucket is unbounded.
+HISTOGRAM_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_tracer: Any = None
+
+
+def _get_tracer() -> Optional[Any]:
+    # OpenTelemetry is optional. Without an SDK configured, the API returns a no-op tracer.
+    global _tracer
+    if _tracer is None:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            _tracer = False
+        else:
+            _tracer = trace.get_tracer("langgraph_cua")
+    return _tracer or None
+
+
+def _write_event(event: Dict[str, Any]) -> None:
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        # Not running inside the graph (e.g. a node called directly), so there is no stream.
+        return
+    writer(event)
+
+
+@contextmanager
+def span(
+    name: str, attributes: Optional[Dict[str, Any]] = None, emit: bool = False
+) -> Iterator[Dict[str, Any]]:
+    """
+    Times the enclosed block. The span is recorded as an OpenTelemetry span if the
+    `opentelemetry-api` package is installed, and written to the graph's custom stream as
+    `{"span": {"name": ..., "duration_ms": ..., "attributes": {...}}}` if `emit` is True.
+
+    Args:
+        name: The name of the span, e.g. "call_model.request".
+        attributes: Attributes to record on the span.
+        emit: Whether to write the span to the custom stream.
+
+    Yields:
+        The span's attributes, which the block can add to (e.g. response sizes).
+    """
+    attributes = dict(attributes or {})
+    tracer = _get_tracer()
+    otel_context = tracer.start_as_current_span(name) if tracer is not None else nullcontext()
+    start = time.perf_counter()
+    with otel_context as otel_span:
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes["error"] = type(e).__name__
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            if otel_span is not None:
+                otel_span.set_attributes(
+                    {
+                        key: value
+                        for key, value in attributes.items()
+                        if isinstance(value, (str, bool, int, float))
+                    }
+                )
+            if emit:
+                _write_event(
+                    {
+                        "span": {
+                            "name": name,
+                            "duration_ms": round(duration_ms, 3),
+                            "attributes": attributes,
+                        }
+                    }
+                )
+
+
+class LatencyHistogram:
+    """
+    Aggregates the spans written to the custom stream into a latency histogram per span
+    name, to find where the time in a run goes.
+
+    ```python
+    histogram = LatencyHistogram()
+    async for chunk in graph.astream(inputs, stream_mode="custom"):
+        histogram.record(chunk)
+    print(histogram.summary())
+    ```
+    """
+
+    def __init__(self) -> None:
+        self._durations: Dict[str, List[float]] = {}
+
+    def record(self, event: Any) -> None:
+        """
+        Records a span event. Other custom stream events are ignored.
+
+        Args:
+            event: A chunk from the custom stream.
+        """
+        span_event = event.get("span") if isinstance(event, dict) else None
+        if not isinstance(span_event, dict):
+            return
+        bisect.insort(self._durations.setdefault(span_event["name"], []), span_event["duration_ms"])
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Summarizes the recorded spans.
+
+        Returns:
+            A mapping of span name to its count, total, mean, percentiles and maximum in
+            milliseconds, and its counts per bucket of `HISTOGRAM_BUCKETS_MS`.
+        """
+
+        def percentile(durations: List[float], p: float) -> float:
+            return durations[min(len(durations) - 1, int(p * len(durations)))]
+
+        summary = {}
+        for name, durations in self._durations.items():
+            buckets = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+            for duration in durations:
+                buckets[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, duration)] += 1
+            summary[name] = {
+                "count": len(durations),
+                "total_ms": sum(durations),
+                "mean_ms": sum(durations) / len(durations),
+                "p50_ms": percentile(durations, 0.5),
+                "p90_ms": percentile(durations, 0.9),
+                "p99_ms": percentile(durations, 0.99),
+                "max_ms": durations[-1],
+                "buckets": buckets,
+            }
+        return summary
@@ -0,0 +1,181 @@
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+
+
+def _http2_available() -> bool:
+    # HTTP/2 support is optional, and needs the h2 package.
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _CountingTransport(httpx.AsyncHTTPTransport):
+    """An HTTP transport which counts requests, and whether each opened a new connection."""
+
+    def __init__(self, owner: "HTTPTransport", **kwargs: Any):
+        super().__init__(**kwargs)
+        self._owner = owner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        opened = False
+        parent_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            nonlocal opened
+            if event_name == "connection.connect_tcp.complete":
+                opened = True
+            if parent_trace is not None:
+                await parent_trace(event_name, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        self._owner._record_start()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            self._owner._record_end(None)
+            raise
+        self._owner._record_end(opened)
+        return response
+
+    def connections(self) -> Dict[str, int]:
+        open_connections = idle_connections = 0
+        for connection in getattr(self._pool, "connections", ()):
+            open_connections += 1
+            idle_connections += connection.is_idle()
+        return {"open": open_connections, "idle": idle_connections}
+
+
+class HTTPTransport:
+    """
+    Long-lived async HTTP clients, shared by the requests the agent makes to OpenAI and to
+    Scrapybara, so connections are kept alive and reused across steps and threads rather
+    than opened for every request. If the h2 package is installed
+    (`pip install "langgraph-cua[http2]"`), requests to the same host are multiplexed over
+    HTTP/2 connections.
+
+    Connection pools are bound to the event loop they were created on, so one client is
+    kept per event loop.
+
+    ```python
+    http_transport = HTTPTransport(max_connections=200)
+    graph = create_cua(http_transport=http_transport)
+    ...
+    print(http_transport.stats())
+    ```
+
+    Args:
+        http2: Whether to use HTTP/2, if the h2 package is installed. Default True.
+        max_connections: The maximum number of connections to keep open per event loop.
+        max_keepalive_connections: The maximum number of idle connections to keep alive.
+        keepalive_expiry: How long an idle connection is kept alive, in seconds.
+        timeout: The timeout for each request, in seconds. Connecting times out after
+            `connect_timeout` seconds.
+        connect_timeout: The timeout for opening a connection, in seconds.
+    """
+
+    def __init__(
+        self,
+        *,
+        http2: bool = True,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 50,
+        keepalive_expiry: float = 60.0,
+        timeout: float = 600.0,
+        connect_timeout: float = 10.0,
+    ):
+        self.http2 = http2 and _http2_available()
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._lock = threading.Lock()
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._transports: "weakref.WeakSet[_CountingTransport]" = weakref.WeakSet()
+        self._in_flight = 0
+        self._stats = {
+            "requests": 0,
+            "connections_opened": 0,
+            "connections_reused": 0,
+            "errors": 0,
+            "peak_in_flight": 0,
+        }
+
+    def get_client(self) -> httpx.AsyncClient:
+        """
+        Gets the shared client for the running event loop, creating it if needed.
+
+        Returns:
+            The async HTTP client.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None or client.is_closed:
+                transport = _CountingTransport(self, http2=self.http2, limits=self.limits)
+                self._transports.add(transport)
+                client = self._clients[loop] = httpx.AsyncClient(
+                    transport=transport, timeout=self.timeout, follow_redirects=True
+                )
+        return client
+
+    async def aclose(self) -> None:
+        """Closes the client for the running event loop, and every connection it holds."""
+        with self._lock:
+            client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the number of requests made, how many of them opened a new connection, reused
+        one, or failed, and how busy the connection pools are.
+
+        Returns:
+            The transport statistics. `pool_utilization` is the fraction of the maximum
+            connections currently in use, and `reuse_ratio` the fraction of completed requests
+            which reused a connection.
+        """
+        open_connections = idle_connections = 0
+        for transport in list(self._transports):
+            connections = transport.connections()
+            open_connections += connections["open"]
+            idle_connections += connections["idle"]
+
+        with self._lock:
+            stats = {**self._stats, "in_flight": self._in_flight}
+        max_connections = self.limits.max_connections or 0
+        completed = stats["connections_opened"] + stats["connections_reused"]
+        return {
+            **stats,
+            "http2": self.http2,
+            "open_connections": open_connections,
+            "idle_connections": idle_connections,
+            "pool_utilization": (
+                (open_connections - idle_connections) / max_connections if max_connections else 0.0
+            ),
+            "reuse_ratio": stats["connections_reused"] / completed if completed else 0.0,
+        }
+
+    def _record_start(self) -> None:
+        with self._lock:
+            self._in_flight += 1
+            self._stats["requests"] += 1
+            self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._in_flight)
+
+    def _record_end(self, opened: Optional[bool]) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if opened is None:
+                self._stats["errors"] += 1
+            else:
+                self._stats["connections_opened" if opened else "connections_reused"] += 1
@@ -1,10 +1,20 @@
+import operator
 import os
-from typing import Annotated, Any, Dict, List, Literal, Optional, TypedDict, Union
+from typing import TYPE_CHECKING, Annotated, Any, Dict, List, Literal, Optional, TypedDict, Union
 
 from langchain_core.messages import AnyMessage, SystemMessage
+from langchain_core.rate_limiters import BaseRateLimiter
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import add_messages
 
+from langgraph_cua.messages import append_messages
+
+if TYPE_CHECKING:
+    from langgraph_cua.replay import TrajectoryCache
+    from langgraph_cua.screenshot_store import ScreenshotStore
+    from langgraph_cua.transport import HTTPTransport
+    from langgraph_cua.vm_pool import VMPool
+
 
 class Output(TypedDict):
     """
@@ -43,6 +53,20 @@ class ComputerCallOutput(TypedDict):
     ]  # Status of the message input
 
 
+def merge_dicts(left: Optional[Dict[str, Any]], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merges two dictionaries, with values in the right dictionary taking precedence.
+
+    Args:
+        left: The existing dictionary.
+        right: The dictionary to merge in.
+
+    Returns:
+        The merged dictionary.
+    """
+    return {**(left or {}), **(right or {})}
+
+
 class CUAState(TypedDict):
     """State schema for the computer use agent.
 
@@ -52,12 +76,62 @@ class CUAState(TypedDict):
 
         stream_url: The URL to the live-stream of the virtual machine.
         authenticated_id: The ID of the auth state currently in use.
+        screenshot_hashes: Maps the hash of each distinct screenshot to the call_id of the
+            computer call output it was first seen in. Only populated if deduplication is enabled.
+        last_screenshot_hash: The hash of the most recent screenshot.
+        screen_hash: The perceptual hash of the most recent screenshot, for matching recorded
+            trajectories. Only populated if a trajectory cache is configured.
+        action_retries: The number of times computer actions have been retried in this thread.
+        action_retry_seconds: The time spent retrying computer actions in this thread.
+        input_tokens: The input tokens used by model calls in this thread.
+        output_tokens: The output tokens used by model calls in this thread.
+        cached_tokens: The input tokens which were read from the prompt cache in this thread.
+        screenshot_bytes: The bytes of screenshots sent to the model in this thread.
+        run_seconds: The time spent running the graph's steps in this thread.
+        vm_seconds: The time spent running steps while the thread had an instance.
+        run_start: The usage and action retries counted in the thread when the current run
+            started, which the run's budgets are counted from, along with the ID of the human
+            message which started it, and when it started, as a Unix timestamp.
+        budget_exceeded: The budget which was used up, if the run was stopped because of it,
+            e.g. "max_input_tokens".
+        history_log: One line for each step of the history which has been compacted,
+            describing its actions, the URL it ended on, and what the model observed. Only
+            populated if compaction is enabled.
+        compacted_through: The ID of the last message covered by the history log.
     """
 
     messages: Annotated[list[AnyMessage], add_messages] = []
     instance_id: Annotated[Optional[str], None] = None
     stream_url: Annotated[Optional[str], None] = None
     authenticated_id: Annotated[Optional[str], None] = None
+    screenshot_hashes: Annotated[Dict[str, str], merge_dicts] = {}
+    last_screenshot_hash: Annotated[Optional[str], None] = None
+    screen_hash: Annotated[Optional[str], None] = None
+    action_retries: Annotated[int, operator.add] = 0
+    action_retry_seconds: Annotated[float, operator.add] = 0.0
+    input_tokens: Annotated[int, operator.add] = 0
+    output_tokens: Annotated[int, operator.add] = 0
+    cached_tokens: Annotated[int, operator.add] = 0
+    screenshot_bytes: Annotated[int, operator.add] = 0
+    run_seconds: Annotated[float, operator.add] = 0.0
+    vm_seconds: Annotated[float, operator.add] = 0.0
+    run_start: Annotated[Optional[Dict[str, Any]], None] = None
+    budget_exceeded: Annotated[Optional[str], None] = None
+    history_log: Annotated[List[str], operator.add] = []
+    compacted_through: Annotated[Optional[str], None] = None
+
+
+class CUAAppendState(CUAState):
+    """State schema for the computer use agent, which merges messages with the
+    append-optimized `append_messages` reducer. The computer use agent only ever appends
+    messages, so this behaves the same as `CUAState`, but each step only converts and
+    checks the new messages, rather than the whole history.
+
+    Attributes:
+        messages: The messages between the user and assistant.
+    """
+
+    messages: Annotated[list[AnyMessage], append_messages] = []
 
 
 class CUAConfiguration(TypedDict):
@@ -77,6 +151,78 @@ class CUAConfiguration(TypedDict):
         environment: The environment to use. Default is "web".
         prompt: The initial prompt to use for the conversation. Will
             be passed as a system message
+        screenshot_store: A store to keep screenshots in. If defined, messages in state will
+            hold references to screenshots in the store instead of the base64 encoded images,
+            which are only loaded when sending the messages to the model. Default None.
+        screenshot_retention: The number of most recent screenshots to send to the model when
+            the full message history is sent (e.g. when 'zdr_enabled' is True). Older screenshots
+            are replaced with a tiny placeholder image. If None, all screenshots are sent.
+            Default None.
+        screenshot_format: The format to send screenshots to the model in. One of "png",
+            "jpeg", or "webp". Formats other than "png" require Pillow. Default "png".
+        screenshot_quality: The encoding quality for "jpeg" and "webp" screenshots, from 1 to 100.
+            Default 80.
+        screenshot_scale: The factor to resize screenshots by before sending them to the model,
+            between 0 and 1. Coordinates in the model's actions are scaled back to the full size
+            display. Values other than 1 require Pillow. Default 1.
+        screenshot_dedup: How to detect repeated screenshots. "exact" matches screenshots with
+            identical bytes, while "perceptual" matches screenshots which look the same, and
+            requires Pillow. Exact repeats reuse the earlier image, while perceptual
+            matches keep their own, and only the newest is sent to the model. Default "off".
+        screenshot_dedup_threshold: The number of bits two perceptual hashes may differ by and
+            still be considered the same screen. Default 0.
+        vm_pool: A pool of warm instances to lease from, instead of starting a new instance for
+            each thread. The instance is released back to the pool when the run ends. Default None.
+        speculative_provisioning: Whether to start the instance at the same time as the first model
+            call, instead of after it. If the model finishes without using the computer, the
+            instance is stopped, or released back to the VM pool. Default False.
+        wait_strategy: How to handle the model's "wait" action. "fixed" sleeps for 2 seconds, while
+            "adaptive" polls screenshots until the screen has stopped changing. Default "fixed".
+        wait_min_seconds: The minimum time an adaptive wait takes. Default 0.25.
+        wait_max_seconds: The maximum time an adaptive wait takes, even if the screen is still
+            changing. Default 5.
+        wait_stable_seconds: How long the screen must stay the same for an adaptive wait to end.
+            Default 0.5.
+        emit_timings: Whether to write timing spans for model calls, instance start-up, and computer
+            actions to the custom stream. Spans are also recorded with OpenTelemetry if it is
+            installed, regardless of this setting. Default False.
+        trajectory_cache: A cache to record the model's computer calls in, keyed by 'task_key', the
+            step, and the perceptual hash of the screenshot the model saw. Default None.
+        task_key: The key identifying the task being run, for the trajectory cache. Runs of the
+            same task should use the same key. Default None.
+        trajectory_mode: "record" to only record computer calls in the trajectory cache, or
+            "replay" to also replay recorded computer calls when the screen matches the
+            recording, instead of calling the model. Default "replay".
+        model_rate_limiter: A rate limiter shared by every request to the model, e.g. an
+            'InMemoryRateLimiter' from 'langchain_core.rate_limiters'. Default None.
+        scrapybara_rate_limiter: A rate limiter shared by every request to Scrapybara. Default None.
+        action_max_retries: The maximum number of times to retry a computer action which failed
+            with a transient error, such as a timeout or a 503. Actions which change the screen
+            are only retried if the request was rejected before it was acted on. Default 3.
+        action_retry_budget: The maximum number of retries across every action in a run.
+            Default 10.
+        http_transport: Shared HTTP clients to send requests to OpenAI and Scrapybara through,
+            so connections are kept alive and reused across steps and threads. Default None.
+        model_streaming: How to receive the model's response. "off" waits for the whole response,
+            "stream" streams it, writing each chunk to the custom stream as
+            `{"model_output": chunk}`, and "dispatch" also starts the first computer call as
+            soon as it has been received, before the rest of the response. Default "off".
+        max_input_tokens: The most input tokens the model may use in a run, before the run
+            is stopped. Default None.
+        max_screenshot_bytes: The most bytes of screenshots which may be sent to the model in
+            a run. Default None.
+        max_run_seconds: The most time a run may take from when it started, in seconds.
+            Default None.
+        max_vm_seconds: The most time a run's steps may take while the thread has an
+            instance, in seconds. Default None.
+        stable_prefix: Whether to keep the start of each request the same from turn to turn
+            when the full message history is sent, so the model provider's prompt cache can be
+            reused. Screenshots outside 'screenshot_retention' are then replaced in blocks,
+            rather than one per turn. Default False.
+        compaction_threshold: The estimated input tokens a request may use when the full
+            message history is sent, before the oldest steps are folded into a short text log
+            of their actions, URLs, and observations. If None, the history is never
+            compacted. Default None.
     """
 
     scrapybara_api_key: Optional[str]  # API key for Scrapybara
@@ -87,6 +233,35 @@ class CUAConfiguration(TypedDict):
         Literal["web", "ubuntu", "windows"]
     ]  # The environment to use. Default is "web".
     prompt: Optional[Union[str, SystemMessage]]  # The initial prompt to use for the conversation
+    screenshot_store: Optional["ScreenshotStore"]  # The store to keep screenshots in.
+    screenshot_retention: Optional[int]  # The number of most recent screenshots to send.
+    screenshot_format: Optional[Literal["png", "jpeg", "webp"]]  # Default "png".
+    screenshot_quality: Optional[int]  # Encoding quality, 1-100 (default: 80).
+    screenshot_scale: Optional[float]  # The factor to resize screenshots by (default: 1).
+    screenshot_dedup: Optional[Literal["off", "exact", "perceptual"]]  # Default "off".
+    screenshot_dedup_threshold: Optional[int]  # Max perceptual hash distance (default: 0).
+    vm_pool: Optional["VMPool"]  # The pool of warm instances to lease from.
+    speculative_provisioning: Optional[bool]  # Start the instance with the first model call.
+    wait_strategy: Optional[Literal["fixed", "adaptive"]]  # Default "fixed".
+    wait_min_seconds: Optional[float]  # Minimum adaptive wait (default: 0.25).
+    wait_max_seconds: Optional[float]  # Maximum adaptive wait (default: 5).
+    wait_stable_seconds: Optional[float]  # Time the screen must be unchanged (default: 0.5).
+    emit_timings: Optional[bool]  # Write timing spans to the custom stream (default: False).
+    trajectory_cache: Optional["TrajectoryCache"]  # The cache to record computer calls in.
+    task_key: Optional[str]  # The key identifying the task, for the trajectory cache.
+    trajectory_mode: Optional[Literal["record", "replay"]]  # Default "replay".
+    model_rate_limiter: Optional[BaseRateLimiter]  # Rate limiter for model requests.
+    scrapybara_rate_limiter: Optional[BaseRateLimiter]  # Rate limiter for Scrapybara requests.
+    action_max_retries: Optional[int]  # Retries per computer action (default: 3).
+    action_retry_budget: Optional[int]  # Retries per run (default: 10).
+    http_transport: Optional["HTTPTransport"]  # Shared HTTP clients (default: None).
+    model_streaming: Optional[Literal["off", "stream", "dispatch"]]  # Default "off".
+    max_input_tokens: Optional[int]  # Input token budget per run (default: None).
+    max_screenshot_bytes: Optional[int]  # Screenshot byte budget per run (default: None).
+    max_run_seconds: Optional[float]  # Run time budget per run (default: None).
+    max_vm_seconds: Optional[float]  # VM time budget per run (default: None).
+    stable_prefix: Optional[bool]  # Replace screenshots in blocks (default: False).
+    compaction_threshold: Optional[int]  # Tokens before compacting history (default: None).
 
 
 def get_configuration_with_defaults(config: RunnableConfig) -> Dict[str, Any]:
@@ -111,6 +286,35 @@ def get_configuration_with_defaults(config: RunnableConfig) -> Dict[str, Any]:
     auth_state_id = configurable_fields.get("auth_state_id", None)
     environment = configurable_fields.get("environment", "web")
     prompt = configurable_fields.get("prompt", None)
+    screenshot_store = configurable_fields.get("screenshot_store", None)
+    screenshot_retention = configurable_fields.get("screenshot_retention", None)
+    screenshot_format = configurable_fields.get("screenshot_format", "png")
+    screenshot_quality = configurable_fields.get("screenshot_quality", 80)
+    screenshot_scale = configurable_fields.get("screenshot_scale", 1)
+    screenshot_dedup = configurable_fields.get("screenshot_dedup", "off")
+    screenshot_dedup_threshold = configurable_fields.get("screenshot_dedup_threshold", 0)
+    vm_pool = configurable_fields.get("vm_pool", None)
+    speculative_provisioning = configurable_fields.get("speculative_provisioning", False)
+    wait_strategy = configurable_fields.get("wait_strategy", "fixed")
+    wait_min_seconds = configurable_fields.get("wait_min_seconds", 0.25)
+    wait_max_seconds = configurable_fields.get("wait_max_seconds", 5)
+    wait_stable_seconds = configurable_fields.get("wait_stable_seconds", 0.5)
+    emit_timings = configurable_fields.get("emit_timings", False)
+    trajectory_cache = configurable_fields.get("trajectory_cache", None)
+    task_key = configurable_fields.get("task_key", None)
+    trajectory_mode = configurable_fields.get("trajectory_mode", "replay")
+    model_rate_limiter = configurable_fields.get("model_rate_limiter", None)
+    scrapybara_rate_limiter = configurable_fields.get("scrapybara_rate_limiter", None)
+    action_max_retries = configurable_fields.get("action_max_retries", 3)
+    action_retry_budget = configurable_fields.get("action_retry_budget", 10)
+    http_transport = configurable_fields.get("http_transport", None)
+    model_streaming = configurable_fields.get("model_streaming", "off")
+    max_input_tokens = configurable_fields.get("max_input_tokens", None)
+    max_screenshot_bytes = configurable_fields.get("max_screenshot_bytes", None)
+    max_run_seconds = configurable_fields.get("max_run_seconds", None)
+    max_vm_seconds = configurable_fields.get("max_vm_seconds", None)
+    stable_prefix = configurable_fields.get("stable_prefix", False)
+    compaction_threshold = configurable_fields.get("compaction_threshold", None)
 
     return {
         "scrapybara_api_key": scrapybara_api_key,
@@ -119,4 +323,33 @@ def get_configuration_with_defaults(config: RunnableConfig) -> Dict[str, Any]:
         "auth_state_id": auth_state_id,
         "environment": environment,
         "prompt": prompt,
+        "screenshot_store": screenshot_store,
+        "screenshot_retention": screenshot_retention,
+        "screenshot_format": screenshot_format,
+        "screenshot_quality": screenshot_quality,
+        "screenshot_scale": screenshot_scale,
+        "screenshot_dedup": screenshot_dedup,
+        "screenshot_dedup_threshold": screenshot_dedup_threshold,
+        "vm_pool": vm_pool,
+        "speculative_provisioning": speculative_provisioning,
+        "wait_strategy": wait_strategy,
+        "wait_min_seconds": wait_min_seconds,
+        "wait_max_seconds": wait_max_seconds,
+        "wait_stable_seconds": wait_stable_seconds,
+        "emit_timings": emit_timings,
+        "trajectory_cache": trajectory_cache,
+        "task_key": task_key,
+        "trajectory_mode": trajectory_mode,
+        "model_rate_limiter": model_rate_limiter,
+        "scrapybara_rate_limiter": scrapybara_rate_limiter,
+        "action_max_retries": action_max_retries,
+        "action_retry_budget": action_retry_budget,
+        "http_transport": http_transport,
+        "model_streaming": model_streaming,
+        "max_input_tokens": max_input_tokens,
+        "max_screenshot_bytes": max_screenshot_bytes,
+        "max_run_seconds": max_run_seconds,
+        "max_vm_seconds": max_vm_seconds,
+        "stable_prefix": stable_prefix,
+        "compaction_threshold": compaction_threshold,
     }
@@ -1,18 +1,111 @@
-from typing import Any, Union
+import asyncio
+import time
+import weakref
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple, Union
 
+from langchain_core.rate_limiters import BaseRateLimiter
 from langchain_core.runnables import RunnableConfig
-from scrapybara import Scrapybara
-from scrapybara.client import BrowserInstance, UbuntuInstance, WindowsInstance
+from scrapybara import AsyncScrapybara
+from scrapybara.client import AsyncBrowserInstance, AsyncUbuntuInstance, AsyncWindowsInstance
 
 from .types import get_configuration_with_defaults
 
+if TYPE_CHECKING:
+    from .transport import HTTPTransport
 
-def get_scrapybara_client(api_key: str) -> Scrapybara:
+AsyncInstance = Union[AsyncUbuntuInstance, AsyncBrowserInstance, AsyncWindowsInstance]
+
+# Copied from the OpenAI example repository
+# https://github.com/openai/openai-cua-sample-app/blob/eb2d58ba77ffd3206d3346d6357093647d29d99c/utils.py#L13
+BLOCKED_DOMAINS = [
+    "maliciousbook.com",
+    "evilvideos.com",
+    "darkwebforum.com",
+    "shadytok.com",
+    "suspiciouspins.com",
+    "ilanbigio.com",
+]
+
+
+class InstanceCache:
     """
-    Gets the Scrapybara client, using the API key provided.
+    A TTL/LRU cache of Scrapybara instance handles, keyed by instance ID.
+
+    Args:
+        maxsize: The maximum number of handles to keep. The least recently used
+            handle is evicted once this is exceeded.
+        ttl_seconds: How long a handle may be served from the cache before it
+            must be fetched from Scrapybara again.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, Tuple[float, AsyncInstance]] = OrderedDict()
+
+    def get(self, instance_id: str) -> Optional[AsyncInstance]:
+        entry = self._entries.get(instance_id)
+        if entry is None:
+            return None
+        expires_at, instance = entry
+        if expires_at < time.monotonic():
+            del self._entries[instance_id]
+            return None
+        self._entries.move_to_end(instance_id)
+        return instance
+
+    def set(self, instance_id: str, instance: AsyncInstance) -> None:
+        self._entries[instance_id] = (time.monotonic() + self.ttl_seconds, instance)
+        self._entries.move_to_end(instance_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, instance_id: str) -> None:
+        self._entries.pop(instance_id, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _ScrapybaraRegistry:
+    """The clients and instance handles shared by every thread on one event loop."""
+
+    def __init__(self) -> None:
+        self.clients: Dict[Tuple[str, Optional["HTTPTransport"]], AsyncScrapybara] = {}
+        self.instances = InstanceCache()
+
+
+# Async HTTP connection pools are bound to the event loop they were created on, so
+# clients are shared per event loop, then per API key.
+_registries: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _ScrapybaraRegistry]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_registry() -> Optional[_ScrapybaraRegistry]:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    registry = _registries.get(loop)
+    if registry is None:
+        registry = _registries[loop] = _ScrapybaraRegistry()
+    return registry
+
+
+def get_scrapybara_client(
+    api_key: str, http_transport: Optional["HTTPTransport"] = None
+) -> AsyncScrapybara:
+    """
+    Gets the async Scrapybara client for the API key provided. Clients are shared
+    process-wide (per event loop), so every thread using the same API key reuses
+    the same HTTP connection pool.
 
     Args:
         api_key: The API key for Scrapybara.
+        http_transport: The transport to send requests through. If not provided, the
+            client uses its own connection pool.
 
     Returns:
         The Scrapybara client.
@@ -22,15 +115,82 @@ def get_scrapybara_client(api_key: str) -> Scrapybara:
             "Scrapybara API key not provided. Please provide one in the configurable fields, "
             "or set it as an environment variable (SCRAPYBARA_API_KEY)"
         )
-    client = Scrapybara(api_key=api_key)
+    registry = _get_registry()
+    if registry is None:
+        return AsyncScrapybara(api_key=api_key)
+
+    key = (api_key, http_transport)
+    client = registry.clients.get(key)
+    if client is None:
+        if http_transport is not None:
+            client = AsyncScrapybara(api_key=api_key, httpx_client=http_transport.get_client())
+        else:
+            client = AsyncScrapybara(api_key=api_key)
+        registry.clients[key] = client
     return client
 
 
-def get_instance(
-    id: str, config: RunnableConfig
-) -> Union[UbuntuInstance, BrowserInstance, WindowsInstance]:
+async def start_instance(
+    client: AsyncScrapybara, environment: str, timeout_hours: float
+) -> AsyncInstance:
     """
-    Gets an instance by its ID from Scrapybara.
+    Starts a new Scrapybara instance for the given environment.
+
+    Args:
+        client: The Scrapybara client to start the instance with.
+        environment: The environment to start. One of "web", "ubuntu", or "windows".
+        timeout_hours: The number of hours to keep the instance running before it times out.
+
+    Returns:
+        The started instance.
+
+    Raises:
+        ValueError: If the environment is invalid.
+    """
+    if environment == "ubuntu":
+        return await client.start_ubuntu(timeout_hours=timeout_hours)
+    elif environment == "windows":
+        return await client.start_windows(timeout_hours=timeout_hours)
+    elif environment == "web":
+        blocked_domains = [
+            domain.replace("https://", "").replace("www.", "") for domain in BLOCKED_DOMAINS
+        ]
+        return await client.start_browser(
+            timeout_hours=timeout_hours, blocked_domains=blocked_domains
+        )
+    else:
+        raise ValueError(
+            f"Invalid environment. Must be one of 'web', 'ubuntu', or 'windows'. Received: {environment}"
+        )
+
+
+def cache_instance(instance: AsyncInstance) -> None:
+    """
+    Adds an instance handle to the cache, so later steps can skip fetching it.
+
+    Args:
+        instance: The instance to cache.
+    """
+    registry = _get_registry()
+    if registry is not None:
+        registry.instances.set(instance.id, instance)
+
+
+def invalidate_instance(instance_id: str) -> None:
+    """
+    Removes an instance handle from the cache. Call this when an instance errors
+    or is stopped, so the next step fetches a fresh handle from Scrapybara.
+
+    Args:
+        instance_id: The ID of the instance to invalidate.
+    """
+    for registry in list(_registries.values()):
+        registry.instances.invalidate(instance_id)
+
+
+async def get_instance(id: str, config: RunnableConfig) -> AsyncInstance:
+    """
+    Gets an instance by its ID, from the instance cache if possible, or from Scrapybara.
 
     Args:
         id: The ID of the instance to get.
@@ -39,10 +199,29 @@ def get_instance(
     Returns:
         The instance.
     """
+    registry = _get_registry()
+    if registry is not None and (instance := registry.instances.get(id)) is not None:
+        return instance
+
     configuration = get_configuration_with_defaults(config)
     scrapybara_api_key = configuration.get("scrapybara_api_key")
-    client = get_scrapybara_client(scrapybara_api_key)
-    return client.get(id)
+    client = get_scrapybara_client(scrapybara_api_key, configuration.get("http_transport"))
+    await acquire_rate_limit(configuration.get("scrapybara_rate_limiter"))
+    instance = await client.get(id)
+    cache_instance(instance)
+    return instance
+
+
+async def acquire_rate_limit(rate_limiter: Optional[BaseRateLimiter]) -> None:
+    """
+    Waits until the rate limiter allows another request. Does nothing if no rate limiter
+    is given.
+
+    Args:
+        rate_limiter: The rate limiter to acquire a request from.
+    """
+    if rate_limiter is not None:
+        await rate_limiter.aacquire()
 
 
 def is_computer_tool_call(tool_outputs: Any) -> bool:
@@ -0,0 +1,297 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set, Tuple, Union
+
+from scrapybara import AsyncScrapybara
+
+from .utils import AsyncInstance, invalidate_instance, start_instance
+
+
+class VMPool:
+    """
+    A pool of warm Scrapybara instances, which can be leased to threads instead of booting
+    a new instance on the thread's critical path.
+
+    The pool keeps `size` warm instances per environment. Leasing an instance takes it out
+    of the pool, and starts a replacement in the background. When a run ends, the instance
+    is released back to the pool: it is either stopped and replaced by a fresh instance
+    (`recycle=True`), or kept as is for the next thread to lease.
+
+    Scrapybara stops each instance `timeout_hours` after it boots, however many times it has
+    been leased. Instances are only leased while they have at least `min_remaining_seconds`
+    left, and are stopped and replaced once they don't, or once they sit idle for longer
+    than `max_idle_seconds`.
+
+    Use the pool as an async context manager, so it is filled on entry and every instance it
+    owns is stopped on exit:
+
+    ```python
+    async with VMPool(api_key="...", size={"web": 4}) as vm_pool:
+        graph = create_cua(vm_pool=vm_pool)
+        ...
+    ```
+
+    Args:
+        client: The Scrapybara client to start instances with. If not provided, one is
+            created from `api_key`.
+        api_key: The API key to create a Scrapybara client with.
+        size: The number of warm instances to keep, either for every environment in
+            `environments`, or as a mapping of environment to size.
+        environments: The environments to keep warm instances for, if `size` is an int.
+        timeout_hours: The number of hours to keep each instance running before it times out.
+        max_idle_seconds: How long a warm instance may sit idle before it is replaced.
+            Defaults to half of `timeout_hours`.
+        min_remaining_seconds: The least time an instance must have left before it times
+            out, to be leased or returned to the pool. Defaults to half of `timeout_hours`.
+        recycle: Whether to stop released instances and replace them with fresh ones, rather
+            than returning them to the pool. Recycling keeps state such as cookies and open
+            tabs from leaking between threads. Default True.
+        reap_interval_seconds: How often to check for idle instances.
+    """
+
+    def __init__(
+        self,
+        client: Optional[AsyncScrapybara] = None,
+        *,
+        api_key: Optional[str] = None,
+        size: Union[int, Dict[str, int]] = 1,
+        environments: Tuple[str, ...] = ("web",),
+        timeout_hours: float = 1.0,
+        max_idle_seconds: Optional[float] = None,
+        min_remaining_seconds: Optional[float] = None,
+        recycle: bool = True,
+        reap_interval_seconds: float = 60.0,
+    ):
+        if client is None:
+            if not api_key:
+                raise ValueError("Either a Scrapybara client or an API key must be provided.")
+            client = AsyncScrapybara(api_key=api_key)
+        if timeout_hours < 0.01 or timeout_hours > 24:
+            raise ValueError("timeout_hours must be between 0.01 and 24")
+
+        self.client = client
+        self.sizes = size if isinstance(size, dict) else {env: size for env in environments}
+        self.timeout_hours = timeout_hours
+        self.max_idle_seconds = (
+            max_idle_seconds if max_idle_seconds is not None else timeout_hours * 3600 / 2
+        )
+        self.min_remaining_seconds = (
+            min_remaining_seconds if min_remaining_seconds is not None else timeout_hours * 3600 / 2
+        )
+        if self.min_remaining_seconds >= timeout_hours * 3600:
+            raise ValueError("min_remaining_seconds must be less than timeout_hours")
+        self.recycle = recycle
+        self.reap_interval_seconds = reap_interval_seconds
+
+        # Warm instances per environment, along with the time they became idle.
+        self._warm: Dict[str, Deque[Tuple[AsyncInstance, float]]] = {
+            env: deque() for env in self.sizes
+        }
+        self._starting: Dict[str, int] = {env: 0 for env in self.sizes}
+        self._leased: Dict[str, Tuple[AsyncInstance, str]] = {}
+        # The time each instance owned by the pool was started, by instance ID.
+        self._started: Dict[str, float] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._reaper: Optional[asyncio.Task] = None
+        self._stats = {"leases": 0, "warm_leases": 0, "cold_starts": 0, "reaped": 0}
+
+    async def __aenter__(self) -> "VMPool":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        """Fills the pool with warm instances, and starts reaping idle ones."""
+        await asyncio.gather(*(self._fill(env) for env in self.sizes))
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_forever())
+
+    async def close(self) -> None:
+        """Stops the reaper, and every instance owned by the pool, including leased ones."""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        instances = [instance for warm in self._warm.values() for instance, _ in warm]
+        instances += [instance for instance, _ in self._leased.values()]
+        for warm in self._warm.values():
+            warm.clear()
+        self._leased.clear()
+        self._started.clear()
+        await asyncio.gather(*(self._stop(instance) for instance in instances))
+
+    async def lease(self, environment: str) -> AsyncInstance:
+        """
+        Leases an instance for the given environment. A warm instance is returned if one is
+        available, otherwise a new instance is started. Either way, the pool is refilled in
+        the background.
+
+        Args:
+            environment: The environment to lease an instance for.
+
+        Returns:
+            The leased instance.
+        """
+        self._stats["leases"] += 1
+        warm = self._warm.setdefault(environment, deque())
+        instance: Optional[AsyncInstance] = None
+        while warm and instance is None:
+            instance, _ = warm.popleft()
+            if self._expired(instance):
+                # Too close to its timeout to be leased, so replace it.
+                self._stats["reaped"] += 1
+                self._spawn(self._discard(instance))
+                instance = None
+        if instance is not None:
+            self._stats["warm_leases"] += 1
+        else:
+            self._stats["cold_starts"] += 1
+            instance = await self._start(environment)
+
+        self._leased[instance.id] = (instance, environment)
+        self._spawn(self._fill(environment))
+        return instance
+
+    def is_leased(self, instance_id: str) -> bool:
+        """
+        Checks whether an instance is leased from this pool, and hasn't been released.
+
+        Args:
+            instance_id: The ID of the instance to check.
+
+        Returns:
+            True if the instance is leased from this pool.
+        """
+        return instance_id in self._leased
+
+    async def release(self, instance_id: str, discard: bool = False) -> None:
+        """
+        Releases a leased instance. It is stopped and replaced if the pool recycles
+        instances, otherwise it is returned to the pool as a warm instance.
+
+        Args:
+            instance_id: The ID of the instance to release.
+            discard: Whether to stop and replace the instance even if the pool doesn't
+                recycle instances, e.g. because the run using it failed part way through.
+        """
+        leased = self._leased.pop(instance_id, None)
+        if leased is None:
+            # The instance was not leased from this pool (e.g. it was leased by another
+            # process), so there is nothing to return it to.
+            return
+
+        instance, environment = leased
+        warm = self._warm.setdefault(environment, deque())
+        if (
+            not self.recycle
+            and not discard
+            and len(warm) < self.sizes.get(environment, 0)
+            and not self._expired(instance)
+        ):
+            # The instance keeps the time it was started, since its timeout isn't reset.
+            warm.append((instance, time.monotonic()))
+            return
+
+        await self._discard(instance)
+        self._spawn(self._fill(environment))
+
+    async def reap(self) -> int:
+        """
+        Stops warm instances which have been idle for longer than `max_idle_seconds`, or
+        have less than `min_remaining_seconds` left before they time out, and starts
+        replacements for them.
+
+        Returns:
+            The number of instances which were stopped.
+        """
+        now = time.monotonic()
+        expired = []
+        for warm in self._warm.values():
+            # Returned instances keep their start time, so the deque isn't ordered by age.
+            for _ in range(len(warm)):
+                instance, idle_since = warm.popleft()
+                if now - idle_since > self.max_idle_seconds or self._expired(instance):
+                    expired.append(instance)
+                else:
+                    warm.append((instance, idle_since))
+        self._stats["reaped"] += len(expired)
+        await asyncio.gather(*(self._discard(instance) for instance in expired))
+        await asyncio.gather(*(self._fill(env) for env in self.sizes))
+        return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Gets the number of warm, starting, and leased instances, along with counters for
+        leases served from warm instances, cold starts, and reaped instances.
+
+        Returns:
+            The pool statistics.
+        """
+        return {
+            "warm": sum(len(warm) for warm in self._warm.values()),
+            "starting": sum(self._starting.values()),
+            "leased": len(self._leased),
+            **self._stats,
+        }
+
+    async def _fill(self, environment: str) -> None:
+        missing = (
+            self.sizes.get(environment, 0)
+            - len(self._warm.get(environment, ()))
+            - self._starting.get(environment, 0)
+        )
+        if missing <= 0:
+            return
+
+        self._starting[environment] = self._starting.get(environment, 0) + missing
+        try:
+            results = await asyncio.gather(
+                *(self._start(environment) for _ in range(missing)),
+                return_exceptions=True,
+            )
+        finally:
+            self._starting[environment] -= missing
+
+        for result in results:
+            if not isinstance(result, BaseException):
+                self._warm[environment].append((result, time.monotonic()))
+
+    async def _start(self, environment: str) -> AsyncInstance:
+        started = time.monotonic()
+        instance = await start_instance(self.client, environment, self.timeout_hours)
+        self._started[instance.id] = started
+        return instance
+
+    def _expired(self, instance: AsyncInstance) -> bool:
+        # Instances the pool didn't start are treated as just started.
+        age = time.monotonic() - self._started.get(instance.id, time.monotonic())
+        return self.timeout_hours * 3600 - age < self.min_remaining_seconds
+
+    async def _discard(self, instance: AsyncInstance) -> None:
+        self._started.pop(instance.id, None)
+        await self._stop(instance)
+
+    async def _stop(self, instance: AsyncInstance) -> None:
+        invalidate_instance(instance.id)
+        try:
+            await instance.stop()
+        except Exception:
+            # The instance may have already timed out or been stopped.
+            pass
+
+    def _spawn(self, coro: Any) -> None:
+        # Keep a reference to background tasks, so they are not garbage collected mid-flight.
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _reap_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.reap_interval_seconds)
+            await self.reap()
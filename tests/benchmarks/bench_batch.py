@@ -0,0 +1,74 @@
+"""
+Measures how batch throughput scales with the concurrency limit, with and without a
+model rate limit.
+
+Every simulated model and Scrapybara request takes `LATENCY` seconds. Without a rate
+limit, throughput should grow with the concurrency limit. With one, it should level off
+at the rate limit, since each task makes `STEPS + 1` model requests.
+
+Run with: python -m tests.benchmarks.bench_batch
+"""
+
+import asyncio
+import importlib
+import uuid
+from typing import Optional
+from unittest import mock
+
+from langchain_core.messages import HumanMessage
+
+from langgraph_cua import BatchStats, astream_batch, create_cua
+from tests.fakes import FakeAsyncScrapybara, TrajectoryModel
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+LATENCY = 0.05
+STEPS = 3
+TASKS = 64
+CONCURRENCY_LEVELS = [4, 16, 64]
+MODEL_RATE_LIMITS = [None, 50.0]
+
+
+async def run(max_concurrency: int, model_rate_limit: Optional[float]) -> None:
+    # Scrapybara clients are shared per API key, so use a new key to get a new fake client.
+    api_key = f"bench-key-{uuid.uuid4()}"
+    client = FakeAsyncScrapybara(api_key=api_key, latency=LATENCY)
+    model = TrajectoryModel(STEPS, LATENCY)
+    graph = create_cua(scrapybara_api_key=api_key)
+    inputs = ({"messages": [HumanMessage(content=f"Task {i}")]} for i in range(TASKS))
+    stats = BatchStats()
+
+    with (
+        mock.patch("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client),
+        mock.patch.object(call_model_module, "get_model_with_tools", lambda *args: model),
+    ):
+        async for _ in astream_batch(
+            graph,
+            inputs,
+            max_concurrency=max_concurrency,
+            model_rate_limit=model_rate_limit,
+            stats=stats,
+        ):
+            pass
+
+    summary = stats.summary()
+    rate_limit = "-" if model_rate_limit is None else f"{model_rate_limit:.0f}/s"
+    print(
+        f"{max_concurrency:>11} {rate_limit:>10} {summary['throughput']:>12.1f} "
+        f"{summary['p50_seconds']:>8.2f} {summary['p95_seconds']:>8.2f} "
+        f"{summary['p99_seconds']:>8.2f}"
+    )
+
+
+async def main() -> None:
+    print(
+        f"{'concurrency':>11} {'rate limit':>10} {'tasks/s':>12} {'p50 (s)':>8} "
+        f"{'p95 (s)':>8} {'p99 (s)':>8}"
+    )
+    for model_rate_limit in MODEL_RATE_LIMITS:
+        for max_concurrency in CONCURRENCY_LEVELS:
+            await run(max_concurrency, model_rate_limit)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+"""
+Compares the per-turn cost of building the computer use model in call_model.
+
+"rebuild" constructs a new ChatOpenAI and binds the computer use tool, which is what
+call_model used to do on every turn. "cached" looks up the shared bound model.
+
+Run with: python -m tests.benchmarks.bench_call_model
+"""
+
+import os
+import time
+
+from langchain_openai import ChatOpenAI
+
+from langgraph_cua.nodes.call_model import get_model_with_tools
+
+TURNS = 1000
+
+
+def rebuild() -> None:
+    llm = ChatOpenAI(model="computer-use-preview", truncation="auto")
+    llm.bind_tools(
+        [
+            {
+                "type": "computer_use_preview",
+                "display_width": 1024,
+                "display_height": 768,
+                "environment": "browser",
+            }
+        ]
+    )
+
+
+def cached() -> None:
+    get_model_with_tools("web", 1024, 768, "auto")
+
+
+def main() -> None:
+    os.environ.setdefault("OPENAI_API_KEY", "bench-key")
+    print(f"{'strategy':>10} {'us/turn':>10}")
+    for name, fn in [("rebuild", rebuild), ("cached", cached)]:
+        start = time.perf_counter()
+        for _ in range(TURNS):
+            fn()
+        elapsed = time.perf_counter() - start
+        print(f"{name:>10} {elapsed / TURNS * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Compares checkpoint size and save/load time for a screenshot-heavy run.
+
+Each step appends an AI message and a computer call output holding a screenshot, then
+checkpoints the message history, as a checkpointer does after every step. "jsonplus" is
+LangGraph's default serializer. "binary" stores screenshots as raw bytes. "store" keeps
+screenshots and messages in a screenshot store, counting the bytes written to the store.
+
+Run with: python -m tests.benchmarks.bench_checkpoint
+"""
+
+import base64
+import random
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from langgraph_cua.checkpoint import CheckpointSerializer
+from langgraph_cua.screenshot_store import InMemoryScreenshotStore
+
+STEPS = 50
+SCREENSHOT_BYTES = 100 * 1024
+
+
+class CountingScreenshotStore(InMemoryScreenshotStore):
+    def __init__(self) -> None:
+        super().__init__()
+        self.bytes_written = 0
+
+    def _set(self, key: str, data: bytes) -> None:
+        self.bytes_written += len(data)
+        super()._set(key, data)
+
+
+def step(i: int, rng: random.Random):
+    screenshot = base64.b64encode(rng.randbytes(SCREENSHOT_BYTES)).decode()
+    return [
+        AIMessage(content="", id=f"resp_{i}"),
+        ToolMessage(
+            content=[{"type": "input_image", "image_url": f"data:image/png;base64,{screenshot}"}],
+            tool_call_id=f"call_{i}",
+            id=f"output_{i}",
+            additional_kwargs={"type": "computer_call_output"},
+        ),
+    ]
+
+
+def main() -> None:
+    rng = random.Random(0)
+    histories = [[HumanMessage(content="task", id="task")]]
+    for i in range(STEPS):
+        histories.append(histories[-1] + step(i, rng))
+
+    print(f"{'serializer':>10} {'written MB':>11} {'save ms/step':>13} {'load ms':>9}")
+    store = CountingScreenshotStore()
+    for name, serde in [
+        ("jsonplus", JsonPlusSerializer()),
+        ("binary", CheckpointSerializer()),
+        ("store", CheckpointSerializer(store)),
+    ]:
+        written = 0
+        start = time.perf_counter()
+        for history in histories:
+            serialized = serde.dumps_typed({"messages": history})
+            written += len(serialized[1])
+        save = (time.perf_counter() - start) / len(histories)
+
+        start = time.perf_counter()
+        serde.loads_typed(serialized)
+        load = time.perf_counter() - start
+
+        if name == "store":
+            written += store.bytes_written
+        print(f"{name:>10} {written / 1e6:>11.1f} {save * 1e3:>13.2f} {load * 1e3:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compares the estimated size of each request over a long run when the full message history
+is sent, as in ZDR mode: with every screenshot, with only the last few screenshots kept,
+and with older steps compacted into the history log.
+
+Retention bounds the screenshots in a request, but every step still adds a placeholder
+and its computer call, so requests keep growing. Compaction folds old steps into a line
+of text each, so requests stay under the threshold however long the run.
+
+Run with: python -m tests.benchmarks.bench_compaction
+"""
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from langgraph_cua.compaction import compact, estimate_request_tokens
+from tests.fakes import computer_call
+
+TURNS = 300
+RETENTION = 5
+THRESHOLD = 8_000
+SCREENSHOT_URL = "data:image/png;base64,AAAA"
+
+
+def turn(step: int):
+    call_id = f"call_{step}"
+    action = {"type": "click", "button": "left", "x": step % 1024, "y": step % 768}
+    return [
+        AIMessage(
+            content="",
+            id=f"resp_{step}",
+            additional_kwargs={
+                "reasoning": {
+                    "summary": [{"type": "summary_text", "text": "Opening the next result."}]
+                },
+                "tool_outputs": [computer_call(action, call_id)],
+            },
+        ),
+        ToolMessage(
+            content=[{"type": "input_image", "image_url": SCREENSHOT_URL}],
+            tool_call_id=call_id,
+            id=f"output_{step}",
+            additional_kwargs={"current_url": f"https://site.test/results/{step}"},
+        ),
+    ]
+
+
+def main() -> None:
+    layouts = [
+        ("full", {"screenshot_retention": None}),
+        ("retention", {"screenshot_retention": RETENTION}),
+        ("compacted", {"screenshot_retention": None, "compaction_threshold": THRESHOLD}),
+    ]
+    print(
+        f"{'layout':>10} {'mean tokens':>12} {'max tokens':>11} {'total Mtok':>11} {'compactions':>12}"
+    )
+    for name, configuration in layouts:
+        state = {
+            "messages": [HumanMessage(content="Compare the price of this product.", id="task")]
+        }
+        sizes = []
+        compactions = 0
+        for step in range(TURNS):
+            state["messages"] = state["messages"] + turn(step)
+            threshold = configuration.get("compaction_threshold")
+            if threshold is not None and estimate_request_tokens(state, configuration) > threshold:
+                update = compact(state, configuration)
+                state["history_log"] = state.get("history_log", []) + update["history_log"]
+                state["compacted_through"] = update["compacted_through"]
+                compactions += 1
+            sizes.append(estimate_request_tokens(state, configuration))
+        print(
+            f"{name:>10} {sum(sizes) / TURNS:>12.0f} {max(sizes):>11} "
+            f"{sum(sizes) / 1e6:>11.2f} {compactions:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Measures how take_computer_action scales with the number of concurrent threads.
+
+Every simulated Scrapybara request takes `LATENCY` seconds. If the node blocked the
+event loop, wall time would grow linearly with the number of threads. Since it does
+not, wall time should stay roughly flat as concurrency grows.
+
+Run with: python -m tests.benchmarks.bench_concurrency
+"""
+
+import asyncio
+import time
+from unittest import mock
+
+from langchain_core.messages import AIMessage
+
+from langgraph_cua.nodes import take_computer_action
+from tests.fakes import FakeAsyncScrapybara
+
+LATENCY = 0.05
+STEPS_PER_THREAD = 5
+CONCURRENCY_LEVELS = [1, 10, 100, 500]
+CONFIG = {"configurable": {"scrapybara_api_key": "bench-key"}}
+
+
+async def run_thread(client: FakeAsyncScrapybara) -> None:
+    instance = await client.start_browser()
+    state = {
+        "messages": [
+            AIMessage(
+                content="",
+                additional_kwargs={
+                    "tool_outputs": [
+                        {
+                            "type": "computer_call",
+                            "call_id": "call_1",
+                            "action": {"type": "click", "button": "left", "x": 1, "y": 1},
+                        }
+                    ]
+                },
+            )
+        ],
+        "instance_id": instance.id,
+        "stream_url": "https://stream.test",
+    }
+    for _ in range(STEPS_PER_THREAD):
+        await take_computer_action(state, CONFIG)
+
+
+async def main() -> None:
+    client = FakeAsyncScrapybara(api_key="bench-key", latency=LATENCY)
+    print(f"{'threads':>8} {'wall (s)':>10} {'steps/s':>10}")
+    with mock.patch("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client):
+        for threads in CONCURRENCY_LEVELS:
+            start = time.perf_counter()
+            await asyncio.gather(*(run_thread(client) for _ in range(threads)))
+            elapsed = time.perf_counter() - start
+            print(f"{threads:>8} {elapsed:>10.2f} {threads * STEPS_PER_THREAD / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+"""
+Compares the wall time of running one task's subtasks one after another, on one thread,
+against fanning them out across instances with `create_cua_fan_out`, with simulated
+latency for the model and Scrapybara.
+
+Run with: python -m tests.benchmarks.bench_fanout
+"""
+
+import asyncio
+import importlib
+import time
+import uuid
+from unittest import mock
+
+from langchain_core.messages import HumanMessage
+
+from langgraph_cua import create_cua, create_cua_fan_out
+from tests.fakes import FakeAsyncScrapybara, TrajectoryModel
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+SUBTASKS = [1, 5, 20]
+STEPS = 5
+LATENCY = 0.02
+
+
+async def sequential(graph, subtasks) -> None:
+    for subtask in subtasks:
+        await graph.ainvoke({"messages": [HumanMessage(content=subtask)]})
+
+
+async def main() -> None:
+    # Scrapybara clients are shared per API key, so use a new key to get a new fake client.
+    api_key = f"bench-key-{uuid.uuid4()}"
+    client = FakeAsyncScrapybara(api_key=api_key, latency=LATENCY)
+    model = TrajectoryModel(STEPS, LATENCY)
+    graph = create_cua(scrapybara_api_key=api_key)
+    fan_out_graph = create_cua_fan_out(scrapybara_api_key=api_key)
+
+    print(f"{'subtasks':>8} {'sequential (s)':>14} {'fan-out (s)':>12}")
+    with (
+        mock.patch("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client),
+        mock.patch.object(call_model_module, "get_model_with_tools", lambda *args: model),
+    ):
+        for n in SUBTASKS:
+            subtasks = [f"Subtask {i}" for i in range(n)]
+            start = time.perf_counter()
+            await sequential(graph, subtasks)
+            sequential_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            await fan_out_graph.ainvoke(
+                {"messages": [HumanMessage(content="Task")], "subtasks": subtasks}
+            )
+            fan_out_seconds = time.perf_counter() - start
+            print(f"{n:>8} {sequential_seconds:>14.2f} {fan_out_seconds:>12.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
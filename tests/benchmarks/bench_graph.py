@@ -0,0 +1,139 @@
+"""
+Measures the overhead the graph adds on top of the model and Scrapybara, end to end
+through `create_cua()`, with local stand-ins for both. No network access is needed, and
+sockets are disabled while the benchmark runs.
+
+Trajectories of 10, 100, and 1000 steps are run on a single thread with an in-memory
+checkpointer and no simulated latency, so all of the time is graph overhead. For each,
+the per-step overhead, memory growth, and checkpoint size are reported.
+
+Many threads are then run concurrently with simulated latency. The overhead per step is
+the wall time beyond what the simulated requests alone would take.
+
+Run with: python -m tests.benchmarks.bench_graph
+"""
+
+import asyncio
+import importlib
+import time
+import tracemalloc
+import uuid
+from typing import Any, Dict, Tuple
+from unittest import mock
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from pytest_socket import disable_socket, enable_socket
+
+from langgraph_cua import create_cua
+from langgraph_cua.graph import workflow
+from tests.fakes import FakeAsyncScrapybara, TrajectoryModel
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+TRAJECTORY_STEPS = [10, 100, 1000]
+CONCURRENCY_LEVELS = [1, 10, 100]
+CONCURRENT_STEPS = 10
+LATENCY = 0.02
+
+
+def saver_bytes(saver: InMemorySaver) -> int:
+    """Counts the serialized bytes held by an in-memory checkpointer."""
+    total = sum(len(data) for _, data in saver.blobs.values())
+    for namespaces in saver.storage.values():
+        for checkpoints in namespaces.values():
+            for (_, checkpoint), (_, metadata), _ in checkpoints.values():
+                total += len(checkpoint) + len(metadata)
+    for writes in saver.writes.values():
+        total += sum(len(value[1]) for _, _, value, _ in writes.values())
+    return total
+
+
+def checkpoint_bytes(saver: InMemorySaver, config: Dict[str, Any]) -> int:
+    """Counts the serialized bytes of the latest checkpoint of a thread."""
+    checkpoint = saver.get_tuple(config).checkpoint
+    return sum(
+        len(saver.serde.dumps_typed(value)[1]) for value in checkpoint["channel_values"].values()
+    )
+
+
+async def run_thread(graph: Any, steps: int) -> Dict[str, Any]:
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    await graph.ainvoke({"messages": [HumanMessage(content="Click around.")]}, config)
+    return config
+
+
+def build_graph(steps: int, latency: float, checkpointer: Any = None) -> Tuple[Any, Any]:
+    # Scrapybara clients are shared per API key, so use a new key to get a new fake client.
+    api_key = f"bench-key-{uuid.uuid4()}"
+    client = FakeAsyncScrapybara(api_key=api_key, latency=latency)
+    configured = create_cua(scrapybara_api_key=api_key, recursion_limit=2 * steps + 10)
+    graph = workflow.compile(checkpointer=checkpointer).with_config(configured.config)
+    return graph, client
+
+
+async def trajectory(steps: int) -> None:
+    saver = InMemorySaver()
+    graph, client = build_graph(steps, 0.0, saver)
+    model = TrajectoryModel(steps)
+    with (
+        mock.patch("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client),
+        mock.patch.object(call_model_module, "get_model_with_tools", lambda *args: model),
+    ):
+        start = time.perf_counter()
+        config = await run_thread(graph, steps)
+        elapsed = time.perf_counter() - start
+        latest_checkpoint = checkpoint_bytes(saver, config)
+        all_checkpoints = saver_bytes(saver)
+
+        # Measure memory on a second run, since tracing slows everything down.
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        await run_thread(graph, steps)
+        growth = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+    print(
+        f"{steps:>6} {elapsed / steps * 1000:>12.2f} {growth / steps / 1024:>14.1f} "
+        f"{latest_checkpoint / 1024:>16.1f} {all_checkpoints / 1024 / 1024:>14.1f}"
+    )
+
+
+async def concurrent(threads: int) -> None:
+    graph, client = build_graph(CONCURRENT_STEPS, LATENCY)
+    model = TrajectoryModel(CONCURRENT_STEPS, LATENCY)
+    with (
+        mock.patch("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client),
+        mock.patch.object(call_model_module, "get_model_with_tools", lambda *args: model),
+    ):
+        start = time.perf_counter()
+        await asyncio.gather(*(run_thread(graph, CONCURRENT_STEPS) for _ in range(threads)))
+        elapsed = time.perf_counter() - start
+
+    # Starting the instance and getting its stream URL, one model call and one action per
+    # step, then the final model call.
+    simulated = (2 + 2 * CONCURRENT_STEPS + 1) * LATENCY
+    overhead = (elapsed - simulated) / CONCURRENT_STEPS
+    print(f"{threads:>8} {elapsed:>10.2f} {overhead * 1000:>16.2f}")
+
+
+async def main() -> None:
+    disable_socket(allow_unix_socket=True)
+    try:
+        print(
+            f"{'steps':>6} {'ms/step':>12} {'KiB/step grown':>14} {'checkpoint (KiB)':>16} "
+            f"{'saver (MiB)':>14}"
+        )
+        for steps in TRAJECTORY_STEPS:
+            await trajectory(steps)
+
+        print()
+        print(f"{'threads':>8} {'wall (s)':>10} {'overhead ms/step':>16}")
+        for threads in CONCURRENCY_LEVELS:
+            await concurrent(threads)
+    finally:
+        enable_socket()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
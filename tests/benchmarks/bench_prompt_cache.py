@@ -0,0 +1,76 @@
+"""
+Compares how much of each request can be read from the model provider's prompt cache
+when the full message history is sent, as in ZDR mode.
+
+Providers cache requests by prefix, so the part of a request which can be read from the
+cache is the part it shares with the start of the previous request. "sliding" replaces
+the oldest screenshot outside the retention window on every turn, and "stable" replaces
+them in blocks. Sizes are of the serialized messages.
+
+Run with: python -m tests.benchmarks.bench_prompt_cache
+"""
+
+import base64
+import json
+import os
+import random
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, messages_to_dict
+
+from langgraph_cua.history import apply_screenshot_retention, omit_duplicate_screenshots
+from tests.fakes import computer_call
+
+TURNS = 100
+RETENTION = 5
+SCREENSHOT_BYTES = 50 * 1024
+
+
+def turn(step: int, rng: random.Random):
+    screenshot = base64.b64encode(rng.randbytes(SCREENSHOT_BYTES)).decode()
+    call_id = f"call_{step}"
+    return [
+        AIMessage(
+            content="",
+            id=f"resp_{step}",
+            additional_kwargs={"tool_outputs": [computer_call({"type": "screenshot"}, call_id)]},
+        ),
+        ToolMessage(
+            content=[{"type": "input_image", "image_url": f"data:image/png;base64,{screenshot}"}],
+            tool_call_id=call_id,
+            id=f"output_{step}",
+            additional_kwargs={"type": "computer_call_output"},
+        ),
+    ]
+
+
+def common_prefix(a: bytes, b: bytes) -> int:
+    return len(os.path.commonprefix([a, b]))
+
+
+def main() -> None:
+    rng = random.Random(0)
+    history = [HumanMessage(content="Compare the price of this product.", id="task")]
+    histories = []
+    for step in range(TURNS):
+        history = history + turn(step, rng)
+        histories.append(history)
+
+    print(f"{'layout':>8} {'request KiB':>12} {'cached':>8} {'uncached MiB':>13}")
+    for name, stable_prefix in [("sliding", False), ("stable", True)]:
+        previous = b""
+        sent = cached = 0
+        for messages in histories:
+            messages = omit_duplicate_screenshots(messages)
+            messages = apply_screenshot_retention(messages, RETENTION, stable_prefix)
+            request = json.dumps(messages_to_dict(messages)).encode()
+            sent += len(request)
+            cached += common_prefix(previous, request)
+            previous = request
+        print(
+            f"{name:>8} {sent / TURNS / 1024:>12.1f} {cached / sent:>8.0%} "
+            f"{(sent - cached) / 1024 / 1024:>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Compares the per-step cost of merging messages into a long history.
+
+Each step appends one AI message and one dict-shaped computer call output, as the agent
+does, to a history of the given length. "add_messages" is LangGraph's reducer, used by
+CUAState. "append_messages" is the append-optimized reducer used by CUAAppendState.
+
+Run with: python -m tests.benchmarks.bench_reducer
+"""
+
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import add_messages
+
+from langgraph_cua.messages import append_messages
+
+HISTORY_LENGTHS = [10, 100, 1000, 5000]
+STEPS = 200
+
+
+def step(i: int):
+    return [
+        AIMessage(content="", id=f"resp_{i}"),
+        {
+            "role": "tool",
+            "content": [{"type": "input_image", "image_url": "data:image/png;base64,AAAA"}],
+            "tool_call_id": f"call_{i}",
+            "additional_kwargs": {"type": "computer_call_output"},
+        },
+    ]
+
+
+def measure(reducer, length: int) -> float:
+    history = reducer(
+        [], [HumanMessage(content="task")] + [m for i in range(length // 2) for m in step(i)]
+    )
+    updates = [step(length + i) for i in range(STEPS)]
+    start = time.perf_counter()
+    for update in updates:
+        # Each step merges into the same history, so its length stays fixed.
+        reducer(history, update)
+    return (time.perf_counter() - start) / STEPS
+
+
+def main() -> None:
+    print(f"{'messages':>10} {'add_messages us/step':>22} {'append_messages us/step':>25}")
+    for length in HISTORY_LENGTHS:
+        add = measure(add_messages, length)
+        append = measure(append_messages, length)
+        print(f"{length:>10} {add * 1e6:>22.1f} {append * 1e6:>25.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Compares the wall time of a run when the model's response is awaited whole, streamed, and
+streamed with the first computer call dispatched early.
+
+The fake model finishes each response `TAIL_LATENCY` seconds after its computer call, as
+the Responses API does while it completes the response. With "dispatch", the action runs
+during that time, instead of after it.
+
+Run with: python -m tests.benchmarks.bench_streaming
+"""
+
+import asyncio
+import importlib
+import time
+import uuid
+from unittest import mock
+
+from langchain_core.messages import HumanMessage
+
+from langgraph_cua import create_cua
+from tests.fakes import FakeAsyncScrapybara, ScriptedModel
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+STEPS = 20
+LATENCY = 0.05
+TAIL_LATENCY = 0.05
+
+
+async def run(model_streaming: str) -> float:
+    # Scrapybara clients are shared per API key, so use a new key to get a new fake client.
+    api_key = f"bench-key-{uuid.uuid4()}"
+    client = FakeAsyncScrapybara(api_key=api_key, latency=LATENCY)
+    script = [[{"type": "click", "button": "left", "x": i, "y": i}] for i in range(STEPS)]
+    model = ScriptedModel(script, latency=LATENCY, tail_latency=TAIL_LATENCY)
+    graph = create_cua(
+        scrapybara_api_key=api_key,
+        model_streaming=model_streaming,
+        recursion_limit=2 * STEPS + 10,
+    )
+    with (
+        mock.patch("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client),
+        mock.patch.object(call_model_module, "get_model_with_tools", lambda *args: model),
+    ):
+        start = time.perf_counter()
+        await graph.ainvoke({"messages": [HumanMessage(content="Click around.")]})
+        return time.perf_counter() - start
+
+
+async def main() -> None:
+    print(f"{'streaming':>10} {'wall (s)':>10} {'ms/step':>10}")
+    for model_streaming in ["off", "stream", "dispatch"]:
+        elapsed = await run(model_streaming)
+        print(f"{model_streaming:>10} {elapsed:>10.2f} {elapsed / STEPS * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""
+Compares the fixed 2 second sleep with the adaptive wait for the model's "wait" action.
+
+Each trial clicks on a simulated page which then loads for a set time, and waits for it.
+If the screenshot after a wait still shows the page loading, the model has to ask for
+another wait, which costs a follow-up turn. All times are scaled by `TIME_SCALE`, so the
+benchmark runs in a few seconds.
+
+Run with: python -m tests.benchmarks.bench_wait
+"""
+
+import asyncio
+import importlib
+import statistics
+import time
+from typing import Any, Dict, List, Tuple
+
+from langgraph_cua.nodes.take_computer_action import _execute_action
+from langgraph_cua.types import get_configuration_with_defaults
+from tests.fakes import FakeInstance
+
+TIME_SCALE = 0.1
+LATENCY = 0.01
+# Page load times, in unscaled seconds, from an already loaded page to a slow navigation.
+LOAD_SECONDS = [0.0, 0.2, 0.5, 1.0, 1.5, 2.5, 3.5, 6.0]
+MAX_FOLLOW_UPS = 5
+
+take_computer_action_module = importlib.import_module("langgraph_cua.nodes.take_computer_action")
+
+
+def scaled_config(**configurable: Any) -> Dict[str, Any]:
+    return get_configuration_with_defaults(
+        {
+            "configurable": {
+                "wait_min_seconds": 0.25 * TIME_SCALE,
+                "wait_max_seconds": 5 * TIME_SCALE,
+                "wait_stable_seconds": 0.5 * TIME_SCALE,
+                **configurable,
+            }
+        }
+    )
+
+
+async def trial(load_seconds: float, configuration: Dict[str, Any]) -> Tuple[float, int]:
+    instance = FakeInstance("browser-0", "browser", LATENCY, load_seconds * TIME_SCALE)
+    await instance.computer(action="click_mouse", button="left", coordinates=[1, 1])
+
+    waited = 0.0
+    follow_ups = 0
+    while True:
+        start = time.perf_counter()
+        await _execute_action(instance, {"type": "wait"}, True, configuration)
+        waited += time.perf_counter() - start
+        if not instance.last_screenshot_loading or follow_ups == MAX_FOLLOW_UPS:
+            return waited, follow_ups
+        follow_ups += 1
+
+
+async def main() -> None:
+    take_computer_action_module.FIXED_WAIT_SECONDS = 2 * TIME_SCALE
+    print(f"{'strategy':>10} {'mean wait (s)':>14} {'follow-up turns':>16}")
+    for strategy in ["fixed", "adaptive"]:
+        configuration = scaled_config(wait_strategy=strategy)
+        results: List[Tuple[float, int]] = [
+            await trial(load, configuration) for load in LOAD_SECONDS
+        ]
+        # Report the mean wait in unscaled seconds.
+        mean_wait = statistics.mean(waited for waited, _ in results) / TIME_SCALE
+        follow_ups = sum(follow_ups for _, follow_ups in results)
+        print(f"{strategy:>10} {mean_wait:>14.2f} {follow_ups:>16}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
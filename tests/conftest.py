@@ -0,0 +1,35 @@
+"""Fixtures shared by the unit tests, which stand in for Scrapybara and the OpenAI model."""
+
+import importlib
+import uuid
+from typing import Any, Callable
+
+import pytest
+
+from tests.fakes import FakeAsyncScrapybara
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+
+@pytest.fixture
+def client(monkeypatch) -> FakeAsyncScrapybara:
+    """
+    A fake Scrapybara client, which replaces every Scrapybara client the agent creates. Set
+    its `latency` before starting instances to simulate network time, e.g. by overriding
+    this fixture in a test module.
+    """
+    # Scrapybara clients are shared per API key, so use a new key to get a new fake client.
+    client = FakeAsyncScrapybara(api_key=f"test-key-{uuid.uuid4()}")
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    return client
+
+
+@pytest.fixture
+def use_model(monkeypatch) -> Callable[[Any], Any]:
+    """Returns a function which makes the agent call the given fake model, and returns it."""
+
+    def use(model: Any) -> Any:
+        monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+        return model
+
+    return use
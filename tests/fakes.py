@@ -0,0 +1,224 @@
+"""Offline stand-ins for the OpenAI model and Scrapybara client used by the unit tests."""
+
+import asyncio
+import base64
+import struct
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+from scrapybara.types import (
+    BrowserGetCurrentUrlResponse,
+    ComputerResponse,
+    InstanceGetStreamUrlResponse,
+)
+
+
+def make_png(width: int = 8, height: int = 8, color: tuple = (0, 0, 0)) -> bytes:
+    """Builds a solid-color RGB PNG without any imaging dependencies."""
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        body = tag + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    row = b"\x00" + bytes(color) * width
+    raw = row * height
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+
+
+class FakeInstance:
+    """
+    A fake Scrapybara instance which records every call made against it. If `load_seconds`
+    is set, every action which changes the screen is followed by a page load, during which
+    each screenshot shows a different loading frame.
+    """
+
+    def __init__(
+        self,
+        id: str,
+        instance_type: str,
+        latency: float = 0.0,
+        load_seconds: float = 0.0,
+        client: Optional["FakeAsyncScrapybara"] = None,
+    ):
+        self.id = id
+        self.client = client
+        self.instance_type = instance_type
+        self.latency = latency
+        self.load_seconds = load_seconds
+        self.status = "running"
+        self.frame = 0
+        self.loading_frame = 0
+        self.loading_until = 0.0
+        self.last_screenshot_loading = False
+        self.calls: List[Dict[str, Any]] = []
+
+    def screenshot_b64(self) -> str:
+        self.last_screenshot_loading = time.monotonic() < self.loading_until
+        if self.last_screenshot_loading:
+            self.loading_frame += 1
+            color = ((self.loading_frame * 53) % 256, 255, 0)
+        else:
+            shade = (self.frame * 37) % 256
+            color = (shade, shade, shade)
+        return base64.b64encode(make_png(color=color)).decode()
+
+    async def computer(self, *, action: str, screenshot: Optional[bool] = True, **kwargs: Any):
+        if self.client is not None:
+            await self.client.request()
+        else:
+            await asyncio.sleep(self.latency)
+        self.calls.append({"action": action, "screenshot": screenshot, **kwargs})
+        if action not in ("take_screenshot", "move_mouse"):
+            self.frame += 1
+            self.loading_until = time.monotonic() + self.load_seconds
+        if action != "take_screenshot" and screenshot is False:
+            return ComputerResponse()
+        return ComputerResponse(base_64_image=self.screenshot_b64())
+
+    async def get_stream_url(self):
+        await asyncio.sleep(self.latency)
+        return InstanceGetStreamUrlResponse(stream_url=f"https://stream.test/{self.id}")
+
+    async def get_current_url(self):
+        await asyncio.sleep(self.latency)
+        return BrowserGetCurrentUrlResponse(current_url=f"https://site.test/page/{self.frame}")
+
+    async def authenticate(self, *, auth_state_id: str):
+        self.calls.append({"action": "authenticate", "auth_state_id": auth_state_id})
+
+    async def stop(self):
+        self.status = "terminated"
+
+
+class FakeAsyncScrapybara:
+    """
+    A fake `AsyncScrapybara` client backed by in-process `FakeInstance` objects. Counts the
+    requests in flight across the client and its instances, so tests can check that work
+    overlaps without timing it.
+    """
+
+    def __init__(self, *, api_key: Optional[str] = None, latency: float = 0.0, **kwargs: Any):
+        self.api_key = api_key
+        self.latency = latency
+        self.instances: Dict[str, FakeInstance] = {}
+        self.get_calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def request(self) -> None:
+        """Simulates a request to Scrapybara, taking `latency` seconds."""
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+
+    async def _start(self, instance_type: str, **kwargs: Any) -> FakeInstance:
+        await self.request()
+        instance = FakeInstance(
+            f"{instance_type}-{len(self.instances)}", instance_type, self.latency, client=self
+        )
+        self.instances[instance.id] = instance
+        return instance
+
+    async def start_browser(self, **kwargs: Any) -> FakeInstance:
+        return await self._start("browser", **kwargs)
+
+    async def start_ubuntu(self, **kwargs: Any) -> FakeInstance:
+        return await self._start("ubuntu", **kwargs)
+
+    async def start_windows(self, **kwargs: Any) -> FakeInstance:
+        return await self._start("windows", **kwargs)
+
+    async def get(self, instance_id: str) -> FakeInstance:
+        self.get_calls += 1
+        await self.request()
+        return self.instances[instance_id]
+
+
+def computer_call(action: Dict[str, Any], call_id: str = "call_1") -> Dict[str, Any]:
+    """Builds a `computer_call` output item, as returned by the Responses API."""
+    return {"type": "computer_call", "call_id": call_id, "id": f"cu_{call_id}", "action": action}
+
+
+class ScriptedModel:
+    """
+    A fake computer use model which replays a fixed script of responses. Each entry in
+    the script is a list of `computer_call` actions, or a string for a final text reply.
+    Each response ends `tail_latency` seconds after its last output item, like the
+    Responses API finishing a response, which a stream shows as a delay before the final
+    chunk.
+    """
+
+    def __init__(self, script: Sequence[Any], latency: float = 0.0, tail_latency: float = 0.0):
+        self.script = list(script)
+        self.latency = latency
+        self.tail_latency = tail_latency
+        self.calls: List[Dict[str, Any]] = []
+
+    def _next_step(self, messages: Sequence[Any], kwargs: Dict[str, Any]) -> tuple:
+        turn = len(self.calls)
+        self.calls.append({"messages": list(messages), "kwargs": kwargs})
+        step = self.script[turn] if turn < len(self.script) else "Done."
+        if isinstance(step, str):
+            return turn, step, []
+        tool_outputs = [
+            computer_call(action, call_id=f"call_{turn}_{i}") for i, action in enumerate(step)
+        ]
+        return turn, "", tool_outputs
+
+    async def ainvoke(self, messages: Sequence[Any], **kwargs: Any) -> AIMessage:
+        await asyncio.sleep(self.latency + self.tail_latency)
+        turn, content, tool_outputs = self._next_step(messages, kwargs)
+        return AIMessage(
+            content=content,
+            additional_kwargs={"tool_outputs": tool_outputs} if tool_outputs else {},
+            response_metadata={"id": f"resp_{turn}"},
+        )
+
+    async def astream(
+        self, messages: Sequence[Any], **kwargs: Any
+    ) -> AsyncIterator[AIMessageChunk]:
+        await asyncio.sleep(self.latency)
+        turn, content, tool_outputs = self._next_step(messages, kwargs)
+        for i, word in enumerate(content.split(" ") if content else []):
+            yield AIMessageChunk(content=word if i == 0 else f" {word}")
+        for tool_output in tool_outputs:
+            yield AIMessageChunk(content="", additional_kwargs={"tool_outputs": [tool_output]})
+        await asyncio.sleep(self.tail_latency)
+        yield AIMessageChunk(content="", response_metadata={"id": f"resp_{turn}"})
+
+
+class TrajectoryModel:
+    """
+    A fake computer use model which clicks `steps` times, then replies with text. The turn
+    is carried in the response ID and read back from the 'previous_response_id', like the
+    Responses API, so one model can serve any number of concurrent threads.
+    """
+
+    def __init__(self, steps: int, latency: float = 0.0):
+        self.steps = steps
+        self.latency = latency
+
+    async def ainvoke(
+        self, messages: Sequence[Any], previous_response_id: Optional[str] = None, **kwargs: Any
+    ) -> AIMessage:
+        await asyncio.sleep(self.latency)
+        turn = 0 if previous_response_id is None else int(previous_response_id.split("_")[-1]) + 1
+        response_metadata = {"id": f"resp_{turn}"}
+        if turn >= self.steps:
+            return AIMessage(content="Done.", response_metadata=response_metadata)
+        action = {"type": "click", "button": "left", "x": turn % 1024, "y": turn % 768}
+        return AIMessage(
+            content="",
+            additional_kwargs={"tool_outputs": [computer_call(action, call_id=f"call_{turn}")]},
+            response_metadata=response_metadata,
+        )
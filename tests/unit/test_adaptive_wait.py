@@ -0,0 +1,74 @@
+import pytest
+from langchain_core.messages import AIMessage
+
+from langgraph_cua.nodes.take_computer_action import take_computer_action
+from tests.fakes import FakeAsyncScrapybara, FakeInstance, computer_call
+
+
+def _config(**configurable):
+    return {
+        "configurable": {
+            "scrapybara_api_key": "test-key",
+            "wait_strategy": "adaptive",
+            "wait_min_seconds": 0.05,
+            "wait_max_seconds": 1.0,
+            "wait_stable_seconds": 0.1,
+            **configurable,
+        }
+    }
+
+
+async def _wait(instance, config):
+    state = {
+        "messages": [
+            AIMessage(
+                content="",
+                additional_kwargs={"tool_outputs": [computer_call({"type": "wait"})]},
+            )
+        ],
+        "instance_id": instance.id,
+        "stream_url": "https://stream.test",
+    }
+    return await take_computer_action(state, config)
+
+
+@pytest.fixture
+def instance(monkeypatch) -> FakeInstance:
+    client = FakeAsyncScrapybara(api_key="test-key")
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    instance = FakeInstance("browser-0", "browser")
+    client.instances[instance.id] = instance
+    return instance
+
+
+@pytest.mark.asyncio
+async def test_adaptive_wait_ends_once_screen_is_stable(instance) -> None:
+    update = await _wait(instance, _config(wait_max_seconds=60.0))
+
+    # The wait ended once the screen was stable, long before the maximum.
+    wait_seconds = update["messages"][0]["additional_kwargs"]["wait_seconds"]
+    assert 0.15 <= wait_seconds < 60.0
+    assert not instance.last_screenshot_loading
+
+
+@pytest.mark.asyncio
+async def test_adaptive_wait_outlasts_page_load(instance) -> None:
+    instance.load_seconds = 0.3
+    await instance.computer(action="click_mouse", button="left", coordinates=[1, 1])
+
+    update = await _wait(instance, _config())
+
+    assert update["messages"][0]["additional_kwargs"]["wait_seconds"] >= 0.3
+    assert not instance.last_screenshot_loading
+
+
+@pytest.mark.asyncio
+async def test_adaptive_wait_is_bounded(instance) -> None:
+    instance.load_seconds = 10
+    await instance.computer(action="click_mouse", button="left", coordinates=[1, 1])
+
+    update = await _wait(instance, _config(wait_max_seconds=0.2))
+
+    # The wait ended at the maximum, while the page was still loading.
+    assert update["messages"][0]["additional_kwargs"]["wait_seconds"] >= 0.2
+    assert instance.last_screenshot_loading
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from langgraph_cua.nodes import create_vm_instance, take_computer_action
+from tests.fakes import FakeAsyncScrapybara
+
+CONFIG = {"configurable": {"scrapybara_api_key": "test-key"}}
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    client = FakeAsyncScrapybara(api_key="test-key", latency=0.05)
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    return client
+
+
+def _computer_call_message(action: dict, call_id: str = "call_1") -> AIMessage:
+    return AIMessage(
+        content="",
+        additional_kwargs={
+            "tool_outputs": [
+                {"type": "computer_call", "call_id": call_id, "id": "cu_1", "action": action}
+            ]
+        },
+    )
+
+
+@pytest.mark.asyncio
+async def test_create_vm_instance(fake_client) -> None:
+    update = await create_vm_instance({"messages": []}, CONFIG)
+
+    assert update["instance_id"] in fake_client.instances
+    assert update["stream_url"].endswith(update["instance_id"])
+
+
+@pytest.mark.asyncio
+async def test_take_computer_action_runs_concurrently(fake_client) -> None:
+    instances = await asyncio.gather(*(fake_client.start_browser() for _ in range(100)))
+    states = [
+        {
+            "messages": [
+                _computer_call_message({"type": "click", "button": "left", "x": 1, "y": 2})
+            ],
+            "instance_id": instance.id,
+            "stream_url": "https://stream.test",
+        }
+        for instance in instances
+    ]
+
+    updates = await asyncio.gather(*(take_computer_action(state, CONFIG) for state in states))
+
+    # Run one after another, there would never be more than one request in flight.
+    assert fake_client.max_in_flight > 1
+    assert all(update["messages"][0]["tool_call_id"] == "call_1" for update in updates)
+
+
+@pytest.mark.asyncio
+async def test_wait_action_does_not_block_event_loop(fake_client) -> None:
+    instance = await fake_client.start_browser()
+    state = {
+        "messages": [_computer_call_message({"type": "wait"})],
+        "instance_id": instance.id,
+        "stream_url": "https://stream.test",
+    }
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.1)
+            ticks += 1
+
+    ticker_task = asyncio.create_task(ticker())
+    try:
+        await asyncio.gather(*(take_computer_action(state, CONFIG) for _ in range(20)))
+    finally:
+        ticker_task.cancel()
+
+    # The waits overlap, and the event loop keeps running while they sleep.
+    assert fake_client.max_in_flight > 1
+    assert ticks >= 10
+
+
+@pytest.mark.asyncio
+async def test_instance_handles_are_cached(fake_client) -> None:
+    update = await create_vm_instance({"messages": []}, CONFIG)
+    state = {
+        "messages": [_computer_call_message({"type": "screenshot"})],
+        "instance_id": update["instance_id"],
+        "stream_url": update["stream_url"],
+    }
+
+    for _ in range(5):
+        await take_computer_action(state, CONFIG)
+
+    assert fake_client.get_calls == 0
+
+
+@pytest.mark.asyncio
+async def test_instance_cache_is_invalidated_on_error(fake_client) -> None:
+    instance = await fake_client.start_browser()
+    state = {
+        "messages": [_computer_call_message({"type": "not_a_real_action"})],
+        "instance_id": instance.id,
+        "stream_url": "https://stream.test",
+    }
+
+    await take_computer_action(state, CONFIG)
+    await take_computer_action(state, CONFIG)
+
+    assert fake_client.get_calls == 2
@@ -0,0 +1,109 @@
+import asyncio
+import importlib
+import time
+import uuid
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from langgraph_cua import BatchStats, astream_batch, create_cua
+from tests.fakes import FakeAsyncScrapybara, TrajectoryModel
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+
+class ConcurrencyTrackingModel(TrajectoryModel):
+    """Records the most model calls which were ever in flight at once."""
+
+    def __init__(self, steps: int, latency: float = 0.0):
+        super().__init__(steps, latency)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def ainvoke(self, messages, previous_response_id=None, **kwargs):
+        if messages and messages[0].content == "fail":
+            raise RuntimeError("boom")
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await super().ainvoke(messages, previous_response_id, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    # Scrapybara clients are shared per API key, so use a new key to get a new fake client.
+    api_key = f"test-key-{uuid.uuid4()}"
+    client = FakeAsyncScrapybara(api_key=api_key)
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    return create_cua(scrapybara_api_key=api_key)
+
+
+def _inputs(n: int):
+    for i in range(n):
+        yield {"messages": [HumanMessage(content=f"Task {i}")]}
+
+
+@pytest.mark.asyncio
+async def test_batch_respects_concurrency_limit(monkeypatch, graph) -> None:
+    model = ConcurrencyTrackingModel(steps=2, latency=0.01)
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    stats = BatchStats()
+
+    results = [
+        result async for result in astream_batch(graph, _inputs(20), max_concurrency=4, stats=stats)
+    ]
+
+    assert sorted(result.index for result in results) == list(range(20))
+    assert all(result.output["messages"][-1].content == "Done." for result in results)
+    assert model.max_in_flight == 4
+    summary = stats.summary()
+    assert summary["completed"] == 20
+    assert summary["throughput"] > 0
+    assert summary["p50_seconds"] <= summary["p95_seconds"] <= summary["p99_seconds"]
+
+
+@pytest.mark.asyncio
+async def test_batch_reports_failures(monkeypatch, graph) -> None:
+    model = ConcurrencyTrackingModel(steps=1)
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    inputs = [{"messages": [HumanMessage(content="fail")]}, *_inputs(2)]
+    stats = BatchStats()
+
+    results = [result async for result in astream_batch(graph, inputs, stats=stats)]
+
+    failed = [result for result in results if result.error is not None]
+    assert [result.index for result in failed] == [0]
+    assert isinstance(failed[0].error, RuntimeError)
+    assert stats.summary()["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_rate_limits_model_requests(monkeypatch, graph) -> None:
+    model = ConcurrencyTrackingModel(steps=1)
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+
+    start = time.perf_counter()
+    # 8 tasks make 16 model requests, which take over a second at 10 requests per second.
+    results = [
+        result
+        async for result in astream_batch(graph, _inputs(8), max_concurrency=8, model_rate_limit=10)
+    ]
+    elapsed = time.perf_counter() - start
+
+    assert len(results) == 8
+    assert elapsed >= 1.0
+
+
+@pytest.mark.asyncio
+async def test_batch_cancels_pending_tasks_when_closed(monkeypatch, graph) -> None:
+    model = ConcurrencyTrackingModel(steps=1, latency=0.05)
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+
+    stream = astream_batch(graph, _inputs(10), max_concurrency=2)
+    await stream.__anext__()
+    await stream.aclose()
+    await asyncio.sleep(0.1)
+
+    assert model.in_flight == 0
@@ -0,0 +1,66 @@
+import importlib
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from langgraph_cua import create_cua
+from langgraph_cua.nodes.take_computer_action import merge_actions
+from tests.fakes import FakeAsyncScrapybara, ScriptedModel
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+
+def test_merge_actions() -> None:
+    actions = [
+        {"type": "move", "x": 1, "y": 1},
+        {"type": "move", "x": 2, "y": 2},
+        {"type": "scroll", "x": 5, "y": 5, "scroll_x": 0, "scroll_y": 100},
+        {"type": "scroll", "x": 5, "y": 5, "scroll_x": 20, "scroll_y": 100},
+        {"type": "scroll", "x": 6, "y": 6, "scroll_x": 0, "scroll_y": 40},
+        {"type": "type", "text": "hello"},
+        {"type": "move", "x": 3, "y": 3},
+    ]
+
+    assert merge_actions(actions) == [
+        {"type": "move", "x": 2, "y": 2},
+        {"type": "scroll", "x": 5, "y": 5, "scroll_x": 20, "scroll_y": 200},
+        {"type": "scroll", "x": 6, "y": 6, "scroll_x": 0, "scroll_y": 40},
+        {"type": "type", "text": "hello"},
+        {"type": "move", "x": 3, "y": 3},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_executes_every_computer_call(monkeypatch) -> None:
+    client = FakeAsyncScrapybara(api_key="test-key")
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    model = ScriptedModel(
+        [
+            [
+                {"type": "move", "x": 1, "y": 1},
+                {"type": "move", "x": 2, "y": 2},
+                {"type": "click", "button": "left", "x": 2, "y": 2},
+                {"type": "type", "text": "hello"},
+            ],
+            "Done.",
+        ]
+    )
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    graph = create_cua(scrapybara_api_key="test-key")
+
+    result = await graph.ainvoke({"messages": [HumanMessage(content="Say hello.")]})
+
+    instance = client.instances[result["instance_id"]]
+    assert [call["action"] for call in instance.calls] == ["move_mouse", "click_mouse", "type_text"]
+    assert [call["screenshot"] for call in instance.calls] == [False, False, True]
+
+    tool_messages = [m for m in result["messages"] if m.type == "tool"]
+    assert [m.tool_call_id for m in tool_messages] == [f"call_0_{i}" for i in range(4)]
+    assert len({m.content[0]["image_url"] for m in tool_messages}) == 1
+
+    # All of the outputs are sent back in a single request, and only the last includes the
+    # full screenshot.
+    second_request = model.calls[1]
+    assert second_request["kwargs"] == {"previous_response_id": "resp_0"}
+    assert [m.tool_call_id for m in second_request["messages"]] == [f"call_0_{i}" for i in range(4)]
+    assert len(model.calls) == 2
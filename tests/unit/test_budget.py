@@ -0,0 +1,173 @@
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from langgraph_cua import create_cua
+from langgraph_cua.budget import count_image_bytes, exceeded_budget, get_usage
+from langgraph_cua.graph import workflow
+from langgraph_cua.history import OMITTED_SCREENSHOT_URL
+from langgraph_cua.nodes.take_computer_action import is_dispatched
+from tests.fakes import FakeAsyncScrapybara, ScriptedModel, TrajectoryModel
+
+CLICK = {"type": "click", "button": "left", "x": 1, "y": 1}
+
+
+class MeteredModel(TrajectoryModel):
+    """Reports a fixed number of input and output tokens for every call."""
+
+    def __init__(self, steps: int, input_tokens: int = 100, output_tokens: int = 10):
+        super().__init__(steps)
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.call_count = 0
+
+    async def ainvoke(self, messages, previous_response_id=None, **kwargs):
+        self.call_count += 1
+        response = await super().ainvoke(messages, previous_response_id, **kwargs)
+        response.usage_metadata = {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "total_tokens": self.input_tokens + self.output_tokens,
+        }
+        return response
+
+
+class MeteredScriptedModel(ScriptedModel):
+    """Replays a script, reporting 100 input tokens and 10 output tokens for every response."""
+
+    usage_metadata = {"input_tokens": 100, "output_tokens": 10, "total_tokens": 110}
+
+    async def ainvoke(self, messages, **kwargs):
+        response = await super().ainvoke(messages, **kwargs)
+        response.usage_metadata = self.usage_metadata
+        return response
+
+    async def astream(self, messages, **kwargs):
+        async for chunk in super().astream(messages, **kwargs):
+            if chunk.response_metadata.get("id"):
+                chunk.usage_metadata = self.usage_metadata
+            yield chunk
+
+
+@pytest.fixture
+def client(client) -> FakeAsyncScrapybara:
+    client.latency = 0.01
+    return client
+
+
+def test_count_image_bytes() -> None:
+    message = ToolMessage(
+        content=[
+            {"type": "input_image", "image_url": "data:image/png;base64,AAAAAAAA"},
+            {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}},
+            {"type": "input_image", "image_url": "screenshot://image/png;abc"},
+        ],
+        tool_call_id="call_1",
+    )
+
+    assert count_image_bytes([HumanMessage(content="hi"), message]) == 9
+
+
+def test_budgets_must_be_positive() -> None:
+    with pytest.raises(ValueError):
+        create_cua(max_run_seconds=0)
+
+
+@pytest.mark.asyncio
+async def test_token_budget_stops_before_the_next_action(use_model, client) -> None:
+    model = MeteredModel(steps=10)
+    use_model(model)
+    graph = create_cua(scrapybara_api_key=client.api_key, max_input_tokens=250)
+
+    result = await graph.ainvoke({"messages": [HumanMessage(content="Click around.")]})
+
+    # The third response uses up the budget, so its computer call isn't executed, but is
+    # still paired with an output.
+    assert model.call_count == 3
+    instance = client.instances[result["instance_id"]]
+    assert [call["action"] for call in instance.calls] == ["click_mouse", "click_mouse"]
+    assert result["budget_exceeded"] == "max_input_tokens"
+    assert (result["input_tokens"], result["output_tokens"]) == (300, 30)
+    assert result["screenshot_bytes"] > 0
+    assert 0 < result["vm_seconds"] < result["run_seconds"]
+
+    *_, skipped, summary = result["messages"]
+    assert skipped.tool_call_id == "call_2"
+    assert skipped.status == "error"
+    assert summary.additional_kwargs["budget_exceeded"] == "max_input_tokens"
+    assert summary.additional_kwargs["usage"]["input_tokens"] == 300
+    assert "input token budget of 250" in summary.content
+
+
+@pytest.mark.asyncio
+async def test_vm_time_budget_stops_before_the_next_model_call(use_model, client) -> None:
+    model = MeteredModel(steps=100)
+    use_model(model)
+    graph = create_cua(scrapybara_api_key=client.api_key, max_vm_seconds=0.05, recursion_limit=500)
+
+    result = await graph.ainvoke({"messages": [HumanMessage(content="Click around.")]})
+
+    assert result["budget_exceeded"] == "max_vm_seconds"
+    assert result["vm_seconds"] >= 0.05
+    assert model.call_count < 100
+    *_, last_output, summary = result["messages"]
+    assert last_output.type == "tool"
+    assert last_output.status == "success"
+    assert summary.type == "ai"
+
+
+def test_run_time_is_measured_from_the_run_start() -> None:
+    state = {
+        "input_tokens": 300,
+        "run_seconds": 0.5,
+        "run_start": {"input_tokens": 200, "run_seconds": 0.4, "started_at": time.time() - 5},
+    }
+
+    usage = get_usage(state)
+
+    assert usage["input_tokens"] == 100
+    assert usage["run_seconds"] >= 5
+    assert exceeded_budget(state, {"max_run_seconds": 5}) == "max_run_seconds"
+    assert exceeded_budget(state, {"max_input_tokens": 150}) is None
+
+
+@pytest.mark.asyncio
+async def test_budgets_are_counted_per_run(use_model, client) -> None:
+    use_model(MeteredScriptedModel([[CLICK], "Done.", [CLICK], "Done."]))
+    configured = create_cua(scrapybara_api_key=client.api_key, max_input_tokens=250)
+    graph = workflow.compile(checkpointer=InMemorySaver()).with_config(configured.config)
+    config = {"configurable": {"thread_id": "thread-1"}}
+
+    await graph.ainvoke({"messages": [HumanMessage(content="Click.")]}, config)
+    result = await graph.ainvoke({"messages": [HumanMessage(content="Click again.")]}, config)
+
+    # The thread has used more than the budget, but each run has only used 200 tokens.
+    assert result["input_tokens"] == 400
+    assert result["run_start"]["input_tokens"] == 200
+    assert result["budget_exceeded"] is None
+    assert result["messages"][-1].content == "Done."
+
+
+@pytest.mark.asyncio
+async def test_stopping_reports_the_dispatched_call(use_model, client) -> None:
+    script = [[CLICK], [{"type": "type", "text": "hello"}, {"type": "keypress", "keys": ["enter"]}]]
+    use_model(MeteredScriptedModel(script, tail_latency=0.05))
+    graph = create_cua(
+        scrapybara_api_key=client.api_key, model_streaming="dispatch", max_input_tokens=150
+    )
+
+    result = await graph.ainvoke({"messages": [HumanMessage(content="Say hello.")]})
+
+    # The second response uses up the budget, but its first call had already run while
+    # the response was streaming, so it gets its real output.
+    assert result["budget_exceeded"] == "max_input_tokens"
+    instance = client.instances[result["instance_id"]]
+    assert [call["action"] for call in instance.calls] == ["click_mouse", "type_text"]
+    *_, typed, skipped, summary = result["messages"]
+    assert (typed.tool_call_id, typed.status) == ("call_1_0", "success")
+    assert typed.content[0]["image_url"] != OMITTED_SCREENSHOT_URL
+    assert (skipped.tool_call_id, skipped.status) == ("call_1_1", "error")
+    assert summary.additional_kwargs["thread_usage"]["input_tokens"] == 200
+    assert not is_dispatched(result["instance_id"], "call_1_0")
@@ -0,0 +1,70 @@
+import importlib
+
+import pytest
+from langchain_core.messages import HumanMessage, ToolMessage
+
+from langgraph_cua.nodes import call_model
+from langgraph_cua.nodes.call_model import get_model_with_tools
+from tests.fakes import ScriptedModel
+
+# The nodes package re-exports the node functions under their module names.
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+
+def test_model_with_tools_is_cached(monkeypatch) -> None:
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+
+    model = get_model_with_tools("web", 1024, 768, "auto")
+
+    assert get_model_with_tools("web", 1024, 768, "auto") is model
+    assert get_model_with_tools("ubuntu", 1024, 768, "auto") is not model
+    assert model.kwargs["tools"][0]["environment"] == "browser"
+
+
+@pytest.mark.asyncio
+async def test_previous_response_id_is_passed_per_call(monkeypatch) -> None:
+    model = ScriptedModel([[{"type": "screenshot"}]])
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    first = await call_model({"messages": [HumanMessage(content="hi")]}, {})
+    tool_message = ToolMessage(
+        content=[{"type": "input_image", "image_url": "data:image/png;base64,AAAA"}],
+        tool_call_id="call_0_0",
+        additional_kwargs={"type": "computer_call_output"},
+    )
+
+    await call_model(
+        {"messages": [HumanMessage(content="hi"), first["messages"], tool_message]}, {}
+    )
+
+    assert model.calls[0]["kwargs"] == {}
+    assert model.calls[1]["kwargs"] == {"previous_response_id": "resp_0"}
+    assert model.calls[1]["messages"] == [tool_message]
+
+
+@pytest.mark.asyncio
+async def test_cached_tokens_are_reported(monkeypatch) -> None:
+    model = ScriptedModel(["Done."])
+
+    async def ainvoke(messages, **kwargs):
+        response = await ScriptedModel.ainvoke(model, messages, **kwargs)
+        response.usage_metadata = {
+            "input_tokens": 1000,
+            "output_tokens": 10,
+            "total_tokens": 1010,
+            "input_token_details": {"cache_read": 750},
+        }
+        return response
+
+    monkeypatch.setattr(model, "ainvoke", ainvoke)
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    events = []
+    monkeypatch.setattr("langgraph_cua.telemetry._write_event", events.append)
+
+    update = await call_model(
+        {"messages": [HumanMessage(content="hi")]}, {"configurable": {"emit_timings": True}}
+    )
+
+    assert update["cached_tokens"] == 750
+    request = next(e["span"] for e in events if e["span"]["name"] == "call_model.request")
+    assert request["attributes"]["cached_tokens"] == 750
+    assert request["attributes"]["cache_hit_rate"] == 0.75
@@ -0,0 +1,95 @@
+import base64
+import importlib
+import random
+
+import pytest
+from langchain_core.messages import HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.graph import START, StateGraph
+
+from langgraph_cua import CUAState, create_cua
+from langgraph_cua.checkpoint import CheckpointSerializer
+from langgraph_cua.screenshot_store import InMemoryScreenshotStore
+from tests.fakes import FakeAsyncScrapybara, ScriptedModel
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+
+def _screenshot(seed: int) -> str:
+    # Noise, so the image is about as large as a real screenshot would be, relative to
+    # the rest of the message.
+    data = random.Random(seed).randbytes(16 * 1024)
+    return f"data:image/png;base64,{base64.b64encode(data).decode()}"
+
+
+def _output(i: int) -> ToolMessage:
+    return ToolMessage(
+        content=[{"type": "input_image", "image_url": _screenshot(i)}],
+        tool_call_id=f"call_{i}",
+        id=f"output_{i}",
+        additional_kwargs={"type": "computer_call_output"},
+    )
+
+
+def test_screenshots_are_stored_as_bytes() -> None:
+    messages = [HumanMessage(content="hi", id="1"), _output(1), _output(2)]
+    serde = CheckpointSerializer()
+
+    serialized = serde.dumps_typed(messages)
+
+    assert serialized[0] == "cua-msgpack"
+    assert len(serialized[1]) < 0.8 * len(JsonPlusSerializer().dumps_typed(messages)[1])
+    assert serde.loads_typed(serialized) == messages
+    # The messages in state are left untouched.
+    assert messages[1].content[0]["image_url"] == _screenshot(1)
+
+
+def test_values_without_screenshots_are_unchanged() -> None:
+    value = {"messages": [HumanMessage(content="hi", id="1")], "instance_id": "browser-0"}
+
+    serialized = CheckpointSerializer().dumps_typed(value)
+
+    assert serialized == JsonPlusSerializer().dumps_typed(value)
+    assert CheckpointSerializer().loads_typed(serialized) == value
+
+
+def test_screenshot_store_deduplicates_messages() -> None:
+    store = InMemoryScreenshotStore()
+    serde = CheckpointSerializer(store)
+    messages = [HumanMessage(content="hi", id="1"), _output(1)]
+
+    first = serde.dumps_typed({"messages": messages})
+    # The message, its screenshot, and the human message.
+    assert len(store) == 3
+
+    second = serde.dumps_typed({"messages": messages + [_output(2)]})
+    assert len(store) == 5
+    assert len(second[1]) < 1024
+
+    # A fresh serializer, as after a restart, reads the messages back from the store.
+    loaded = CheckpointSerializer(store).loads_typed(second)
+    assert loaded["messages"] == messages + [_output(2)]
+    assert CheckpointSerializer(store).loads_typed(first)["messages"] == messages
+
+
+@pytest.mark.asyncio
+async def test_graph_state_round_trips(monkeypatch) -> None:
+    client = FakeAsyncScrapybara(api_key="test-key")
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    model = ScriptedModel([[{"type": "click", "button": "left", "x": 1, "y": 1}], "Done."])
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+
+    workflow = StateGraph(CUAState)
+    workflow.add_node("cua", create_cua(scrapybara_api_key="test-key"))
+    workflow.add_edge(START, "cua")
+    graph = workflow.compile(
+        checkpointer=InMemorySaver(serde=CheckpointSerializer(InMemoryScreenshotStore()))
+    )
+    config = {"configurable": {"thread_id": "thread-1"}}
+    result = await graph.ainvoke({"messages": [HumanMessage(content="Click.")]}, config)
+
+    state = await graph.aget_state(config)
+    assert state.values["messages"] == result["messages"]
+    image_url = state.values["messages"][2].content[0]["image_url"]
+    assert image_url.startswith("data:image/png;base64,")
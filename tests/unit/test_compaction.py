@@ -0,0 +1,185 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from langgraph_cua import create_cua
+from langgraph_cua.compaction import (
+    HISTORY_LOG_HEADER,
+    SCREENSHOT_TOKENS,
+    apply_compaction,
+    compact,
+    describe_action,
+    describe_step,
+    estimate_request_tokens,
+    history_log_message,
+    needs_compaction,
+)
+from langgraph_cua.graph import workflow
+from langgraph_cua.history import OMITTED_SCREENSHOT_URL
+from langgraph_cua.replay import REPLAYED_KEY
+from tests.fakes import ScriptedModel, computer_call
+
+SCREENSHOT_URL = "data:image/png;base64,AAAA"
+
+
+def _step(turn: int, url: str = None) -> list:
+    action = {"type": "click", "button": "left", "x": turn, "y": turn}
+    ai = AIMessage(
+        content="",
+        id=f"ai_{turn}",
+        additional_kwargs={"tool_outputs": [computer_call(action, call_id=f"call_{turn}")]},
+    )
+    tool = ToolMessage(
+        content=[{"type": "input_image", "image_url": SCREENSHOT_URL}],
+        tool_call_id=f"call_{turn}",
+        id=f"tool_{turn}",
+        additional_kwargs={"current_url": url} if url else {},
+    )
+    return [ai, tool]
+
+
+def _history(steps: int) -> list:
+    messages = [HumanMessage(content="Find the cheapest flight.", id="task")]
+    for turn in range(steps):
+        messages.extend(_step(turn, url=f"https://site.test/{turn}"))
+    return messages
+
+
+def test_describe_action() -> None:
+    assert describe_action({"type": "click", "button": "right", "x": 1, "y": 2}) == (
+        "click right at (1, 2)"
+    )
+    assert describe_action({"type": "type", "text": "hello"}) == 'type "hello"'
+    assert describe_action({"type": "keypress", "keys": ["CTRL", "L"]}) == "press CTRL+L"
+    assert describe_action(
+        {"type": "drag", "path": [{"x": 0, "y": 0}, {"x": 1, "y": 1}, {"x": 5, "y": 6}]}
+    ) == ("drag from (0, 0) to (5, 6)")
+
+
+def test_describe_step() -> None:
+    ai, tool = _step(0, url="https://site.test/search")
+    ai.additional_kwargs["reasoning"] = {"summary": [{"type": "summary_text", "text": "A form."}]}
+    failed = tool.model_copy(
+        update={"status": "error", "additional_kwargs": {"error": "Timed out."}}
+    )
+
+    assert describe_step([ai, tool], 3) == (
+        "Step 3. Observed: A form. Actions: click left at (0, 0). URL: https://site.test/search"
+    )
+    assert describe_step([ai, failed], 3).endswith("Failed: Timed out.")
+    assert describe_step([HumanMessage(content="Use the app.")], 3) == "User: Use the app."
+
+
+def test_compact_folds_the_oldest_steps() -> None:
+    messages = _history(6)
+    configuration = {"compaction_threshold": 4 * SCREENSHOT_TOKENS}
+
+    update = compact({"messages": messages}, configuration)
+
+    # Steps are folded until the request fits in half the threshold.
+    assert len(update["history_log"]) == 5
+    assert update["history_log"][0].startswith("Step 1. Actions: click left at (0, 0).")
+    assert "URL: https://site.test/0" in update["history_log"][0]
+    assert update["compacted_through"] == "tool_4"
+
+    state = {"messages": messages, **update}
+    compacted = apply_compaction(messages, state)
+    assert [m.id for m in compacted[:1]] == ["task"]
+    assert compacted[1].content.startswith(HISTORY_LOG_HEADER)
+    assert [m.id for m in compacted[2:]] == ["ai_5", "tool_5"]
+    assert estimate_request_tokens(state, configuration) <= 2 * SCREENSHOT_TOKENS
+
+    # The latest step is always kept, even if the request is still too large.
+    assert compact(state, {"compaction_threshold": 1}) == {}
+
+
+def test_compact_appends_to_the_log() -> None:
+    messages = _history(3)
+    state = {"messages": messages, "history_log": ["Step 1. ..."], "compacted_through": "tool_0"}
+    messages.extend(_step(3))
+
+    update = compact({**state, "messages": messages}, {"compaction_threshold": 2})
+
+    assert [line.split(".")[0] for line in update["history_log"]] == ["Step 2", "Step 3"]
+    assert update["compacted_through"] == "tool_2"
+
+
+def test_history_log_is_limited() -> None:
+    history_log = [f"Step {step}. Actions: click left at (0, 0)." for step in range(1, 101)]
+
+    content = history_log_message(history_log, max_tokens=100).content
+
+    lines = content.splitlines()
+    assert lines[0] == HISTORY_LOG_HEADER
+    assert lines[1] == f"({100 - len(lines) + 2} earlier steps are not shown.)"
+    assert lines[-1] == history_log[-1]
+    assert len(content) // 4 <= 100
+
+
+def test_only_full_histories_are_compacted() -> None:
+    messages = _history(6)
+    configuration = {"compaction_threshold": 4 * SCREENSHOT_TOKENS, "zdr_enabled": False}
+
+    # Chained requests only send the latest tool messages, so they are never compacted.
+    assert not needs_compaction({"messages": messages}, configuration)
+    assert needs_compaction({"messages": messages}, {**configuration, "zdr_enabled": True})
+    assert needs_compaction(
+        {"messages": [*messages, HumanMessage(content="Now book it.")]}, configuration
+    )
+    replayed = messages[-2].model_copy(
+        update={"additional_kwargs": {**messages[-2].additional_kwargs, REPLAYED_KEY: True}}
+    )
+    assert needs_compaction({"messages": [*messages[:-2], replayed, messages[-1]]}, configuration)
+
+
+@pytest.mark.asyncio
+async def test_graph_compacts_the_history(use_model, client) -> None:
+    clicks = [[{"type": "click", "button": "left", "x": i, "y": i}] for i in range(8)]
+    model = ScriptedModel([*clicks, "Done."])
+    use_model(model)
+    graph = create_cua(
+        scrapybara_api_key=client.api_key,
+        zdr_enabled=True,
+        compaction_threshold=3 * SCREENSHOT_TOKENS,
+    )
+
+    result = await graph.ainvoke({"messages": [HumanMessage(content="Click around.")]})
+
+    # The messages in state are kept as they are.
+    assert len(result["messages"]) == 1 + 2 * 8 + 1
+    assert result["history_log"][0].startswith("Step 1. Actions: click left at (0, 0).")
+    assert "URL: https://site.test/page/1" in result["history_log"][0]
+
+    last_request = model.calls[-1]["messages"]
+    assert last_request[0].content == "Click around."
+    assert last_request[1].content.startswith(HISTORY_LOG_HEADER)
+    screenshots = [
+        block
+        for message in last_request
+        if isinstance(message.content, list)
+        for block in message.content
+        if block.get("image_url") != OMITTED_SCREENSHOT_URL
+    ]
+    assert 0 < len(screenshots) < 3
+
+
+@pytest.mark.asyncio
+async def test_follow_up_turns_are_compacted(use_model, client) -> None:
+    clicks = [[{"type": "click", "button": "left", "x": i, "y": i}] for i in range(8)]
+    model = use_model(ScriptedModel([*clicks, "Done.", "Booked."]))
+    configured = create_cua(
+        scrapybara_api_key=client.api_key, compaction_threshold=3 * SCREENSHOT_TOKENS
+    )
+    graph = workflow.compile(checkpointer=InMemorySaver()).with_config(configured.config)
+    config = {"configurable": {"thread_id": "thread-1"}}
+
+    first = await graph.ainvoke({"messages": [HumanMessage(content="Click around.")]}, config)
+    await graph.ainvoke({"messages": [HumanMessage(content="Now book it.")]}, config)
+
+    # Each step of the first run is chained from the previous response, so nothing is
+    # compacted, but the follow-up turn sends the full history, so it is compacted first.
+    assert not first.get("history_log")
+    follow_up_request = model.calls[len(clicks) + 1]["messages"]
+    assert follow_up_request[0].content == "Click around."
+    assert follow_up_request[1].content.startswith(HISTORY_LOG_HEADER)
+    assert follow_up_request[-1].content == "Now book it."
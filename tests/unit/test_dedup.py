@@ -0,0 +1,98 @@
+import pytest
+from langchain_core.messages import AIMessage, ToolMessage
+
+from langgraph_cua.images import find_similar_hash, hamming_distance, perceptual_hash
+from langgraph_cua.nodes import take_computer_action
+from tests.fakes import FakeAsyncScrapybara, computer_call, make_png
+
+CONFIG = {"configurable": {"scrapybara_api_key": "test-key", "screenshot_dedup": "exact"}}
+
+
+def test_find_similar_hash() -> None:
+    known = {"perceptual:00ff": "call_1", "exact:abc": "call_2"}
+
+    assert find_similar_hash("exact:abc", known) == "exact:abc"
+    assert find_similar_hash("exact:abd", known) is None
+    assert find_similar_hash("perceptual:00fe", known) is None
+    assert find_similar_hash("perceptual:00fe", known, max_distance=1) == "perceptual:00ff"
+    assert hamming_distance("00ff", "00fe") == 1
+
+
+def test_perceptual_hash() -> None:
+    pytest.importorskip("PIL")
+    black = perceptual_hash(make_png(64, 64, (0, 0, 0)))
+
+    assert perceptual_hash(make_png(64, 64, (0, 0, 0))) == black
+    assert len(black) == 64
+
+
+async def _step(state: dict, action: dict, call_id: str, config: dict = CONFIG) -> dict:
+    message = AIMessage(
+        content="", additional_kwargs={"tool_outputs": [computer_call(action, call_id)]}
+    )
+    state["messages"].append(message)
+    update = await take_computer_action(state, config)
+    state["messages"].append(ToolMessage(**update["messages"][0]))
+    state["screenshot_hashes"] = {
+        **state["screenshot_hashes"],
+        **update.get("screenshot_hashes", {}),
+    }
+    state["last_screenshot_hash"] = update["last_screenshot_hash"]
+    return update
+
+
+@pytest.mark.asyncio
+async def test_unchanged_screens_reuse_earlier_image(monkeypatch) -> None:
+    client = FakeAsyncScrapybara(api_key="test-key")
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    instance = await client.start_browser()
+    state = {
+        "messages": [],
+        "instance_id": instance.id,
+        "stream_url": "https://stream.test",
+        "screenshot_hashes": {},
+    }
+
+    first = await _step(state, {"type": "screenshot"}, "call_1")
+    second = await _step(state, {"type": "move", "x": 1, "y": 1}, "call_2")
+    await _step(state, {"type": "click", "button": "left", "x": 1, "y": 1}, "call_3")
+    fourth = await _step(state, {"type": "screenshot"}, "call_4")
+
+    assert "duplicate_of" not in first["messages"][0]["additional_kwargs"]
+    assert second["messages"][0]["additional_kwargs"]["duplicate_of"] == "call_1"
+    assert second["messages"][0]["additional_kwargs"]["screen_unchanged"] is True
+    assert (
+        second["messages"][0]["content"][0]["image_url"]
+        is (first["messages"][0]["content"][0]["image_url"])
+    )
+    assert "screenshot_hashes" not in second
+    assert fourth["messages"][0]["additional_kwargs"]["duplicate_of"] == "call_3"
+    assert len(state["screenshot_hashes"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_similar_screens_keep_their_own_image(monkeypatch) -> None:
+    pytest.importorskip("PIL")
+    client = FakeAsyncScrapybara(api_key="test-key")
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    instance = await client.start_browser()
+    state = {
+        "messages": [],
+        "instance_id": instance.id,
+        "stream_url": "https://stream.test",
+        "screenshot_hashes": {},
+    }
+    config = {"configurable": {**CONFIG["configurable"], "screenshot_dedup": "perceptual"}}
+
+    first = await _step(state, {"type": "screenshot"}, "call_1", config)
+    second = await _step(state, {"type": "move", "x": 1, "y": 1}, "call_2", config)
+
+    additional_kwargs = second["messages"][0]["additional_kwargs"]
+    assert "duplicate_of" not in additional_kwargs
+    assert additional_kwargs["similar_to"] == "call_1"
+    assert additional_kwargs["screen_unchanged"] is True
+    assert (
+        second["messages"][0]["content"][0]["image_url"]
+        is not first["messages"][0]["content"][0]["image_url"]
+    )
+    assert "screenshot_hashes" not in second
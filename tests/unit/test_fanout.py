@@ -0,0 +1,134 @@
+import pytest
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.errors import GraphInterrupt
+from langgraph.graph import START, StateGraph
+
+from langgraph_cua import create_cua_fan_out
+from langgraph_cua.fanout import CUAFanOutState, merge_subtask_results
+from tests.fakes import FakeAsyncScrapybara, TrajectoryModel
+
+STEPS = 3
+LATENCY = 0.05
+
+
+class FailingModel(TrajectoryModel):
+    """Fails any subtask which asks it to, after its first step if it asks to fail late."""
+
+    async def ainvoke(self, messages, previous_response_id=None, **kwargs):
+        if messages and messages[-1].content == "fail":
+            raise RuntimeError("boom")
+        if messages and messages[-1].content == "interrupt":
+            raise GraphInterrupt(())
+        if previous_response_id == "resp_0" and getattr(self, "fail_late", False):
+            raise RuntimeError("late boom")
+        return await super().ainvoke(messages, previous_response_id, **kwargs)
+
+
+@pytest.fixture
+def client(client, use_model) -> FakeAsyncScrapybara:
+    client.latency = LATENCY
+    use_model(FailingModel(STEPS, LATENCY))
+    return client
+
+
+def test_merge_subtask_results() -> None:
+    def result(index: int, answer: str):
+        return {"index": index, "answer": answer}
+
+    merged = merge_subtask_results([result(2, "c")], [result(0, "a"), result(2, "C")])
+
+    assert merged == [result(0, "a"), result(2, "C")]
+    assert merge_subtask_results(merged, None) == []
+
+
+@pytest.mark.asyncio
+async def test_subtasks_run_concurrently_on_separate_instances(client) -> None:
+    subtasks = [f"Find the price on site {i}." for i in range(4)]
+    graph = create_cua_fan_out(scrapybara_api_key=client.api_key)
+
+    result = await graph.ainvoke(
+        {"messages": [HumanMessage(content="Compare prices.")], "subtasks": subtasks}
+    )
+
+    # Run one after another, there would never be more than one request in flight.
+    assert client.max_in_flight > 1
+
+    assert [r["subtask"] for r in result["results"]] == subtasks
+    assert all(r["answer"] == "Done." and r["error"] is None for r in result["results"])
+    instance_ids = {r["state"]["instance_id"] for r in result["results"]}
+    assert instance_ids == set(client.instances)
+    assert len(instance_ids) == 4
+    assert result["messages"][-1].content.startswith("1. Find the price on site 0.\nDone.")
+    # Each branch sees the task, then its subtask, and stops its instance once it ends.
+    assert [[m.content for m in r["state"]["messages"][:2]] for r in result["results"]] == [
+        ["Compare prices.", subtask] for subtask in subtasks
+    ]
+    assert {instance.status for instance in client.instances.values()} == {"terminated"}
+
+
+@pytest.mark.asyncio
+async def test_split_task_and_failed_subtasks(client) -> None:
+    graph = create_cua_fan_out(
+        scrapybara_api_key=client.api_key,
+        split_task=lambda messages: [messages[0].content, "fail"],
+        max_concurrency=1,
+    )
+
+    result = await graph.ainvoke({"messages": [HumanMessage(content="Click around.")]})
+
+    succeeded, failed = result["results"]
+    assert succeeded["answer"] == "Done."
+    assert failed["state"] is None
+    assert failed["error"] == "RuntimeError: boom"
+    assert "2. fail\nFailed: RuntimeError: boom" in result["messages"][-1].content
+
+
+@pytest.mark.asyncio
+async def test_failed_subtask_stops_its_instance(use_model, client) -> None:
+    model = FailingModel(STEPS, LATENCY)
+    model.fail_late = True
+    use_model(model)
+    graph = create_cua_fan_out(scrapybara_api_key=client.api_key)
+
+    result = await graph.ainvoke(
+        {"messages": [HumanMessage(content="Click.")], "subtasks": ["Click once."]}
+    )
+
+    assert result["results"][0]["error"] == "RuntimeError: late boom"
+    assert [instance.status for instance in client.instances.values()] == ["terminated"]
+
+
+@pytest.mark.asyncio
+async def test_interrupts_are_not_recorded_as_failures(client) -> None:
+    graph = create_cua_fan_out(scrapybara_api_key=client.api_key)
+
+    result = await graph.ainvoke(
+        {"messages": [HumanMessage(content="Click.")], "subtasks": ["interrupt"]}
+    )
+
+    # The interrupt reaches the parent graph, so the subtask isn't recorded as failed.
+    assert result["results"] == []
+
+
+@pytest.mark.asyncio
+async def test_each_task_on_a_thread_is_planned_afresh(client) -> None:
+    def split_task(messages):
+        return [f"{messages[-1].content} Site {i}." for i in range(2)]
+
+    workflow = StateGraph(CUAFanOutState)
+    workflow.add_node(
+        "fan_out", create_cua_fan_out(scrapybara_api_key=client.api_key, split_task=split_task)
+    )
+    workflow.add_edge(START, "fan_out")
+    graph = workflow.compile(checkpointer=InMemorySaver())
+    config = {"configurable": {"thread_id": "thread-1"}}
+
+    await graph.ainvoke({"messages": [HumanMessage(content="Find the price.")]}, config)
+    result = await graph.ainvoke({"messages": [HumanMessage(content="Find the rating.")]}, config)
+
+    assert [r["subtask"] for r in result["results"]] == [
+        "Find the rating. Site 0.",
+        "Find the rating. Site 1.",
+    ]
+    assert result["subtasks"] == []
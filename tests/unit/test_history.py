@@ -0,0 +1,209 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from langgraph_cua.history import (
+    FAILURE_NOTE_HEADER,
+    OMITTED_SCREENSHOT_URL,
+    add_failure_notes,
+    apply_screenshot_retention,
+    omit_duplicate_screenshots,
+)
+from tests.fakes import computer_call
+
+
+def _trajectory(steps: int) -> list:
+    messages = [HumanMessage(content="Find the price.")]
+    for step in range(steps):
+        call_id = f"call_{step}"
+        messages.append(
+            AIMessage(
+                content="",
+                additional_kwargs={
+                    "tool_outputs": [computer_call({"type": "screenshot"}, call_id)]
+                },
+            )
+        )
+        messages.append(
+            ToolMessage(
+                content=[{"type": "input_image", "image_url": f"data:image/png;base64,{step}"}],
+                tool_call_id=call_id,
+                additional_kwargs={"type": "computer_call_output"},
+            )
+        )
+    return messages
+
+
+def _image_urls(messages: list) -> list:
+    return [m.content[0]["image_url"] for m in messages if m.type == "tool"]
+
+
+def test_retention_keeps_last_screenshots() -> None:
+    messages = _trajectory(5)
+
+    retained = apply_screenshot_retention(messages, 2)
+
+    assert _image_urls(retained) == [OMITTED_SCREENSHOT_URL] * 3 + [
+        "data:image/png;base64,3",
+        "data:image/png;base64,4",
+    ]
+    assert [m.tool_call_id for m in retained if m.type == "tool"] == [
+        m.tool_call_id for m in messages if m.type == "tool"
+    ]
+    # The original messages are left untouched.
+    assert _image_urls(messages)[0] == "data:image/png;base64,0"
+
+
+def test_retention_request_size_is_bounded() -> None:
+    for steps in (10, 100, 1000):
+        urls = _image_urls(apply_screenshot_retention(_trajectory(steps), 3))
+
+        assert len(urls) == steps
+        assert len([url for url in urls if url != OMITTED_SCREENSHOT_URL]) == 3
+
+
+def test_retention_keeps_real_screenshots_across_batched_turns() -> None:
+    messages = [HumanMessage(content="Fill in the form.")]
+    for turn in range(4):
+        call_ids = [f"c{turn}_{i}" for i in range(3)]
+        messages.append(
+            AIMessage(
+                content="",
+                additional_kwargs={
+                    "tool_outputs": [computer_call({"type": "screenshot"}, c) for c in call_ids]
+                },
+            )
+        )
+        # The earlier calls in a response share the screenshot taken after the last one.
+        image = [{"type": "input_image", "image_url": f"data:image/png;base64,{turn}"}]
+        messages.extend(
+            ToolMessage(
+                content=image,
+                tool_call_id=call_id,
+                additional_kwargs={"type": "computer_call_output", "duplicate_of": call_ids[-1]}
+                if call_id != call_ids[-1]
+                else {"type": "computer_call_output"},
+            )
+            for call_id in call_ids
+        )
+
+    for deduplicated in (messages, omit_duplicate_screenshots(messages)):
+        retained = apply_screenshot_retention(deduplicated, 3)
+
+        kept = [
+            m.tool_call_id
+            for m in retained
+            if m.type == "tool"
+            and m.content[0]["image_url"] != OMITTED_SCREENSHOT_URL
+            and "duplicate_of" not in m.additional_kwargs
+        ]
+        assert kept == ["c1_2", "c2_2", "c3_2"]
+
+
+def test_retention_disabled() -> None:
+    messages = _trajectory(3)
+
+    assert apply_screenshot_retention(messages, None) == messages
+
+
+def test_omit_duplicate_screenshots() -> None:
+    messages = _trajectory(4)
+    messages[4].additional_kwargs["duplicate_of"] = "call_0"
+    messages[8].additional_kwargs["duplicate_of"] = "call_0"
+
+    deduplicated = omit_duplicate_screenshots(messages)
+
+    assert _image_urls(deduplicated) == [
+        "data:image/png;base64,0",
+        OMITTED_SCREENSHOT_URL,
+        "data:image/png;base64,2",
+        # The latest screenshot is always sent, even if it is a duplicate.
+        "data:image/png;base64,3",
+    ]
+
+
+def test_omit_similar_screenshots_keeps_the_newest() -> None:
+    messages = _trajectory(5)
+    messages[4].additional_kwargs["similar_to"] = "call_0"
+    messages[8].additional_kwargs["similar_to"] = "call_0"
+
+    deduplicated = omit_duplicate_screenshots(messages)
+
+    # Similar screenshots can differ in a small region, so the newest one is kept.
+    assert _image_urls(deduplicated) == [
+        OMITTED_SCREENSHOT_URL,
+        OMITTED_SCREENSHOT_URL,
+        "data:image/png;base64,2",
+        "data:image/png;base64,3",
+        "data:image/png;base64,4",
+    ]
+
+
+def test_stable_prefix_deduplication_only_appends() -> None:
+    messages = _trajectory(6)
+    messages[4].additional_kwargs["similar_to"] = "call_0"
+    messages[6].additional_kwargs["duplicate_of"] = "call_0"
+    messages[10].additional_kwargs["similar_to"] = "call_0"
+    # A response with two calls, whose first output copies the screenshot of the second.
+    messages.append(AIMessage(content="", additional_kwargs={"tool_outputs": []}))
+    messages.extend(
+        ToolMessage(
+            content=[{"type": "input_image", "image_url": "data:image/png;base64,6"}],
+            tool_call_id=call_id,
+            additional_kwargs={"duplicate_of": "call_7"} if call_id == "call_6" else {},
+        )
+        for call_id in ("call_6", "call_7")
+    )
+    turn_ends = [1 + 2 * steps for steps in range(1, 7)] + [len(messages)]
+    requests = [omit_duplicate_screenshots(messages[:end], stable_prefix=True) for end in turn_ends]
+
+    # Each request is the previous one, byte for byte, with the new messages at the end.
+    for i in range(1, len(requests)):
+        previous = requests[i - 1]
+        assert [m.model_dump_json() for m in requests[i][: len(previous)]] == [
+            m.model_dump_json() for m in previous
+        ]
+    # Only the copy which was never the latest screenshot is dropped.
+    assert _image_urls(requests[-1]).count(OMITTED_SCREENSHOT_URL) == 1
+    assert requests[-1][-2].content[0]["image_url"] == OMITTED_SCREENSHOT_URL
+
+
+def test_stable_prefix_retention_omits_screenshots_in_blocks() -> None:
+    kept = [
+        len(
+            [
+                url
+                for url in _image_urls(apply_screenshot_retention(_trajectory(steps), 3, True))
+                if url != OMITTED_SCREENSHOT_URL
+            ]
+        )
+        for steps in range(1, 10)
+    ]
+
+    assert kept == [1, 2, 3, 4, 5, 3, 4, 5, 3]
+
+
+def test_stable_prefix_retention_only_appends_between_blocks() -> None:
+    messages = _trajectory(12)
+    requests = [
+        apply_screenshot_retention(messages[: 1 + 2 * steps], 4, True) for steps in range(1, 13)
+    ]
+
+    # Each request extends the previous one, except when a block of screenshots is omitted.
+    changed = [
+        i + 1
+        for i in range(1, len(requests))
+        if requests[i][: len(requests[i - 1])] != requests[i - 1]
+    ]
+    assert changed == [8, 12]
+
+
+def test_failure_notes_follow_failed_outputs() -> None:
+    messages = _trajectory(2)
+    failed = messages[2].model_copy(
+        update={"status": "error", "additional_kwargs": {"error": "ApiError: Bad request."}}
+    )
+    messages[2] = failed
+
+    noted = add_failure_notes(messages)
+
+    assert [m.type for m in noted] == ["human", "ai", "tool", "human", "ai", "tool"]
+    assert noted[3].content == f"{FAILURE_NOTE_HEADER}\n- call_0: ApiError: Bad request."
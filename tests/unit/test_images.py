@@ -0,0 +1,83 @@
+import base64
+import importlib
+import io
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from langgraph_cua.images import atranscode_screenshot, needs_transcoding, transcode_screenshot
+from langgraph_cua.nodes import take_computer_action
+from tests.fakes import FakeAsyncScrapybara, computer_call, make_png
+
+Image = pytest.importorskip("PIL.Image")
+take_computer_action_module = importlib.import_module("langgraph_cua.nodes.take_computer_action")
+
+
+def test_needs_transcoding() -> None:
+    assert not needs_transcoding("png", 1)
+    assert needs_transcoding("jpeg", 1)
+    assert needs_transcoding("png", 0.5)
+
+
+@pytest.mark.parametrize("image_format", ["png", "jpeg", "webp"])
+def test_transcode_screenshot(image_format) -> None:
+    data, media_type = transcode_screenshot(
+        make_png(1024, 768, (10, 20, 30)), image_format, quality=50, scale=0.5
+    )
+
+    assert media_type == f"image/{image_format}"
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.format == image_format.upper()
+        assert image.size == (512, 384)
+
+
+@pytest.mark.asyncio
+async def test_atranscode_screenshot() -> None:
+    data, media_type = await atranscode_screenshot(make_png(), "jpeg")
+
+    assert media_type == "image/jpeg"
+    assert data[:2] == b"\xff\xd8"
+
+
+def test_scale_action_coordinates() -> None:
+    scale_action = take_computer_action_module._scale_action_coordinates
+
+    assert scale_action({"type": "click", "x": 50, "y": 25}, 0.5) == {
+        "type": "click",
+        "x": 100,
+        "y": 50,
+    }
+    assert scale_action({"type": "drag", "path": [{"x": 1, "y": 2}]}, 0.5)["path"] == [
+        {"x": 2, "y": 4}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_take_computer_action_transcodes_and_rescales(monkeypatch) -> None:
+    client = FakeAsyncScrapybara(api_key="test-key")
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    instance = await client.start_browser()
+    config = {
+        "configurable": {
+            "scrapybara_api_key": "test-key",
+            "screenshot_format": "jpeg",
+            "screenshot_scale": 0.5,
+        }
+    }
+    message = AIMessage(
+        content="",
+        additional_kwargs={
+            "tool_outputs": [computer_call({"type": "click", "button": "left", "x": 10, "y": 20})]
+        },
+    )
+
+    update = await take_computer_action(
+        {"messages": [message], "instance_id": instance.id, "stream_url": "https://stream.test"},
+        config,
+    )
+
+    assert instance.calls[-1]["coordinates"] == [20, 40]
+    image_url = update["messages"][0]["content"][0]["image_url"]
+    assert image_url.startswith("data:image/jpeg;base64,")
+    with Image.open(io.BytesIO(base64.b64decode(image_url.split(",", 1)[1]))) as image:
+        assert image.size == (4, 4)
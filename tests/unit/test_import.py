@@ -1,3 +1,50 @@
+import subprocess
+import sys
+
+# Importing the package should only load the package itself. The SDKs behind the graph are
+# loaded once `create_cua` or `graph` is first used. The package alone imports in well under
+# a millisecond, so the time budget leaves plenty of room for slow machines, while still
+# catching an SDK being imported eagerly again, which takes hundreds of milliseconds.
+IMPORT_TIME_BUDGET_US = 100_000
+LOADED_MODULES_BUDGET = 10
+
+
 def test_import() -> None:
     """Test that the code can be imported"""
     from langgraph_cua import CUAState, create_cua, graph  # noqa: F401
+
+
+def test_exports_are_not_hidden_by_submodules() -> None:
+    import langgraph_cua
+    import langgraph_cua.graph
+    import langgraph_cua.nodes
+    import langgraph_cua.nodes.call_model  # noqa: F401
+
+    assert langgraph_cua.graph.name == "Computer Use Agent"
+    assert callable(langgraph_cua.nodes.call_model)
+
+
+def test_import_only_loads_the_package() -> None:
+    code = (
+        "import sys; before = set(sys.modules); import langgraph_cua; "
+        "print('\\n'.join(set(sys.modules) - before))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    loaded = result.stdout.split()
+    assert "langgraph_cua" in loaded
+    assert [name for name in loaded if name.split(".")[0] != "langgraph_cua"] == []
+    assert len(loaded) <= LOADED_MODULES_BUDGET
+
+    # Each line is "import time: <self us> | <cumulative us> | <module>".
+    cumulative_us = next(
+        int(line.split("|")[1])
+        for line in result.stderr.splitlines()
+        if line.split("|")[-1].strip() == "langgraph_cua"
+    )
+    assert cumulative_us < IMPORT_TIME_BUDGET_US
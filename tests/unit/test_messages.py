@@ -0,0 +1,92 @@
+import importlib
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, ToolMessage
+from langgraph.graph import add_messages
+
+from langgraph_cua import create_cua
+from langgraph_cua.messages import MessageList, append_messages
+from tests.fakes import FakeAsyncScrapybara, ScriptedModel
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+TOOL_OUTPUT = {
+    "role": "tool",
+    "content": [{"type": "input_image", "image_url": "data:image/png;base64,AAAA"}],
+    "tool_call_id": "call_1",
+    "additional_kwargs": {"type": "computer_call_output"},
+}
+
+
+def test_append_messages_matches_add_messages() -> None:
+    history = [HumanMessage(content="hi", id="1"), AIMessage(content="", id="2")]
+    update = [TOOL_OUTPUT, AIMessage(content="edited", id="2")]
+
+    expected = add_messages(history, update)
+    merged = append_messages(history, update)
+
+    assert isinstance(merged, MessageList)
+    assert [(m.type, m.content) for m in merged] == [(m.type, m.content) for m in expected]
+    assert isinstance(merged[2], ToolMessage)
+    assert merged._index == {m.id: i for i, m in enumerate(merged)}
+
+
+def test_append_messages_does_not_modify_history() -> None:
+    history = append_messages([], [HumanMessage(content="hi", id="1")])
+
+    merged = append_messages(history, [AIMessage(content="", id="2")])
+    replaced = append_messages(merged, [HumanMessage(content="edited", id="1")])
+
+    assert [m.id for m in history] == ["1"]
+    assert merged[0].content == "hi"
+    assert [m.content for m in replaced] == ["edited", ""]
+    # The index is shared, rather than copied on each step.
+    assert replaced._index is history._index
+
+
+def test_append_messages_branches_share_the_index() -> None:
+    history = append_messages([], [HumanMessage(content="hi", id="1")])
+    first = append_messages(history, [AIMessage(content="first", id="2")])
+    # A branch from the earlier state puts another message where the first branch put "2".
+    second = append_messages(history, [AIMessage(content="second", id="3")])
+
+    assert [m.id for m in append_messages(second, [AIMessage(content="", id="2")])] == [
+        "1",
+        "3",
+        "2",
+    ]
+    assert [m.content for m in append_messages(first, [AIMessage(content="edited", id="2")])] == [
+        "hi",
+        "edited",
+    ]
+    assert [m.content for m in append_messages(second, [AIMessage(content="edited", id="3")])] == [
+        "hi",
+        "edited",
+    ]
+
+
+def test_append_messages_falls_back_for_removals() -> None:
+    history = append_messages([], [HumanMessage(content="hi", id="1"), AIMessage("", id="2")])
+
+    merged = append_messages(history, [RemoveMessage(id="1")])
+
+    assert [m.id for m in merged] == ["2"]
+    # The index is rebuilt the next time the list is reduced.
+    assert [m.id for m in append_messages(merged, [HumanMessage(content="", id="3")])] == [
+        "2",
+        "3",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_append_only_graph(monkeypatch) -> None:
+    client = FakeAsyncScrapybara(api_key="test-key")
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    model = ScriptedModel([[{"type": "click", "button": "left", "x": 1, "y": 1}], "Done."])
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+
+    graph = create_cua(scrapybara_api_key="test-key", append_only_messages=True)
+    result = await graph.ainvoke({"messages": [HumanMessage(content="Click.")]})
+
+    assert [m.type for m in result["messages"]] == ["human", "ai", "tool", "ai"]
+    assert len({m.id for m in result["messages"]}) == 4
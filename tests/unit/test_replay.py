@@ -0,0 +1,173 @@
+import importlib
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from langgraph_cua import create_cua
+from langgraph_cua.graph import workflow
+from langgraph_cua.replay import TrajectoryCache, get_step
+from tests.fakes import FakeAsyncScrapybara, ScriptedModel, computer_call
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+CLICKS = [
+    [{"type": "click", "button": "left", "x": 1, "y": 1}],
+    [{"type": "type", "text": "hello"}],
+    "Done.",
+]
+
+
+@pytest.fixture
+def client(monkeypatch) -> FakeAsyncScrapybara:
+    client = FakeAsyncScrapybara(api_key="test-key")
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    return client
+
+
+async def _run(monkeypatch, model, cache):
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    graph = create_cua(scrapybara_api_key="test-key", trajectory_cache=cache, task_key="task")
+    return await graph.ainvoke({"messages": [HumanMessage(content="Say hello.")]})
+
+
+def test_cache_only_records_computer_calls(tmp_path) -> None:
+    cache = TrajectoryCache()
+    call = AIMessage(content="", additional_kwargs={"tool_outputs": [computer_call({})]})
+    cache.put("task", 0, None, call)
+    cache.put("task", 1, "exact:a", AIMessage(content="Done."))
+
+    path = str(tmp_path / "trajectories.json")
+    cache.save(path)
+    loaded = TrajectoryCache.load(path)
+
+    assert len(loaded) == 1
+    assert loaded.get("task", 0, None)["tool_outputs"] == [computer_call({})]
+    assert loaded.get("task", 0, "exact:a") is None
+
+
+def test_cache_matches_similar_screens() -> None:
+    cache = TrajectoryCache(max_distance=2)
+    reasoning = {"id": "rs_1", "summary": []}
+    call = AIMessage(
+        content="",
+        additional_kwargs={"tool_outputs": [computer_call({})], "reasoning": reasoning},
+    )
+    cache.put("task", 1, "perceptual:ff00", call)
+
+    assert cache.get("task", 1, "perceptual:ff03")["reasoning"] == reasoning
+    assert cache.get("task", 1, "perceptual:ff07") is None
+    assert cache.get("task", 2, "perceptual:ff00") is None
+
+
+def test_get_step() -> None:
+    assert get_step([HumanMessage(content="hi"), AIMessage(content="")]) == 1
+
+
+def test_get_step_counts_from_the_start_of_the_run() -> None:
+    messages = [
+        HumanMessage(content="hi", id="human-1"),
+        AIMessage(content="", id="ai-1"),
+        HumanMessage(content="again", id="human-2"),
+        AIMessage(content="", id="ai-2"),
+    ]
+
+    assert get_step(messages, {"message_id": "human-2"}) == 1
+    assert get_step(messages[:3], {"message_id": "human-2"}) == 0
+    assert get_step(messages, {"message_id": "missing"}) == 2
+
+
+@pytest.mark.asyncio
+async def test_each_run_on_a_thread_records_from_the_first_step(monkeypatch, client) -> None:
+    cache = TrajectoryCache()
+    model = ScriptedModel([*CLICKS, *CLICKS])
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    configured = create_cua(
+        scrapybara_api_key="test-key",
+        trajectory_cache=cache,
+        task_key="task",
+        trajectory_mode="record",
+    )
+    graph = workflow.compile(checkpointer=InMemorySaver()).with_config(configured.config)
+    config = {"configurable": {"thread_id": "thread-1"}}
+
+    for task in ("Say hello.", "Say hello again."):
+        await graph.ainvoke({"messages": [HumanMessage(content=task)]}, config)
+
+    # The second run starts from the screen the first one left, so its first step is
+    # recorded alongside the first run's, rather than after it.
+    assert sorted(cache._entries) == [("task", 0), ("task", 1)]
+    assert len(cache._entries[("task", 0)]) == 2
+
+
+@pytest.mark.asyncio
+async def test_replay_skips_model_calls(monkeypatch, client) -> None:
+    cache = TrajectoryCache()
+    await _run(monkeypatch, ScriptedModel(CLICKS), cache)
+    assert len(cache) == 2
+
+    model = ScriptedModel(["Done again."])
+    result = await _run(monkeypatch, model, cache)
+
+    # Only the final answer comes from the model, with the full history, since replayed
+    # steps have no response to chain from.
+    assert len(model.calls) == 1
+    assert model.calls[0]["kwargs"] == {}
+    assert [m.type for m in model.calls[0]["messages"]] == ["human", "ai", "tool", "ai", "tool"]
+    assert [call["action"] for call in client.instances["browser-1"].calls] == [
+        "click_mouse",
+        "type_text",
+    ]
+    assert result["messages"][-1].content == "Done again."
+
+
+@pytest.mark.asyncio
+async def test_replay_falls_back_to_model_when_screen_diverges(monkeypatch, client) -> None:
+    cache = TrajectoryCache()
+    await _run(monkeypatch, ScriptedModel(CLICKS), cache)
+    # Make the second step look like it was recorded from a different screen.
+    (entry,) = cache._entries[("task", 1)].values()
+    cache._entries[("task", 1)] = {"exact:other": entry}
+
+    model = ScriptedModel(CLICKS[1:])
+    await _run(monkeypatch, model, cache)
+
+    assert len(model.calls) == 2
+    assert model.calls[0]["kwargs"] == {}
+    assert model.calls[1]["kwargs"] == {"previous_response_id": "resp_0"}
+    # The divergent step was recorded from the new screen.
+    assert len(cache) == 3
+
+
+@pytest.mark.asyncio
+async def test_record_mode_does_not_replay(monkeypatch, client) -> None:
+    cache = TrajectoryCache()
+    await _run(monkeypatch, ScriptedModel(CLICKS), cache)
+
+    model = ScriptedModel(CLICKS)
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    graph = create_cua(
+        scrapybara_api_key="test-key",
+        trajectory_cache=cache,
+        task_key="task",
+        trajectory_mode="record",
+    )
+    await graph.ainvoke({"messages": [HumanMessage(content="Say hello.")]})
+
+    assert len(model.calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_replay_includes_reasoning(monkeypatch, client) -> None:
+    cache = TrajectoryCache()
+    await _run(monkeypatch, ScriptedModel(CLICKS), cache)
+    reasoning = {"id": "rs_1", "summary": []}
+    for entries in cache._entries.values():
+        for entry in entries.values():
+            entry["reasoning"] = reasoning
+
+    model = ScriptedModel(["Done again."])
+    await _run(monkeypatch, model, cache)
+
+    replayed = [m for m in model.calls[0]["messages"] if m.type == "ai"]
+    assert [m.additional_kwargs["reasoning"] for m in replayed] == [reasoning, reasoning]
@@ -0,0 +1,205 @@
+import importlib
+
+import httpx
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, convert_to_messages
+from langgraph.checkpoint.memory import InMemorySaver
+from scrapybara.core.api_error import ApiError
+
+from langgraph_cua import create_cua
+from langgraph_cua.graph import workflow
+from langgraph_cua.history import OMITTED_SCREENSHOT_URL
+from langgraph_cua.nodes.take_computer_action import take_computer_action
+from langgraph_cua.retry import RetryBudget, is_rejected_error, is_transient_error
+from tests.fakes import FakeAsyncScrapybara, FakeInstance, ScriptedModel, computer_call
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+
+class FlakyInstance(FakeInstance):
+    """A fake instance whose next `failures` actions raise the given errors, in order."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = []
+
+    async def computer(self, **kwargs):
+        if self.failures:
+            self.calls.append({"failed": True, **kwargs})
+            raise self.failures.pop(0)
+        return await super().computer(**kwargs)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr("langgraph_cua.retry.RETRY_BASE_DELAY_SECONDS", 0.0)
+
+
+@pytest.fixture
+def instance(monkeypatch) -> FlakyInstance:
+    client = FakeAsyncScrapybara(api_key="test-key")
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    instance = FlakyInstance("browser-0", "browser")
+    client.instances[instance.id] = instance
+    return instance
+
+
+async def _act(instance, actions, action_retries=0, **configurable):
+    state = {
+        "messages": [
+            AIMessage(
+                content="",
+                additional_kwargs={
+                    "tool_outputs": [
+                        computer_call(action, call_id=f"call_{i}")
+                        for i, action in enumerate(actions)
+                    ]
+                },
+            )
+        ],
+        "instance_id": instance.id,
+        "stream_url": "https://stream.test",
+        "action_retries": action_retries,
+    }
+    config = {"configurable": {"scrapybara_api_key": "test-key", **configurable}}
+    return await take_computer_action(state, config)
+
+
+def test_error_classification() -> None:
+    assert is_transient_error(ApiError(status_code=503))
+    assert is_transient_error(ApiError(status_code=500))
+    assert is_transient_error(httpx.ReadTimeout("timed out"))
+    assert not is_transient_error(ApiError(status_code=400))
+    assert not is_transient_error(ValueError("bad action"))
+
+    assert is_rejected_error(ApiError(status_code=429))
+    assert is_rejected_error(httpx.ConnectError("refused"))
+    assert not is_rejected_error(ApiError(status_code=500))
+    assert not is_rejected_error(httpx.ReadTimeout("timed out"))
+
+
+@pytest.mark.asyncio
+async def test_retry_budget_stops_when_exhausted() -> None:
+    budget = RetryBudget(max_retries=5, remaining=2)
+    attempts = 0
+
+    async def fail():
+        nonlocal attempts
+        attempts += 1
+        raise ApiError(status_code=503)
+
+    with pytest.raises(ApiError):
+        await budget.call(fail)
+    assert attempts == 3
+    assert budget.retries == 2
+    assert budget.remaining == 0
+
+
+@pytest.mark.asyncio
+async def test_transient_error_is_retried(instance) -> None:
+    instance.failures = [ApiError(status_code=503)]
+
+    update = await _act(instance, [{"type": "click", "button": "left", "x": 1, "y": 1}])
+
+    message = update["messages"][0]
+    assert "error" not in message["additional_kwargs"]
+    assert message["additional_kwargs"]["retry_seconds"] >= 0
+    assert update["action_retries"] == 1
+    assert [call["action"] for call in instance.calls] == ["click_mouse", "click_mouse"]
+
+
+@pytest.mark.asyncio
+async def test_each_run_gets_a_fresh_retry_budget(monkeypatch, instance) -> None:
+    click = {"type": "click", "button": "left", "x": 1, "y": 1}
+    model = ScriptedModel([[click], "Done.", [click], "Done."])
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    configured = create_cua(scrapybara_api_key="test-key", action_retry_budget=1)
+    graph = workflow.compile(checkpointer=InMemorySaver()).with_config(configured.config)
+    config = {"configurable": {"thread_id": "thread-1"}}
+
+    for task in ("Click.", "Click again."):
+        instance.failures = [ApiError(status_code=503)]
+        result = await graph.ainvoke(
+            {"messages": [HumanMessage(content=task)], "instance_id": instance.id}, config
+        )
+
+    # The first run used up the thread's budget of one retry, but the second run still
+    # retries its click.
+    assert result["action_retries"] == 2
+    last_output = [m for m in result["messages"] if m.type == "tool"][-1]
+    assert last_output.status == "success"
+    assert [call["action"] for call in instance.calls].count("click_mouse") == 4
+
+
+@pytest.mark.asyncio
+async def test_action_which_may_have_applied_is_not_retried(instance) -> None:
+    instance.failures = [ApiError(status_code=500)]
+
+    update = await _act(instance, [{"type": "type", "text": "hello"}])
+
+    assert update["messages"][0]["additional_kwargs"]["error"].startswith("ApiError")
+    assert update["messages"][0]["additional_kwargs"]["transient"] is True
+    assert "action_retries" not in update
+    assert [call["action"] for call in instance.calls] == ["type_text", "take_screenshot"]
+
+
+@pytest.mark.asyncio
+async def test_permanent_error_reports_the_failed_call(instance) -> None:
+    instance.failures = [ApiError(status_code=400)]
+
+    update = await _act(
+        instance,
+        [{"type": "click", "button": "left", "x": 1, "y": 1}, {"type": "screenshot"}],
+    )
+
+    messages = convert_to_messages(update["messages"])
+    assert [m.tool_call_id for m in messages] == ["call_0", "call_1"]
+    for message in messages:
+        assert message.status == "error"
+        assert message.content[0]["type"] == "input_image"
+    assert messages[0].additional_kwargs["transient"] is False
+    assert messages[1].additional_kwargs["error"] == (
+        "Not executed, because computer call call_0 failed."
+    )
+    assert len(instance.calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_calls_before_the_failure_succeed(instance) -> None:
+    click = {"type": "click", "button": "left", "x": 1, "y": 1}
+    original = instance.computer
+
+    async def fail_typing(**kwargs):
+        if kwargs.get("action") == "type_text":
+            instance.failures = [ApiError(status_code=400)]
+        return await original(**kwargs)
+
+    instance.computer = fail_typing
+
+    update = await _act(instance, [click, {"type": "type", "text": "hi"}, click])
+
+    messages = convert_to_messages(update["messages"])
+    assert [m.status for m in messages] == ["success", "error", "error"]
+    assert messages[1].additional_kwargs["error"].startswith("ApiError")
+    assert "transient" not in messages[2].additional_kwargs
+
+
+@pytest.mark.asyncio
+async def test_failure_output_falls_back_to_placeholder_image(instance) -> None:
+    instance.failures = [ApiError(status_code=400), ApiError(status_code=400)]
+
+    update = await _act(instance, [{"type": "click", "button": "left", "x": 1, "y": 1}])
+
+    assert update["messages"][0]["content"][0]["image_url"] == OMITTED_SCREENSHOT_URL
+
+
+@pytest.mark.asyncio
+async def test_thread_retry_budget_is_shared(instance) -> None:
+    instance.failures = [ApiError(status_code=503)]
+
+    update = await _act(
+        instance, [{"type": "screenshot"}], action_retries=10, action_retry_budget=10
+    )
+
+    assert update["messages"][0]["additional_kwargs"]["error"].startswith("ApiError")
+    assert "action_retries" not in update
@@ -0,0 +1,135 @@
+import base64
+import importlib
+import threading
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from langgraph_cua.nodes import call_model, take_computer_action
+from langgraph_cua.screenshot_store import (
+    InMemoryScreenshotStore,
+    LocalFileScreenshotStore,
+    MmapScreenshotStore,
+    is_screenshot_ref,
+    make_screenshot_ref,
+    parse_screenshot_ref,
+    rehydrate_screenshots,
+)
+from tests.fakes import FakeAsyncScrapybara, ScriptedModel, computer_call
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+
+@pytest.fixture(params=["memory", "file", "mmap"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryScreenshotStore()
+    if request.param == "file":
+        return LocalFileScreenshotStore(str(tmp_path / "screenshots"))
+    return MmapScreenshotStore(str(tmp_path / "screenshots.bin"))
+
+
+def test_put_and_get(store) -> None:
+    key = store.put(b"first")
+
+    assert store.put(b"first") == key
+    assert store.put(b"second") != key
+    assert store.get(key) == b"first"
+    assert key in store
+    assert store.get("0" * 64) is None
+
+
+@pytest.mark.asyncio
+async def test_async_put_and_get(store) -> None:
+    key = await store.aput(b"first")
+
+    assert await store.aget(key) == b"first"
+    assert await store.aget("0" * 64) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("store_type", [LocalFileScreenshotStore, MmapScreenshotStore])
+async def test_file_stores_read_off_the_event_loop(store_type, tmp_path, monkeypatch) -> None:
+    store = store_type(str(tmp_path / "screenshots"))
+    threads = []
+    get = store.get
+    monkeypatch.setattr(store, "get", lambda key: threads.append(threading.get_ident()) or get(key))
+
+    await store.aget(await store.aput(b"first"))
+
+    assert threads and threading.get_ident() not in threads
+
+
+def test_mmap_store_reloads_index(tmp_path) -> None:
+    path = str(tmp_path / "screenshots.bin")
+    store = MmapScreenshotStore(path)
+    first = store.put(b"first")
+    second = store.put(b"second")
+    store.close()
+    # Simulate a record which was only partially written before a crash.
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 10)
+
+    reopened = MmapScreenshotStore(path)
+    third = reopened.put(b"third")
+
+    assert reopened.get(first) == b"first"
+    assert reopened.get(second) == b"second"
+    assert reopened.get(third) == b"third"
+    assert len(reopened) == 3
+
+
+def test_screenshot_refs() -> None:
+    ref = make_screenshot_ref("abc123", "image/jpeg")
+
+    assert is_screenshot_ref(ref)
+    assert not is_screenshot_ref("data:image/png;base64,AAAA")
+    assert parse_screenshot_ref(ref) == ("image/jpeg", "abc123")
+    with pytest.raises(ValueError):
+        parse_screenshot_ref("screenshot-ref:image/png")
+
+
+@pytest.mark.asyncio
+async def test_rehydrate_screenshots(store) -> None:
+    key = store.put(b"image-bytes")
+    human = HumanMessage(content="hi")
+    tool = ToolMessage(
+        content=[{"type": "input_image", "image_url": make_screenshot_ref(key)}],
+        tool_call_id="call_1",
+    )
+
+    rehydrated = await rehydrate_screenshots([human, tool], store)
+
+    assert rehydrated[0] is human
+    assert rehydrated[1].content[0]["image_url"] == (
+        f"data:image/png;base64,{base64.b64encode(b'image-bytes').decode()}"
+    )
+    assert is_screenshot_ref(tool.content[0]["image_url"])
+
+
+@pytest.mark.asyncio
+async def test_state_holds_references(monkeypatch) -> None:
+    client = FakeAsyncScrapybara(api_key="test-key")
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    model = ScriptedModel(["Done."])
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    store = InMemoryScreenshotStore()
+    config = {"configurable": {"scrapybara_api_key": "test-key", "screenshot_store": store}}
+    instance = await client.start_browser()
+    ai_message = AIMessage(
+        content="",
+        additional_kwargs={"tool_outputs": [computer_call({"type": "screenshot"})]},
+        response_metadata={"id": "resp_0"},
+    )
+
+    update = await take_computer_action(
+        {"messages": [ai_message], "instance_id": instance.id, "stream_url": "https://stream.test"},
+        config,
+    )
+    image_url = update["messages"][0]["content"][0]["image_url"]
+    tool_message = ToolMessage(**update["messages"][0])
+    await call_model({"messages": [ai_message, tool_message]}, config)
+
+    assert is_screenshot_ref(image_url)
+    sent_url = model.calls[0]["messages"][0].content[0]["image_url"]
+    assert sent_url == f"data:image/png;base64,{instance.screenshot_b64()}"
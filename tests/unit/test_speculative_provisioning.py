@@ -0,0 +1,89 @@
+import asyncio
+import importlib
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from langgraph_cua import create_cua
+from tests.fakes import FakeAsyncScrapybara, ScriptedModel
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+
+@pytest.fixture
+def client(monkeypatch) -> FakeAsyncScrapybara:
+    client = FakeAsyncScrapybara(api_key="test-key", latency=0.1)
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    return client
+
+
+@pytest.mark.asyncio
+async def test_instance_boots_during_first_model_call(monkeypatch, client) -> None:
+    model = ScriptedModel(
+        [[{"type": "click", "button": "left", "x": 1, "y": 1}], "Done."], latency=0.3
+    )
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    graph = create_cua(scrapybara_api_key="test-key", speculative_provisioning=True)
+    responses = []
+    boots = []
+    ainvoke = model.ainvoke
+    start_browser = client.start_browser
+
+    async def record_response(*args, **kwargs):
+        response = await ainvoke(*args, **kwargs)
+        responses.append(response)
+        return response
+
+    async def record_boot(**kwargs):
+        boots.append(len(responses))
+        return await start_browser(**kwargs)
+
+    monkeypatch.setattr(model, "ainvoke", record_response)
+    monkeypatch.setattr(client, "start_browser", record_boot)
+
+    result = await graph.ainvoke({"messages": [HumanMessage(content="Click.")]})
+
+    assert list(client.instances) == [result["instance_id"]]
+    assert result["stream_url"] == f"https://stream.test/{result['instance_id']}"
+    assert [call["action"] for call in client.instances["browser-0"].calls] == ["click_mouse"]
+    # The boot started before the first model call had returned.
+    assert boots == [0]
+
+
+@pytest.mark.asyncio
+async def test_instance_is_stopped_when_model_ends(monkeypatch, client) -> None:
+    model = ScriptedModel(["Nothing to do."])
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    graph = create_cua(scrapybara_api_key="test-key", speculative_provisioning=True)
+
+    result = await graph.ainvoke({"messages": [HumanMessage(content="Hi.")]})
+    await asyncio.gather(*call_model_module._background_tasks)
+
+    assert result.get("instance_id") is None
+    assert [instance.status for instance in client.instances.values()] == ["terminated"]
+
+
+@pytest.mark.asyncio
+async def test_failed_provisioning_keeps_model_response(monkeypatch, client) -> None:
+    model = ScriptedModel([[{"type": "click", "button": "left", "x": 1, "y": 1}], "Done."])
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    start_browser = client.start_browser
+    attempts = []
+
+    async def flaky_start_browser(**kwargs):
+        attempts.append(kwargs)
+        if len(attempts) == 1:
+            raise RuntimeError("Boot failed.")
+        return await start_browser(**kwargs)
+
+    monkeypatch.setattr(client, "start_browser", flaky_start_browser)
+    graph = create_cua(scrapybara_api_key="test-key", speculative_provisioning=True)
+
+    result = await graph.ainvoke({"messages": [HumanMessage(content="Click.")]})
+
+    # The first response is kept, and create_vm_instance starts the instance instead.
+    assert len(model.calls) == 2
+    assert len(attempts) == 2
+    assert [call["action"] for call in client.instances[result["instance_id"]].calls] == [
+        "click_mouse"
+    ]
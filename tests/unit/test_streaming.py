@@ -0,0 +1,91 @@
+import importlib
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from langgraph_cua import create_cua
+from tests.fakes import FakeAsyncScrapybara, ScriptedModel
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+SCRIPT = [
+    [{"type": "click", "button": "left", "x": 1, "y": 1}],
+    [{"type": "type", "text": "hello"}, {"type": "keypress", "keys": ["enter"]}],
+    "All done.",
+]
+
+
+async def run(monkeypatch, client: FakeAsyncScrapybara, model_streaming: str, model: ScriptedModel):
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    graph = create_cua(scrapybara_api_key="test-key", model_streaming=model_streaming)
+
+    custom, result = [], None
+    async for mode, chunk in graph.astream(
+        {"messages": [HumanMessage(content="Say hello.")]}, stream_mode=["custom", "values"]
+    ):
+        if mode == "custom":
+            custom.append(chunk)
+        else:
+            result = chunk
+    return client.instances[result["instance_id"]], result, custom
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("model_streaming", ["stream", "dispatch"])
+async def test_streamed_run_matches_invoked_run(monkeypatch, model_streaming) -> None:
+    client = FakeAsyncScrapybara(api_key="test-key")
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    instance, invoked, _ = await run(monkeypatch, client, "off", ScriptedModel(SCRIPT))
+    streamed_instance, streamed, custom = await run(
+        monkeypatch, client, model_streaming, ScriptedModel(SCRIPT)
+    )
+
+    assert [call["action"] for call in streamed_instance.calls] == [
+        call["action"] for call in instance.calls
+    ]
+    assert [m.content for m in streamed["messages"]] == [m.content for m in invoked["messages"]]
+    assert [m.additional_kwargs for m in streamed["messages"]] == [
+        m.additional_kwargs for m in invoked["messages"]
+    ]
+    assert streamed["messages"][-1].response_metadata["id"] == "resp_2"
+
+    chunks = [event["model_output"] for event in custom if "model_output" in event]
+    assert "".join(chunk.content for chunk in chunks if chunk.content) == "All done."
+
+
+class ObservedModel(ScriptedModel):
+    """Records the instance's actions at the moment each response finishes streaming."""
+
+    def __init__(self, script, tail_latency: float, client: FakeAsyncScrapybara):
+        super().__init__(script, tail_latency=tail_latency)
+        self.client = client
+        self.actions_at_end = []
+
+    async def astream(self, messages, **kwargs):
+        async for chunk in super().astream(messages, **kwargs):
+            if chunk.response_metadata.get("id"):
+                self.actions_at_end.append(
+                    [call["action"] for i in self.client.instances.values() for call in i.calls]
+                )
+            yield chunk
+
+
+@pytest.mark.asyncio
+async def test_dispatch_starts_the_action_before_the_response_ends(monkeypatch) -> None:
+    client = FakeAsyncScrapybara(api_key="test-key")
+    model = ObservedModel(SCRIPT, tail_latency=0.05, client=client)
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    graph = create_cua(scrapybara_api_key="test-key", model_streaming="dispatch")
+
+    result = await graph.ainvoke({"messages": [HumanMessage(content="Say hello.")]})
+
+    # The first turn has no instance to act on yet. On the second, the first computer call
+    # is executed while the response is still streaming, and isn't executed again.
+    assert model.actions_at_end[0] == []
+    assert model.actions_at_end[1] == ["click_mouse", "type_text"]
+    instance = client.instances[result["instance_id"]]
+    assert [call["action"] for call in instance.calls] == ["click_mouse", "type_text", "press_key"]
+    assert [call["screenshot"] for call in instance.calls] == [True, True, True]
+    tool_messages = [m for m in result["messages"] if m.type == "tool"]
+    assert [m.tool_call_id for m in tool_messages] == ["call_0_0", "call_1_0", "call_1_1"]
@@ -0,0 +1,79 @@
+import importlib
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from langgraph_cua import create_cua
+from langgraph_cua.telemetry import LatencyHistogram, span
+from tests.fakes import FakeAsyncScrapybara, ScriptedModel
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+
+def test_span_outside_graph_records_attributes() -> None:
+    with span("test", {"a": 1}, emit=True) as attributes:
+        attributes["b"] = 2
+
+    assert attributes == {"a": 1, "b": 2}
+
+
+def test_span_records_errors() -> None:
+    with pytest.raises(ValueError):
+        with span("test") as attributes:
+            raise ValueError("boom")
+
+    assert attributes["error"] == "ValueError"
+
+
+def test_latency_histogram_summary() -> None:
+    histogram = LatencyHistogram()
+    for duration in [5, 20, 30, 200, 20000]:
+        histogram.record({"span": {"name": "step", "duration_ms": duration, "attributes": {}}})
+    histogram.record({"stream_url": "https://stream.test"})
+
+    summary = histogram.summary()["step"]
+    assert summary["count"] == 5
+    assert summary["p50_ms"] == 30
+    assert summary["max_ms"] == 20000
+    assert summary["buckets"] == [1, 1, 1, 0, 1, 0, 0, 0, 0, 0, 1]
+
+
+@pytest.mark.asyncio
+async def test_graph_emits_spans(monkeypatch) -> None:
+    client = FakeAsyncScrapybara(api_key="test-key")
+    monkeypatch.setattr("langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: client)
+    model = ScriptedModel(
+        [
+            [
+                {"type": "click", "button": "left", "x": 1, "y": 1},
+                {"type": "type", "text": "hello"},
+            ],
+            "Done.",
+        ]
+    )
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+    graph = create_cua(scrapybara_api_key="test-key", emit_timings=True)
+
+    histogram = LatencyHistogram()
+    spans = []
+    async for chunk in graph.astream(
+        {"messages": [HumanMessage(content="Type hello.")]}, stream_mode="custom"
+    ):
+        histogram.record(chunk)
+        if "span" in chunk:
+            spans.append(chunk["span"])
+
+    assert [s["name"] for s in spans] == [
+        "call_model.build_request",
+        "call_model.request",
+        "create_vm_instance.boot",
+        "create_vm_instance.stream_url",
+        "action.click",
+        "action.type",
+        "screenshot.process",
+        "call_model.build_request",
+        "call_model.request",
+    ]
+    assert spans[5]["attributes"] == {"screenshot": True}
+    assert spans[6]["attributes"]["image_bytes"] > 0
+    assert histogram.summary()["call_model.request"]["count"] == 2
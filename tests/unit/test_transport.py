@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from langgraph_cua.nodes.call_model import get_model_with_tools
+from langgraph_cua.transport import HTTPTransport
+from langgraph_cua.utils import get_scrapybara_client
+
+RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok"
+
+
+@pytest_asyncio.fixture
+async def server_url():
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Answer every request on the connection until the client closes it.
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                await asyncio.sleep(0.01)
+                writer.write(RESPONSE)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    yield f"http://{host}:{port}"
+    server.close()
+
+
+@pytest.mark.enable_socket
+@pytest.mark.asyncio
+async def test_connections_are_reused(server_url) -> None:
+    transport = HTTPTransport()
+    client = transport.get_client()
+    assert transport.get_client() is client
+
+    for _ in range(5):
+        response = await client.get(server_url)
+        assert response.text == "ok"
+
+    stats = transport.stats()
+    assert stats["requests"] == 5
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 4
+    assert stats["reuse_ratio"] == 0.8
+    assert stats["open_connections"] == 1
+    assert stats["idle_connections"] == 1
+    await transport.aclose()
+
+
+@pytest.mark.enable_socket
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_pooled(server_url) -> None:
+    transport = HTTPTransport(http2=False, max_connections=2)
+    client = transport.get_client()
+
+    await asyncio.gather(*(client.get(server_url) for _ in range(6)))
+
+    stats = transport.stats()
+    assert stats["peak_in_flight"] == 6
+    assert stats["connections_opened"] == 2
+    assert stats["in_flight"] == 0
+    await transport.aclose()
+
+
+@pytest.mark.asyncio
+async def test_clients_share_the_transport(monkeypatch) -> None:
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    transport = HTTPTransport()
+    created = []
+    monkeypatch.setattr(
+        "langgraph_cua.utils.AsyncScrapybara", lambda **kwargs: created.append(kwargs) or kwargs
+    )
+
+    get_scrapybara_client("transport-key", transport)
+    get_scrapybara_client("transport-key", transport)
+    model = get_model_with_tools("web", 1024, 768, "auto", transport.get_client())
+
+    assert len(created) == 1
+    assert created[0]["httpx_client"] is transport.get_client()
+    assert model.bound.http_async_client is transport.get_client()
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+from langgraph_cua.utils import InstanceCache, get_scrapybara_client
+
+
+class _Handle:
+    def __init__(self, id: str):
+        self.id = id
+
+
+def test_instance_cache_evicts_least_recently_used() -> None:
+    cache = InstanceCache(maxsize=2)
+    cache.set("a", _Handle("a"))
+    cache.set("b", _Handle("b"))
+    cache.get("a")
+    cache.set("c", _Handle("c"))
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_instance_cache_expires_entries(monkeypatch) -> None:
+    cache = InstanceCache(ttl_seconds=10)
+    cache.set("a", _Handle("a"))
+    now = time.monotonic()
+    monkeypatch.setattr("langgraph_cua.utils.time.monotonic", lambda: now + 11)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_instance_cache_invalidate() -> None:
+    cache = InstanceCache()
+    cache.set("a", _Handle("a"))
+    cache.invalidate("a")
+    cache.invalidate("missing")
+
+    assert cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_scrapybara_clients_are_shared_per_api_key() -> None:
+    assert get_scrapybara_client("key-1") is get_scrapybara_client("key-1")
+    assert get_scrapybara_client("key-1") is not get_scrapybara_client("key-2")
+
+
+def test_scrapybara_client_requires_api_key() -> None:
+    with pytest.raises(ValueError):
+        get_scrapybara_client("")
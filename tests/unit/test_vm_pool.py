@@ -0,0 +1,194 @@
+import asyncio
+import importlib
+
+import pytest
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from langgraph_cua import create_cua
+from langgraph_cua.graph import workflow
+from langgraph_cua.vm_pool import VMPool
+from tests.fakes import FakeAsyncScrapybara, ScriptedModel
+
+call_model_module = importlib.import_module("langgraph_cua.nodes.call_model")
+
+
+async def _settle(pool: VMPool) -> None:
+    while pool._tasks:
+        await asyncio.gather(*pool._tasks)
+
+
+@pytest.mark.asyncio
+async def test_start_fills_pool() -> None:
+    client = FakeAsyncScrapybara()
+    pool = VMPool(client, size={"web": 2, "ubuntu": 1})
+
+    await pool.start()
+
+    assert pool.stats()["warm"] == 3
+    assert sorted(client.instances) == ["browser-0", "browser-1", "ubuntu-2"]
+    await pool.close()
+    assert all(instance.status == "terminated" for instance in client.instances.values())
+
+
+@pytest.mark.asyncio
+async def test_lease_uses_warm_instance_and_refills() -> None:
+    client = FakeAsyncScrapybara()
+    async with VMPool(client, size=1) as pool:
+        instance = await pool.lease("web")
+
+        assert instance.id == "browser-0"
+        assert len(client.instances) == 1
+        await _settle(pool)
+        assert pool.stats()["warm"] == 1
+        assert pool.stats()["leased"] == 1
+        assert pool.stats()["warm_leases"] == 1
+
+
+@pytest.mark.asyncio
+async def test_lease_cold_starts_when_empty() -> None:
+    client = FakeAsyncScrapybara()
+    pool = VMPool(client, size={"web": 0})
+
+    instance = await pool.lease("web")
+
+    assert instance.id == "browser-0"
+    assert pool.stats()["cold_starts"] == 1
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_release_recycles_instance() -> None:
+    client = FakeAsyncScrapybara()
+    async with VMPool(client, size=1) as pool:
+        instance = await pool.lease("web")
+        await _settle(pool)
+        await pool.release(instance.id)
+        await _settle(pool)
+
+        assert instance.status == "terminated"
+        assert pool.stats()["leased"] == 0
+        assert pool.stats()["warm"] == 1
+
+
+@pytest.mark.asyncio
+async def test_release_returns_instance_without_recycling() -> None:
+    client = FakeAsyncScrapybara()
+    async with VMPool(client, size={"web": 0}, recycle=False) as pool:
+        pool.sizes["web"] = 1
+        instance = await pool.lease("web")
+        await pool.release(instance.id)
+
+        assert instance.status == "running"
+        assert (await pool.lease("web")) is instance
+
+
+@pytest.mark.asyncio
+async def test_reap_replaces_idle_instances() -> None:
+    client = FakeAsyncScrapybara()
+    async with VMPool(client, size=1, max_idle_seconds=0) as pool:
+        idle = client.instances["browser-0"]
+
+        assert await pool.reap() == 1
+        assert idle.status == "terminated"
+        assert pool.stats()["warm"] == 1
+        assert pool.stats()["reaped"] == 1
+
+
+def _age(pool: VMPool, instance, seconds: float) -> None:
+    pool._started[instance.id] -= seconds
+
+
+@pytest.mark.asyncio
+async def test_instances_are_replaced_by_age() -> None:
+    client = FakeAsyncScrapybara()
+    async with VMPool(client, size={"web": 0}, recycle=False) as pool:
+        pool.sizes["web"] = 1
+        instance = await pool.lease("web")
+        await pool.release(instance.id)
+        _age(pool, instance, 45 * 60)
+
+        # Returning the instance to the pool doesn't reset its age, so it is reaped with
+        # less than half of its hour left, though it has barely been idle.
+        assert await pool.reap() == 1
+        assert instance.status == "terminated"
+
+        second = await pool.lease("web")
+        _age(pool, second, 45 * 60)
+        await pool.release(second.id)
+        await _settle(pool)
+
+        assert second.status == "terminated"
+        assert pool.stats()["warm"] == 1
+
+
+def test_timeout_hours_must_match_the_pool() -> None:
+    pool = VMPool(FakeAsyncScrapybara(), timeout_hours=2)
+
+    with pytest.raises(ValueError):
+        create_cua(vm_pool=pool)
+    create_cua(vm_pool=pool, timeout_hours=2)
+
+
+@pytest.mark.asyncio
+async def test_graph_leases_and_releases_instance(monkeypatch) -> None:
+    client = FakeAsyncScrapybara()
+    model = ScriptedModel([[{"type": "click", "button": "left", "x": 1, "y": 1}], "Done."])
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+
+    async with VMPool(client, size=1) as pool:
+        graph = create_cua(vm_pool=pool)
+        result = await graph.ainvoke({"messages": [HumanMessage(content="Click.")]})
+        await _settle(pool)
+
+        leased = client.instances["browser-0"]
+        assert [call["action"] for call in leased.calls] == ["click_mouse"]
+        assert leased.status == "terminated"
+        assert result["instance_id"] is None
+        assert pool.stats()["warm"] == 1
+
+
+class FailingModel(ScriptedModel):
+    """Fails on the given turns, like a model provider returning an error."""
+
+    def __init__(self, script, failing_turns):
+        super().__init__(script)
+        self.failing_turns = failing_turns
+
+    async def ainvoke(self, messages, **kwargs):
+        if len(self.calls) in self.failing_turns:
+            self.calls.append({"messages": list(messages), "kwargs": kwargs})
+            raise RuntimeError("model error")
+        return await super().ainvoke(messages, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_failed_run_releases_instance(monkeypatch) -> None:
+    client = FakeAsyncScrapybara()
+    click = [{"type": "click", "button": "left", "x": 1, "y": 1}]
+    model = FailingModel([click, click, click, "Done."], failing_turns={1})
+    monkeypatch.setattr(call_model_module, "get_model_with_tools", lambda *args: model)
+
+    async with VMPool(client, size=1, recycle=False) as pool:
+        configured = create_cua(vm_pool=pool)
+        graph = workflow.compile(checkpointer=InMemorySaver()).with_config(configured.config)
+        config = {"configurable": {"thread_id": "thread-1"}}
+
+        with pytest.raises(RuntimeError):
+            await graph.ainvoke({"messages": [HumanMessage(content="Click.")]}, config)
+        await _settle(pool)
+
+        # The instance may be left part way through the task, so it isn't reused.
+        failed = client.instances["browser-0"]
+        assert failed.status == "terminated"
+        assert pool.stats()["leased"] == 0
+        assert pool.stats()["warm"] == 1
+
+        # The thread still refers to the released instance, so the next run leases another.
+        result = await graph.ainvoke({"messages": [HumanMessage(content="Click again.")]}, config)
+        await _settle(pool)
+
+        assert [call["action"] for call in failed.calls] == ["click_mouse"]
+        assert result["instance_id"] is None
+        assert pool.stats()["leased"] == 0
+        assert pool.stats()["leases"] == 2